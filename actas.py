@@ -0,0 +1,323 @@
+"""
+Este módulo procesa los archivos de actas del PREP.
+
+El archivo indicado en archivoCorte es un zip con un CSV de unas
+57 mil actas. Lo leemos directamente desde el zip, por bloques, sin
+extraerlo a disco ni cargarlo completo en memoria, y lo agregamos
+por casilla, sección, distrito y entidad.
+
+Uso:
+
+    python actas.py 20210802-2130_INE-CONSULTA-POPULAR-2021.zip [--csv-distrito valores.csv]
+"""
+
+import argparse
+import io
+import os
+import zipfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import columnar
+from datos import CARPETA_CACHE, calcular_hash
+
+
+# Si cambiamos la forma de las tablas, subimos este número.
+VERSION_CACHE = 2
+
+# Nombre de las columnas del CSV del INE que usamos. Cada consulta
+# puede sobrescribir las que cambien (por ejemplo las respuestas).
+COLUMNAS = {
+    "casilla": "CLAVE_CASILLA",
+    "entidad": "ID_ENTIDAD",
+    "distrito": "ID_DISTRITO_FEDERAL",
+    "seccion": "SECCION",
+    "ubicacion": "UBICACION_CASILLA",
+    "si": "SI",
+    "no": "NO",
+    "nulo": "NULOS",
+    "total": "TOTAL_OPINIONES",
+    "lista_nominal": "LISTA_NOMINAL",
+}
+
+# Columnas numéricas que se suman al agregar.
+CONTADORES = ["si", "no", "nulo", "total", "lista_nominal"]
+
+# Columnas sin las que no podemos agregar las actas. La casilla, la
+# ubicación (1 urbana, 2 no urbana) y el total son opcionales (el
+# total se calcula si no viene).
+OBLIGATORIAS = ["entidad", "distrito", "seccion", "si", "no", "nulo", "lista_nominal"]
+
+# Columnas que identifican cada nivel, de la más general a la más particular.
+NIVELES = {
+    "entidad": ["entidad"],
+    "distrito": ["entidad", "distrito"],
+    "seccion": ["entidad", "distrito", "seccion"],
+}
+
+# Tamaño de cada bloque de lectura, en actas.
+TAMANO_BLOQUE = 20000
+
+SEPARADOR = "|"
+
+
+def buscar_csv(archivo_zip):
+    """
+    Esta función regresa el nombre del CSV de actas dentro del zip.
+    """
+
+    candidatos = [
+        nombre for nombre in archivo_zip.namelist()
+        if nombre.lower().endswith(".csv")
+    ]
+
+    if not candidatos:
+        raise ValueError("El zip no contiene ningún CSV de actas.")
+
+    # El CSV de actas es el más grande del zip.
+    return max(candidatos, key=lambda nombre: archivo_zip.getinfo(nombre).file_size)
+
+
+def leer_encabezado(texto, columnas):
+    """
+    Esta función avanza el archivo hasta el renglón de encabezados
+    y regresa los nombres de las columnas.
+
+    Los CSV del PREP traen antes un título y un renglón con el resumen
+    del corte, así que buscamos el renglón que contiene la columna
+    de la entidad.
+    """
+
+    for renglon in texto:
+        campos = [campo.strip() for campo in renglon.rstrip("\r\n").split(SEPARADOR)]
+
+        if columnas["entidad"] in campos:
+            return campos
+
+    raise ValueError(f"No se encontró la columna {columnas['entidad']} en el CSV.")
+
+
+def leer_bloques(ruta, columnas=COLUMNAS, tamano=TAMANO_BLOQUE, codificacion="utf-8"):
+    """
+    Esta función regresa el CSV de actas por bloques, con las columnas
+    ya renombradas y convertidas a números.
+
+    El zip se lee como flujo: en ningún momento se tiene en memoria
+    más de un bloque de texto.
+    """
+
+    with zipfile.ZipFile(ruta) as archivo_zip:
+        with archivo_zip.open(buscar_csv(archivo_zip)) as binario:
+
+            texto = io.TextIOWrapper(binario, encoding=codificacion, errors="replace", newline="")
+            encabezado = leer_encabezado(texto, columnas)
+
+            faltantes = [columnas[nombre] for nombre in OBLIGATORIAS if columnas[nombre] not in encabezado]
+
+            if faltantes:
+                raise ValueError(f"Al CSV de actas le faltan las columnas {', '.join(faltantes)}.")
+
+            usar = [columna for columna in columnas.values() if columna in encabezado]
+            nombres = {columna: nombre for nombre, columna in columnas.items()}
+
+            lector = pd.read_csv(
+                texto,
+                sep=SEPARADOR,
+                names=encabezado,
+                usecols=usar,
+                dtype="string",
+                chunksize=tamano,
+                skipinitialspace=True,
+            )
+
+            for bloque in lector:
+                bloque = bloque.rename(columns=nombres)
+
+                # Los valores como "-", "Ilegible" o "Sin dato" cuentan como cero.
+                for nombre in CONTADORES + ["entidad", "distrito", "seccion", "ubicacion"]:
+                    if nombre in bloque:
+                        bloque[nombre] = pd.to_numeric(bloque[nombre], errors="coerce")
+
+                for nombre in CONTADORES:
+                    if nombre in bloque:
+                        bloque[nombre] = bloque[nombre].fillna(0).astype("int64")
+
+                # Si el CSV no trae el total, lo calculamos.
+                if "total" not in bloque:
+                    bloque["total"] = bloque["si"] + bloque["no"] + bloque["nulo"]
+
+                bloque = bloque.dropna(subset=["entidad"])
+
+                for nombre in ["entidad", "distrito", "seccion"]:
+                    if nombre in bloque:
+                        bloque[nombre] = bloque[nombre].fillna(0).astype("int32")
+
+                if "ubicacion" in bloque:
+                    bloque["ubicacion"] = bloque["ubicacion"].fillna(0).astype("int8")
+
+                yield bloque
+
+
+def agregar_actas(ruta, columnas=COLUMNAS, tamano=TAMANO_BLOQUE, codificacion="utf-8",
+                  ruta_casillas=None):
+    """
+    Esta función agrega el CSV de actas por sección, distrito y entidad.
+
+    Cada bloque se reduce a nivel sección antes de juntarlo con los
+    demás, así que la memoria depende del número de secciones y no
+    del tamaño del archivo. Si se indica ruta_casillas y el CSV trae
+    la clave de casilla, cada bloque se escribe ahí en Parquet en
+    cuanto se lee, sin juntar las actas en memoria.
+    """
+
+    secciones = list()
+    escritor = None
+    temporal = f"{ruta_casillas}.{os.getpid()}.tmp"
+
+    try:
+        for bloque in leer_bloques(ruta, columnas, tamano, codificacion):
+
+            if ruta_casillas and "casilla" in bloque:
+                if escritor is None:
+                    tabla = pa.Table.from_pandas(bloque, preserve_index=False)
+
+                    os.makedirs(os.path.dirname(ruta_casillas), exist_ok=True)
+                    escritor = pq.ParquetWriter(temporal, tabla.schema, compression="zstd")
+                else:
+                    # Todos los bloques se guardan con el esquema del primero.
+                    tabla = pa.Table.from_pandas(bloque, schema=escritor.schema, preserve_index=False)
+
+                escritor.write_table(tabla)
+
+            secciones.append(
+                bloque.groupby(NIVELES["seccion"], sort=False)[CONTADORES].sum())
+    except BaseException:
+        if escritor is not None:
+            escritor.close()
+            os.remove(temporal)
+
+        raise
+
+    if escritor is not None:
+        escritor.close()
+        os.replace(temporal, ruta_casillas)
+
+    # Las secciones pueden repartirse entre dos bloques, así que
+    # volvemos a sumar después de juntarlas.
+    seccion = pd.concat(secciones).groupby(level=NIVELES["seccion"]).sum()
+
+    tablas = {
+        "seccion": seccion,
+        "distrito": seccion.groupby(level=NIVELES["distrito"]).sum(),
+        "entidad": seccion.groupby(level=NIVELES["entidad"]).sum(),
+    }
+
+    for nombre in ["seccion", "distrito", "entidad"]:
+        tablas[nombre] = completar_tabla(tablas[nombre].reset_index(), nombre)
+
+    return tablas
+
+
+def completar_tabla(tabla, nivel):
+    """
+    Esta función agrega la clave y la participación a una tabla agregada.
+
+    La clave sigue el formato de la geometría de cada nivel:
+    entidad "09", distrito "0912" y sección "0912-1234".
+    """
+
+    entidad = tabla["entidad"].astype("string").str.zfill(2)
+
+    if nivel == "entidad":
+        clave = entidad
+    elif nivel == "distrito":
+        clave = entidad + tabla["distrito"].astype("string").str.zfill(2)
+    else:
+        clave = (entidad + tabla["distrito"].astype("string").str.zfill(2) + "-" +
+                 tabla["seccion"].astype("string").str.zfill(4))
+
+    tabla.insert(0, "clave", clave)
+
+    lista = tabla["lista_nominal"].where(tabla["lista_nominal"] > 0)
+    tabla["participacion"] = (tabla["total"] / lista * 100).astype("float64")
+
+    return tabla
+
+
+def cargar_actas(ruta, columnas=COLUMNAS, codificacion="utf-8", niveles=None):
+    """
+    Esta función regresa las tablas agregadas de un zip de actas.
+
+    Cada nivel se guarda como Parquet en ./cache/actas-<zip>/ y solo
+    se vuelve a procesar si el zip cambia. Con niveles se pueden
+    leer solo algunas tablas. La de casillas es None si el CSV no
+    trae la clave de casilla.
+    """
+
+    ruta = os.path.abspath(ruta)
+    mtime = os.stat(ruta).st_mtime_ns
+
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    carpeta = os.path.join(CARPETA_CACHE, f"actas-{nombre}")
+    niveles = niveles or ["casilla", "seccion", "distrito", "entidad"]
+
+    metadatos = columnar.leer_metadatos(carpeta)
+
+    if (metadatos is None or metadatos.get("actas") != VERSION_CACHE or
+            metadatos["columnas"] != columnas or
+            (metadatos["mtime"] != mtime and metadatos["hash"] != calcular_hash(ruta))):
+
+        ruta_casillas = os.path.join(carpeta, "casilla.parquet")
+
+        # Si el zip nuevo no trae casillas no debe quedar la tabla del anterior.
+        if os.path.exists(ruta_casillas):
+            os.remove(ruta_casillas)
+
+        tablas = agregar_actas(ruta, columnas, codificacion=codificacion, ruta_casillas=ruta_casillas)
+
+        for nivel, tabla in tablas.items():
+            columnar.escribir_tabla(tabla, os.path.join(carpeta, f"{nivel}.parquet"))
+
+        columnar.escribir_metadatos(carpeta, {
+            "actas": VERSION_CACHE,
+            "columnas": columnas,
+            "mtime": mtime,
+            "hash": calcular_hash(ruta),
+        })
+
+    tablas = dict()
+
+    for nivel in niveles:
+        archivo = os.path.join(carpeta, f"{nivel}.parquet")
+        tablas[nivel] = columnar.leer_tabla(archivo) if os.path.exists(archivo) else None
+
+    return tablas
+
+
+def exportar_valores(tablas, nivel, ruta):
+    """
+    Esta función guarda la clave y la participación de un nivel en
+    el CSV que usa el mapa (ver "valores_<nivel>" en consulta.py).
+    """
+
+    tablas[nivel][["clave", "participacion"]].to_csv(ruta, index=False)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Agrega un zip de actas del PREP.")
+    parser.add_argument("zip")
+    parser.add_argument("--csv-distrito", default=None)
+    parser.add_argument("--codificacion", default="utf-8")
+    argumentos = parser.parse_args()
+
+    tablas = cargar_actas(argumentos.zip, codificacion=argumentos.codificacion)
+
+    for nivel in ["entidad", "distrito", "seccion", "casilla"]:
+        if tablas[nivel] is not None:
+            print(f"{nivel}: {len(tablas[nivel]):,} renglones")
+
+    if argumentos.csv_distrito:
+        exportar_valores(tablas, "distrito", argumentos.csv_distrito)
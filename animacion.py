@@ -0,0 +1,395 @@
+"""
+Este módulo anima el conteo de una consulta corte por corte.
+
+A partir del historial de cortes (ver historial.py) mostramos cómo
+fueron cambiando la participación por entidad y la distribución de
+las respuestas durante la noche. Las figuras base se construyen una
+sola vez con build_map y build_bars; cada cuadro solo cambia los
+arreglos z o x y el texto con la hora del corte, sin volver a crear
+ni validar la figura.
+
+Cada cuadro tiene la misma forma que un frame de plotly, así que los
+mismos cuadros sirven para las imágenes PNG, el GIF y el HTML.
+
+Uso:
+
+    python animacion.py cortes/2022/historial.npz --consulta 2022 [--gif] [--html] [--procesos 4]
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+from PIL import Image
+
+import renderizador
+from consulta import CONSULTAS, build_bars, build_map, calcular_marcas
+from datos import cargar_consulta, crear_claves
+from historial import CONTADORES, cargar_historial, construir_historial, estados
+
+
+# Carpeta donde guardamos los cuadros de cada consulta.
+CARPETA_ANIMACION = "./salidas"
+
+# Respuestas en el orden de las barras.
+RESPUESTAS = ["si", "no", "nulo"]
+
+
+def calcular_valores(historial):
+    """
+    Esta función calcula de una sola vez los valores de todos los cortes.
+
+    Regresa arreglos con un renglón por corte: la participación y la
+    proporción de cada respuesta por entidad, y la participación y
+    los votos a nivel nacional.
+    """
+
+    contadores = list(historial["contadores"])
+    escalas = np.array([CONTADORES[contador] for contador in contadores])
+
+    todos = estados(historial) / escalas
+
+    nodos = historial["nodos"]
+    entidades = (nodos >= 1) & (nodos <= 32)
+    nacional = np.flatnonzero(nodos == 100)[0]
+
+    def columna(contador):
+        return todos[:, :, contadores.index(contador)]
+
+    total = columna("total_votos")
+
+    valores = {
+        "momentos": pd.DatetimeIndex(historial["momentos"]),
+        "claves": pd.Index(crear_claves(nodos[entidades])),
+        "participacion": columna("participacion")[:, entidades],
+        "participacion_nacional": columna("participacion")[:, nacional],
+        "total_nacional": total[:, nacional],
+    }
+
+    # Las proporciones son contra el total de votos, como las publica el INE.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for respuesta in RESPUESTAS:
+            proporcion = np.where(total > 0, columna(respuesta) / total * 100, 0)
+            valores[respuesta] = np.round(proporcion[:, entidades], 2)
+
+    return valores
+
+
+def formatear_momento(momento):
+    """
+    Esta función regresa la fecha y hora de un corte como texto.
+    """
+
+    return f"{momento:%d/%m/%Y %H:%M}"
+
+
+def buscar_indice(claves, orden):
+    """
+    Esta función regresa la posición de cada clave de orden dentro
+    de claves y falla si alguna no existe.
+    """
+
+    indices = claves.get_indexer(orden)
+
+    if (indices < 0).any():
+        faltantes = ", ".join(str(clave) for clave in np.asarray(orden)[indices < 0])
+        raise ValueError(f"El historial no tiene las claves: {faltantes}")
+
+    return indices
+
+
+def preparar_mapa(config, valores):
+    """
+    Esta función construye el mapa base (como diccionario) y lo regresa
+    junto con el orden de las entidades en el trazo.
+
+    La barra de color se ajusta para cubrir todos los cortes, así la
+    escala no cambia durante la animación.
+    """
+
+    base = build_map(config)
+    traza = base["data"][0]
+
+    if traza["type"] != "choropleth":
+        raise ValueError("La animación solo está disponible para el mapa por entidad.")
+
+    marcas, zmin, zmax, decimales = calcular_marcas(valores["participacion"])
+
+    colorbar = dict(
+        traza["colorbar"],
+        tickvals=marcas,
+        ticktext=[f"{marca:,.{decimales}f}%" for marca in marcas]
+    )
+
+    base["data"][0] = dict(traza, zmin=zmin, zmax=zmax, colorbar=colorbar)
+
+    return base, buscar_indice(valores["claves"], traza["locations"])
+
+
+def preparar_barras(config, valores):
+    """
+    Esta función construye la gráfica de barras base y la regresa
+    como diccionario, junto con el orden de las entidades en las barras.
+    """
+
+    base = build_bars(config)
+
+    # Las barras usan el nombre de la entidad; lo traducimos a su clave.
+    claves = cargar_consulta(config["archivo"])["entidades"]["clave"]
+    orden = claves.loc[list(base["data"][0]["y"])].to_numpy()
+
+    return base, buscar_indice(valores["claves"], orden)
+
+
+def cuadros_mapa(base, indices, valores):
+    """
+    Esta función genera un cuadro por corte con la participación de
+    cada entidad y el subtítulo con el total nacional.
+    """
+
+    anotaciones = base["layout"]["annotations"]
+    subtitulo = next(
+        i for i, anotacion in enumerate(anotaciones) if anotacion["text"].startswith("Nacional"))
+
+    for i, momento in enumerate(valores["momentos"]):
+        texto = (
+            f"Corte {formatear_momento(momento)} · "
+            f"Nacional: {valores['participacion_nacional'][i]:,.2f}% "
+            f"({valores['total_nacional'][i]:,.0f} votos)"
+        )
+
+        nuevas = list(anotaciones)
+        nuevas[subtitulo] = dict(anotaciones[subtitulo], text=texto)
+
+        yield {
+            "name": formatear_momento(momento),
+            "data": [{"z": valores["participacion"][i, indices]}],
+            "traces": [0],
+            "layout": {"annotations": nuevas},
+        }
+
+
+def cuadros_barras(base, indices, valores):
+    """
+    Esta función genera un cuadro por corte con la proporción de cada
+    respuesta por entidad y la hora del corte junto a la fuente.
+    """
+
+    anotaciones = base["layout"]["annotations"]
+
+    for i, momento in enumerate(valores["momentos"]):
+        datos = list()
+
+        for respuesta in RESPUESTAS:
+            proporcion = valores[respuesta][i, indices]
+            datos.append({"x": proporcion, "text": proporcion})
+
+        nuevas = list(anotaciones)
+        nuevas[0] = dict(anotaciones[0], text=f"{anotaciones[0]['text']} · corte {formatear_momento(momento)}")
+
+        yield {
+            "name": formatear_momento(momento),
+            "data": datos,
+            "traces": list(range(len(RESPUESTAS))),
+            "layout": {"annotations": nuevas},
+        }
+
+
+def aplicar_cuadro(base, cuadro):
+    """
+    Esta función regresa la figura completa de un cuadro.
+
+    Solo se copian las listas y diccionarios que cambian; lo demás
+    (por ejemplo el GeoJSON) se comparte con la figura base.
+    """
+
+    data = list(base["data"])
+
+    for indice, cambios in zip(cuadro["traces"], cuadro["data"]):
+        data[indice] = dict(data[indice], **cambios)
+
+    return dict(base, data=data, layout=dict(base["layout"], **cuadro["layout"]))
+
+
+def guardar_cuadros(base, cuadros, carpeta, prefijo, procesos=1):
+    """
+    Esta función renderiza los cuadros como PNG numerados y regresa
+    sus rutas.
+
+    Las figuras se generan conforme se van necesitando, así que la
+    memoria no crece con el número de cortes.
+    """
+
+    os.makedirs(carpeta, exist_ok=True)
+
+    rutas = list()
+
+    def trabajos():
+        for numero, cuadro in enumerate(cuadros):
+            ruta = os.path.join(carpeta, f"{prefijo}_{numero:04d}.png")
+            rutas.append(ruta)
+            yield ruta, aplicar_cuadro(base, cuadro)
+
+    renderizador.guardar_lote(trabajos(), tamano_lote=max(8, 4 * procesos), pestanas=procesos)
+
+    return rutas
+
+
+def armar_gif(rutas, ruta, duracion=150, pausa_final=2000, escala=1.0):
+    """
+    Esta función junta los cuadros en un GIF.
+
+    Todas las gráficas usan los mismos colores, así que calculamos la
+    paleta una sola vez con el último cuadro y los demás solo se
+    traducen a ella conforme se abren. Con escala < 1 también se
+    reduce su tamaño.
+    """
+
+    def abrir(ruta_cuadro):
+        with Image.open(ruta_cuadro) as imagen:
+            imagen = imagen.convert("RGB")
+
+        if escala != 1.0:
+            imagen = imagen.resize(
+                (round(imagen.width * escala), round(imagen.height * escala)), Image.LANCZOS)
+
+        return imagen
+
+    paleta = abrir(rutas[-1]).quantize(colors=256)
+
+    def cuadros():
+        for ruta_cuadro in rutas:
+            yield abrir(ruta_cuadro).quantize(palette=paleta, dither=Image.Dither.NONE)
+
+    todos = cuadros()
+    primero = next(todos)
+
+    duraciones = [duracion] * (len(rutas) - 1) + [pausa_final]
+
+    primero.save(
+        ruta,
+        save_all=True,
+        append_images=todos,
+        duration=duraciones,
+        loop=0,
+        optimize=True
+    )
+
+
+def exportar_html(base, cuadros, ruta, duracion=150):
+    """
+    Esta función guarda una animación interactiva de plotly.
+
+    La figura base (con su GeoJSON) se escribe una sola vez y cada
+    frame solo trae los arreglos que cambian.
+    """
+
+    frames = list(cuadros)
+
+    pasos = [
+        {
+            "label": frame["name"],
+            "method": "animate",
+            "args": [[frame["name"]], {"mode": "immediate", "frame": {"duration": 0, "redraw": True}}],
+        }
+        for frame in frames
+    ]
+
+    animar = {"frame": {"duration": duracion, "redraw": True}, "fromcurrent": True}
+
+    layout = dict(
+        base["layout"],
+        sliders=[{"active": len(pasos) - 1, "steps": pasos, "y": 0, "len": 0.9, "x": 0.1}],
+        updatemenus=[{
+            "type": "buttons",
+            "x": 0.1,
+            "y": 0,
+            "xanchor": "right",
+            "yanchor": "top",
+            "buttons": [
+                {"label": "▶", "method": "animate", "args": [None, animar]},
+                {"label": "❚❚", "method": "animate", "args": [[None], {"mode": "immediate"}]},
+            ],
+        }],
+    )
+
+    pio.write_html(
+        dict(base, layout=layout, frames=frames),
+        ruta,
+        validate=False,
+        include_plotlyjs="cdn",
+        auto_play=False
+    )
+
+
+def animar(config, historial, carpeta, graficas=("mapa", "barras"), procesos=1, gif=False,
+           html=False):
+    """
+    Esta función genera la animación de las gráficas indicadas y
+    regresa las rutas de los archivos creados.
+    """
+
+    valores = calcular_valores(historial)
+
+    preparar = {"mapa": preparar_mapa, "barras": preparar_barras}
+    generar_cuadros = {"mapa": cuadros_mapa, "barras": cuadros_barras}
+
+    archivos = dict()
+
+    with renderizador.sesion():
+        for grafica in graficas:
+            base, indices = preparar[grafica](config, valores)
+            prefijo = f"{config['anio']}-{grafica}"
+
+            rutas = guardar_cuadros(
+                base, generar_cuadros[grafica](base, indices, valores),
+                os.path.join(carpeta, prefijo), prefijo, procesos)
+
+            archivos[grafica] = rutas
+
+            if gif:
+                ruta_gif = os.path.join(carpeta, f"{prefijo}.gif")
+                armar_gif(rutas, ruta_gif)
+                archivos[f"{grafica}_gif"] = ruta_gif
+
+            if html:
+                ruta_html = os.path.join(carpeta, f"{prefijo}.html")
+                exportar_html(base, generar_cuadros[grafica](base, indices, valores), ruta_html)
+                archivos[f"{grafica}_html"] = ruta_html
+
+    return archivos
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Anima el conteo de una consulta corte por corte.")
+    parser.add_argument("archivos", nargs="+", help="Un historial .npz o varios JSON de cortes.")
+    parser.add_argument("--consulta", required=True, choices=list(CONSULTAS))
+    parser.add_argument("--archivo", default=None, help="JSON para las figuras base.")
+    parser.add_argument("--carpeta", default=CARPETA_ANIMACION)
+    parser.add_argument("--graficas", nargs="+", default=["mapa", "barras"], choices=["mapa", "barras"])
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--gif", action="store_true")
+    parser.add_argument("--html", action="store_true")
+    argumentos = parser.parse_args()
+
+    if len(argumentos.archivos) == 1 and argumentos.archivos[0].endswith(".npz"):
+        cortes = cargar_historial(argumentos.archivos[0])
+    else:
+        cortes = construir_historial(
+            [ruta for ruta in argumentos.archivos if os.path.basename(ruta) != "actual.json"])
+
+    config = dict(CONSULTAS[argumentos.consulta])
+
+    if argumentos.archivo:
+        config["archivo"] = argumentos.archivo
+
+    archivos = animar(config, cortes, argumentos.carpeta, argumentos.graficas,
+                      argumentos.procesos, argumentos.gif, argumentos.html)
+
+    for grafica, rutas in archivos.items():
+        print(f"{grafica}: {len(rutas) if isinstance(rutas, list) else rutas}")
+
+    print(renderizador.reporte())
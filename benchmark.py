@@ -0,0 +1,625 @@
+"""
+Este módulo mide cuánto tarda cada etapa de la generación de gráficas.
+
+Medimos por separado la importación de las bibliotecas, la lectura
+del JSON, la normalización, la construcción del DataFrame y de las
+figuras, la serialización (donde plotly convierte el GeoJSON), el
+renderizado con kaleido y con PIL, y la codificación del PNG en
+combine_images. Si kaleido funciona, también se comparan el mapa y
+la tabla dibujados con PIL contra los de kaleido.
+
+Además de las dos consultas del repositorio generamos datos
+sintéticos más grandes: consultas con más entidades y mapas con
+más polígonos. Los datos sintéticos usan una semilla fija, así que
+cada ejecución mide exactamente lo mismo.
+
+Los resultados se guardan como JSON en ./benchmarks/ para poder
+compararlos entre commits.
+
+Uso:
+
+    python benchmark.py [--repeticiones 5] [--sin-render] [--comparar benchmarks/anterior.json]
+"""
+
+import argparse
+import copy
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from importlib.metadata import PackageNotFoundError, version
+from io import BytesIO
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+from PIL import Image
+
+import columnar
+import datos
+import geometria
+import renderizador
+from consulta import CONSULTAS, build_bars, build_map, build_table, combine_images
+from rasterizador import comparar_imagenes, pintar_choropleth, renderizar_mapa
+from tablas import renderizar_tabla
+
+
+# Si cambiamos la forma del JSON de resultados, subimos este número.
+VERSION_RESULTADOS = 1
+
+CARPETA_BENCHMARKS = "./benchmarks"
+
+# Bibliotecas cuya importación medimos, cada una en un intérprete nuevo.
+IMPORTACIONES = ["numpy", "pandas", "pyarrow", "plotly.graph_objects", "plotly.subplots", "PIL.Image"]
+
+# Cuántas veces se repite cada consulta sintética y cuántos
+# polígonos tienen los mapas sintéticos.
+FACTORES_ENTIDADES = [10, 100]
+POLIGONOS = [500, 5000]
+
+# Comandos de cli.py que no renderizan y el tiempo máximo que
+# esperamos de cada uno, contando el arranque de Python.
+COMANDOS_CLI = [["list"], ["validate"], ["--help"]]
+OBJETIVO_CLI = 0.3
+
+# Una etapa se considera más lenta si su mediana crece más que esto.
+UMBRAL_REGRESION = 1.2
+
+SEMILLA = 2021
+
+
+def medir(funcion, repeticiones):
+    """
+    Esta función ejecuta la función varias veces y regresa su último
+    resultado junto con el tiempo mínimo, la mediana y el promedio.
+    """
+
+    tiempos = list()
+    resultado = None
+
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+
+    return resultado, {
+        "repeticiones": repeticiones,
+        "minimo": min(tiempos),
+        "mediana": statistics.median(tiempos),
+        "promedio": statistics.fmean(tiempos),
+    }
+
+
+def medir_importaciones(repeticiones):
+    """
+    Esta función mide cuánto tarda en importarse cada biblioteca.
+
+    Cada medición se hace en un intérprete nuevo para que ninguna
+    biblioteca ya esté cargada.
+    """
+
+    resultados = dict()
+
+    for modulo in IMPORTACIONES:
+        codigo = f"import time; inicio = time.perf_counter(); import {modulo}; print(time.perf_counter() - inicio)"
+
+        def importar():
+            salida = subprocess.run(
+                [sys.executable, "-c", codigo], capture_output=True, text=True, check=True)
+            return float(salida.stdout)
+
+        tiempos = [importar() for _ in range(repeticiones)]
+
+        resultados[f"importar {modulo}"] = {
+            "repeticiones": repeticiones,
+            "minimo": min(tiempos),
+            "mediana": statistics.median(tiempos),
+            "promedio": statistics.fmean(tiempos),
+        }
+
+    return resultados
+
+
+def caso_cli(repeticiones):
+    """
+    Esta función mide cuánto tarda cada comando de cli.py que no
+    renderiza, desde que se lanza el proceso hasta que termina.
+    """
+
+    resultados = dict()
+
+    for comando in COMANDOS_CLI:
+
+        def ejecutar_comando():
+            subprocess.run(
+                [sys.executable, "cli.py"] + comando, capture_output=True, check=True)
+
+        _, medicion = medir(ejecutar_comando, repeticiones)
+        medicion["objetivo"] = OBJETIVO_CLI
+        medicion["cumple"] = medicion["mediana"] <= OBJETIVO_CLI
+
+        resultados[f"cli {' '.join(comando)}"] = medicion
+
+    return resultados
+
+
+def medir_renderizado(resultados, figuras, repeticiones):
+    """
+    Esta función mide el inicio de kaleido y el renderizado de cada
+    figura. Si Chromium no está disponible anota el error y regresa None.
+    """
+
+    try:
+        _, resultados["iniciar kaleido"] = medir(renderizador.iniciar, 1)
+
+        imagenes = dict()
+
+        for nombre, figura in figuras.items():
+            imagenes[nombre], resultados[f"rasterizar {nombre}"] = medir(
+                lambda: renderizador.renderizar({nombre: figura})[nombre], repeticiones)
+
+        return imagenes
+    except Exception as error:
+        resultados["rasterizar"] = {"error": f"{type(error).__name__}: {error}"}
+        return None
+
+
+def imagen_vacia(figura):
+    """
+    Esta función regresa un PNG del tamaño de la figura, para medir
+    combine_images cuando no se pudo renderizar.
+    """
+
+    buffer = BytesIO()
+    Image.new("RGB", (figura["layout"]["width"], figura["layout"]["height"]), "#334756").save(buffer, "PNG")
+
+    return buffer.getvalue()
+
+
+def medir_figuras(resultados, config, repeticiones, renderizar, graficas=("mapa", "tabla", "barras")):
+    """
+    Esta función mide la construcción, la serialización, el
+    renderizado y la composición de las gráficas de una consulta.
+    """
+
+    constructores = {"mapa": build_map, "tabla": build_table, "barras": build_bars}
+    figuras = dict()
+
+    for grafica in graficas:
+        figuras[grafica], resultados[f"figura {grafica}"] = medir(
+            lambda: constructores[grafica](config), repeticiones)
+
+        # La misma figura pero validada por plotly, para ver cuánto cuesta.
+        _, resultados[f"figura {grafica} validada"] = medir(
+            lambda: constructores[grafica](config, validar=True), repeticiones)
+
+        _, resultados[f"serializar {grafica}"] = medir(
+            lambda: pio.to_json(figuras[grafica], validate=False), repeticiones)
+
+    imagenes = medir_renderizado(resultados, figuras, repeticiones) if renderizar else None
+
+    for nombre, renderizar_pil in [("mapa", renderizar_mapa), ("tabla", renderizar_tabla)]:
+        if nombre not in figuras:
+            continue
+
+        imagen, resultados[f"rasterizar {nombre} pil"] = medir(
+            lambda: renderizar_pil(figuras[nombre]), repeticiones)
+
+        if imagenes is not None:
+            resultados[f"paridad {nombre} pil"] = comparar_imagenes(imagen, imagenes[nombre])
+
+    if "mapa" in figuras and "tabla" in figuras:
+        if imagenes is None:
+            imagenes = {nombre: imagen_vacia(figura) for nombre, figura in figuras.items()}
+
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, "compuesta.png")
+            _, resultados["componer"] = medir(
+                lambda: combine_images(imagenes["mapa"], imagenes["tabla"], ruta), repeticiones)
+
+
+def medir_datos(resultados, ruta, repeticiones, validar=True):
+    """
+    Esta función mide la lectura del JSON, la normalización, la
+    construcción del DataFrame y la carga desde el dataset Parquet.
+
+    Las consultas sintéticas no pasan la validación (tienen más de 32
+    entidades), así que para ellas se usa validar=False.
+    """
+
+    with open(ruta, "r", encoding="utf-8") as archivo:
+        texto = archivo.read()
+
+    data, resultados["leer json"] = medir(lambda: json.loads(texto), repeticiones)
+
+    (nodos, votacion, metadatos), resultados["normalizar"] = medir(
+        lambda: columnar.normalizar_consulta(data), repeticiones)
+
+    nodos = nodos.to_pandas()
+    votacion = votacion.to_pandas()
+
+    _, resultados["dataframe"] = medir(
+        lambda: datos.procesar_consulta(nodos, votacion, metadatos), repeticiones)
+
+    # La primera carga crea el dataset; las siguientes lo leen del disco.
+    datos.cargar_consulta(ruta, validar)
+
+    def cargar():
+        datos.olvidar_consulta(ruta)
+        return datos.cargar_consulta(ruta, validar)
+
+    _, resultados["cargar parquet"] = medir(cargar, repeticiones)
+
+
+def caso_consulta(clave, repeticiones, renderizar):
+    """
+    Esta función mide todas las etapas de una consulta del repositorio.
+    """
+
+    config = CONSULTAS[clave]
+    resultados = dict()
+
+    medir_datos(resultados, config["archivo"], repeticiones)
+    medir_figuras(resultados, config, repeticiones, renderizar)
+
+    return resultados
+
+
+def caso_geometria(repeticiones):
+    """
+    Esta función mide la simplificación de mexico.json y la carga
+    de la topología ya guardada.
+    """
+
+    resultados = dict()
+
+    with open("./mexico.json", "r", encoding="utf-8") as archivo:
+        texto = archivo.read()
+
+    original, resultados["leer geojson"] = medir(lambda: json.loads(texto), repeticiones)
+
+    _, resultados["construir topologia"] = medir(
+        lambda: geometria.construir_topologia(original), repeticiones)
+
+    def cargar():
+        geometria._memoria.clear()
+        return geometria.cargar_geometria()
+
+    _, resultados["cargar topologia"] = medir(cargar, repeticiones)
+
+    return resultados
+
+
+def crear_consulta_sintetica(data, factor):
+    """
+    Esta función regresa una copia de la consulta con las entidades
+    repetidas factor veces, cada copia con su propio idNodo y nombre.
+    """
+
+    rng = np.random.default_rng(SEMILLA)
+    sintetica = copy.deepcopy(data)
+    entidades = [entidad for entidad in data["entidadesHijas"] if entidad["idNodo"] > 0]
+
+    sintetica["entidadesHijas"] = list()
+
+    for copia in range(factor):
+        for entidad in entidades:
+            entidad = copy.deepcopy(entidad)
+            entidad["idNodo"] = copia * 100 + entidad["idNodo"]
+            entidad["nombreNodo"] = f"{entidad['nombreNodo']} {copia}"
+            entidad["porcentajeParticipacionCiudadana"] = round(float(rng.uniform(1, 40)), 4)
+            sintetica["entidadesHijas"].append(entidad)
+
+    return sintetica
+
+
+def caso_entidades(factor, repeticiones):
+    """
+    Esta función mide las etapas de datos y la tabla y las barras
+    con una consulta sintética de 32 * factor entidades.
+    """
+
+    with open(CONSULTAS["2022"]["archivo"], "r", encoding="utf-8") as archivo:
+        sintetica = crear_consulta_sintetica(json.load(archivo), factor)
+
+    resultados = dict()
+    cache_original = datos.CARPETA_CACHE
+
+    # El dataset sintético se guarda en una carpeta temporal
+    # para no llenar ./cache.
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = os.path.join(carpeta, f"sintetica-x{factor}.json")
+
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            json.dump(sintetica, archivo, ensure_ascii=False)
+
+        datos.CARPETA_CACHE = os.path.join(carpeta, "cache")
+
+        try:
+            medir_datos(resultados, ruta, repeticiones, validar=False)
+
+            # Las figuras también cargan la consulta sin validarla.
+            config = dict(CONSULTAS["2022"], archivo=ruta, validar_datos=False)
+            medir_figuras(resultados, config, repeticiones, False, ("tabla", "barras"))
+        finally:
+            datos.CARPETA_CACHE = cache_original
+            datos.olvidar_consulta(ruta)
+
+    return resultados
+
+
+def crear_mapa_sintetico(poligonos, vertices=48):
+    """
+    Esta función regresa un GeoJSON con una cuadrícula de polígonos
+    irregulares sobre el territorio de México.
+    """
+
+    rng = np.random.default_rng(SEMILLA)
+
+    columnas = int(np.ceil(np.sqrt(poligonos * 2)))
+    renglones = int(np.ceil(poligonos / columnas))
+
+    ancho = 31 / columnas
+    alto = 18 / renglones
+
+    angulos = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    features = list()
+
+    for i in range(poligonos):
+        centro_x = -117 + (i % columnas + 0.5) * ancho
+        centro_y = 14.5 + (i // columnas + 0.5) * alto
+
+        radios = rng.uniform(0.35, 0.5, vertices)
+        anillo = np.column_stack([
+            centro_x + np.cos(angulos) * radios * ancho,
+            centro_y + np.sin(angulos) * radios * alto,
+        ])
+        anillo = np.vstack([anillo, anillo[:1]])
+
+        features.append({
+            "type": "Feature",
+            "properties": {"CLAVE": f"{i:05d}"},
+            "geometry": {"type": "Polygon", "coordinates": [anillo.round(5).tolist()]},
+        })
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+def caso_poligonos(poligonos, repeticiones, renderizar):
+    """
+    Esta función mide la simplificación, la figura, la serialización
+    y el dibujo con PIL y con kaleido de un mapa sintético.
+    """
+
+    geojson = crear_mapa_sintetico(poligonos)
+
+    rng = np.random.default_rng(SEMILLA)
+    claves = [feature["properties"]["CLAVE"] for feature in geojson["features"]]
+    valores = rng.uniform(0, 40, poligonos)
+
+    resultados = dict()
+
+    _, resultados["construir topologia"] = medir(
+        lambda: geometria.construir_topologia(geojson), repeticiones)
+
+    def crear_figura():
+        return go.Figure(
+            go.Choropleth(
+                geojson=geojson,
+                locations=claves,
+                z=valores,
+                featureidkey="properties.CLAVE",
+                colorscale="portland",
+                zmin=0,
+                zmax=40
+            ),
+            layout=dict(width=1280, height=720, geo_fitbounds="geojson")
+        )
+
+    figura, resultados["figura mapa"] = medir(crear_figura, repeticiones)
+
+    _, resultados["serializar mapa"] = medir(
+        lambda: pio.to_json(figura, validate=False), repeticiones)
+
+    _, resultados["pintar con pil"] = medir(
+        lambda: pintar_choropleth(geojson, valores, 0, 40, ancho=1200, alto=640), repeticiones)
+
+    if renderizar:
+        medir_renderizado(resultados, {"mapa": figura}, repeticiones)
+
+    return resultados
+
+
+def obtener_entorno():
+    """
+    Esta función regresa el commit, la plataforma y las versiones
+    de las bibliotecas, para saber qué se está comparando.
+    """
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    versiones = dict()
+
+    for paquete in ["numpy", "pandas", "pyarrow", "plotly", "pillow", "kaleido"]:
+        try:
+            versiones[paquete] = version(paquete)
+        except PackageNotFoundError:
+            versiones[paquete] = None
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "procesador": platform.processor() or platform.machine(),
+        "versiones": versiones,
+    }
+
+
+def ejecutar(repeticiones=5, renderizar=True, consultas=None, factores=None, poligonos=None):
+    """
+    Esta función ejecuta todos los casos y regresa los resultados.
+    """
+
+    consultas = list(CONSULTAS) if consultas is None else consultas
+    factores = FACTORES_ENTIDADES if factores is None else factores
+    poligonos = POLIGONOS if poligonos is None else poligonos
+
+    casos = dict()
+
+    print("Midiendo importaciones...")
+    casos["importaciones"] = medir_importaciones(repeticiones)
+
+    print("Midiendo el arranque de cli.py...")
+    casos["cli"] = caso_cli(repeticiones)
+
+    print("Midiendo geometría...")
+    casos["geometria"] = caso_geometria(repeticiones)
+
+    with renderizador.sesion():
+        for clave in consultas:
+            print(f"Midiendo la consulta {clave}...")
+            casos[f"consulta {clave}"] = caso_consulta(clave, repeticiones, renderizar)
+
+        for factor in factores:
+            print(f"Midiendo {32 * factor:,} entidades sintéticas...")
+            casos[f"entidades x{factor}"] = caso_entidades(factor, repeticiones)
+
+        for cantidad in poligonos:
+            print(f"Midiendo {cantidad:,} polígonos sintéticos...")
+            casos[f"poligonos {cantidad}"] = caso_poligonos(cantidad, repeticiones, renderizar)
+
+    return {
+        "version": VERSION_RESULTADOS,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "entorno": obtener_entorno(),
+        "casos": casos,
+    }
+
+
+def guardar_resultados(resultados, carpeta=CARPETA_BENCHMARKS):
+    """
+    Esta función guarda los resultados en un JSON cuyo nombre lleva
+    la fecha y el commit, y regresa su ruta.
+    """
+
+    os.makedirs(carpeta, exist_ok=True)
+
+    fecha = resultados["fecha"].replace(":", "").replace("-", "")
+    commit = resultados["entorno"]["commit"] or "sin-commit"
+    ruta = os.path.join(carpeta, f"{fecha}-{commit}.json")
+
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        json.dump(resultados, archivo, ensure_ascii=False, indent=4)
+
+    return ruta
+
+
+def comparar(anterior, actual, umbral=UMBRAL_REGRESION):
+    """
+    Esta función compara las medianas de dos ejecuciones.
+
+    Regresa un renglón por etapa medida en ambas, con la proporción
+    entre el tiempo actual y el anterior y si es una regresión.
+    """
+
+    renglones = list()
+
+    for caso, etapas in actual["casos"].items():
+        for etapa, medicion in etapas.items():
+            previa = anterior["casos"].get(caso, dict()).get(etapa)
+
+            if previa is None or "mediana" not in previa or "mediana" not in medicion:
+                continue
+
+            proporcion = medicion["mediana"] / max(previa["mediana"], 1e-9)
+
+            renglones.append({
+                "caso": caso,
+                "etapa": etapa,
+                "anterior": previa["mediana"],
+                "actual": medicion["mediana"],
+                "proporcion": proporcion,
+                "regresion": proporcion > umbral,
+            })
+
+    return renglones
+
+
+def imprimir_resultados(resultados):
+    """
+    Esta función imprime la mediana de cada etapa.
+    """
+
+    for caso, etapas in resultados["casos"].items():
+        print(f"\n{caso}")
+
+        for etapa, medicion in etapas.items():
+            if "error" in medicion:
+                print(f"  {etapa:<28}{medicion['error']}")
+            elif "pixeles_distintos" in medicion:
+                print(f"  {etapa:<28}{medicion['pixeles_distintos']:>12.2%} de pixeles distintos")
+            else:
+                marca = "  (arriba del objetivo)" if medicion.get("cumple") is False else ""
+                print(f"  {etapa:<28}{medicion['mediana'] * 1000:>12,.2f} ms{marca}")
+
+
+def imprimir_comparacion(renglones):
+    """
+    Esta función imprime la comparación entre dos ejecuciones.
+    """
+
+    print(f"\n{'Caso':<20}{'Etapa':<28}{'Antes':>12}{'Ahora':>12}{'':>10}")
+
+    for renglon in renglones:
+        marca = "  más lento" if renglon["regresion"] else ""
+
+        print(
+            f"{renglon['caso']:<20}{renglon['etapa']:<28}"
+            f"{renglon['anterior'] * 1000:>10,.1f}ms{renglon['actual'] * 1000:>10,.1f}ms"
+            f"{renglon['proporcion']:>9.2f}x{marca}"
+        )
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Mide el tiempo de cada etapa.")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--consultas", nargs="*", default=None)
+    parser.add_argument("--factores", nargs="*", type=int, default=None)
+    parser.add_argument("--poligonos", nargs="*", type=int, default=None)
+    parser.add_argument("--sin-render", action="store_true", help="No usa kaleido.")
+    parser.add_argument("--carpeta", default=CARPETA_BENCHMARKS)
+    parser.add_argument("--comparar", default=None, help="JSON de una ejecución anterior.")
+    argumentos = parser.parse_args()
+
+    resultados = ejecutar(
+        argumentos.repeticiones,
+        not argumentos.sin_render,
+        argumentos.consultas,
+        argumentos.factores,
+        argumentos.poligonos
+    )
+
+    imprimir_resultados(resultados)
+    print(f"\nResultados guardados en {guardar_resultados(resultados, argumentos.carpeta)}")
+
+    if argumentos.comparar:
+        with open(argumentos.comparar, "r", encoding="utf-8") as archivo:
+            anterior = json.load(archivo)
+
+        renglones = comparar(anterior, resultados)
+        imprimir_comparacion(renglones)
+
+        # Salimos con error si alguna etapa es más lenta, para usarlo en CI.
+        if any(renglon["regresion"] for renglon in renglones):
+            sys.exit(1)
@@ -0,0 +1,436 @@
+"""
+Este módulo es la línea de comandos para generar las gráficas.
+
+Cada subcomando importa pandas, plotly, PIL y kaleido solo si los
+necesita, así que los comandos que no renderizan (list y validate)
+terminan en unas cuantas decenas de milisegundos.
+
+Uso:
+
+    python cli.py list
+    python cli.py validate [2021 2022]
+    python cli.py map [2021 2022] [--nivel distrito] [--motor pil] [--carpeta ./salidas]
+    python cli.py table [2021 2022] [--motor pil] [--carpeta ./salidas]
+    python cli.py bars [2021 2022]
+    python cli.py compose [2021 2022]
+    python cli.py all [2021 2022] [--depurar] [--forzar]
+    python cli.py export [2021 2022] [--graficas mapa compuesta] [--formatos png svg webp]
+                         [--tamanos original retina miniatura] [--motor pil] [--optimizar]
+    python cli.py compare [2021 2022] [--variable participacion] [--graficas delta pendientes dispersion]
+    python cli.py analyze [2021 2022] [--remuestras 10000] [--confianza 0.95] [--semilla 0] [--graficas]
+
+Con --tiempo se muestra cuánto tardó el arranque y el comando.
+"""
+
+import time
+
+# Medimos desde aquí para que --tiempo incluya lo que tardan las
+# importaciones de abajo; por eso van después de INICIO (E402).
+INICIO = time.perf_counter()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+
+import validacion  # noqa: E402
+from configuracion import CONSULTAS, MOTORES_MAPA, NIVELES_MAPA  # noqa: E402
+
+
+def comando_list(argumentos):
+    """
+    Esta función muestra las consultas configuradas y su último corte.
+    """
+
+    for clave, config in CONSULTAS.items():
+        with open(config["archivo"], "r", encoding="utf-8") as archivo:
+            data = json.load(archivo)
+
+        print(
+            f"{clave}  {config['archivo']:<20}  corte {data['fechaCorte']} {data['horaCorte']}  "
+            f"participación {data['porcentajeParticipacionCiudadana']:,.2f}%"
+        )
+
+
+def comando_validate(argumentos):
+    """
+    Esta función revisa el JSON de cada consulta (y los nombres de sus
+    entidades contra el GeoJSON) sin cargar pandas. Regresa 1 si alguna
+    tiene problemas.
+    """
+
+    codigo = 0
+
+    for clave in argumentos.consultas:
+        with open(CONSULTAS[clave]["archivo"], "r", encoding="utf-8") as archivo:
+            data = json.load(archivo)
+
+        problemas = validacion.revisar_consulta(data)
+
+        if not problemas:
+            problemas = validacion.revisar_geometria(data, NIVELES_MAPA["entidad"]["geometria"])
+
+        if problemas:
+            codigo = 1
+            print(f"{clave}: {len(problemas)} problemas")
+
+            for problema in problemas:
+                print(f"  {problema}")
+        else:
+            print(f"{clave}: correcta")
+
+    return codigo
+
+
+def renderizar_salidas(argumentos, crear, sufijo):
+    """
+    Esta función renderiza una gráfica de cada consulta pedida y la
+    guarda en la carpeta como <consulta>-<sufijo>.png.
+    """
+
+    import renderizador
+
+    os.makedirs(argumentos.carpeta, exist_ok=True)
+
+    with renderizador.sesion():
+        for clave in argumentos.consultas:
+            config = dict(CONSULTAS[clave])
+
+            if hasattr(argumentos, "nivel"):
+                config["nivel"] = argumentos.nivel
+
+            if getattr(argumentos, "motor", None):
+                config["motor"] = argumentos.motor
+
+            ruta = os.path.join(argumentos.carpeta, f"{clave}-{sufijo}.png")
+
+            with open(ruta, "wb") as archivo:
+                archivo.write(crear(config))
+
+            print(f"{ruta} guardado.")
+
+
+def comando_map(argumentos):
+    """
+    Esta función genera solo los mapas.
+    """
+
+    from consulta import create_map
+
+    renderizar_salidas(argumentos, create_map, "mapa")
+
+
+def comando_table(argumentos):
+    """
+    Esta función genera solo las tablas.
+    """
+
+    from consulta import create_table
+
+    renderizar_salidas(argumentos, create_table, "tabla")
+
+
+def comando_bars(argumentos):
+    """
+    Esta función genera solo las gráficas de barras, en la salida
+    configurada de cada consulta.
+    """
+
+    import renderizador
+    from consulta import create_bars
+
+    with renderizador.sesion():
+        for clave in argumentos.consultas:
+            config = CONSULTAS[clave]
+
+            with open(config["salida_barras"], "wb") as archivo:
+                archivo.write(create_bars(config))
+
+            print(f"{config['salida_barras']} guardado.")
+
+
+def comando_compose(argumentos):
+    """
+    Esta función genera el mapa y la tabla y los combina en la
+    salida configurada de cada consulta.
+    """
+
+    import renderizador
+    from consulta import combine_images, create_map, create_table
+
+    with renderizador.sesion():
+        for clave in argumentos.consultas:
+            config = CONSULTAS[clave]
+            combine_images(create_map(config), create_table(config), config["salida_mapa"])
+
+            print(f"{config['salida_mapa']} guardado.")
+
+
+def comando_all(argumentos):
+    """
+    Esta función genera todas las gráficas, omitiendo las que ya
+    están al día.
+    """
+
+    from consulta import generar
+
+    generar(argumentos.consultas, argumentos.depurar, argumentos.forzar)
+
+
+def comando_export(argumentos):
+    """
+    Esta función exporta las gráficas pedidas en varios formatos y
+    tamaños, construyendo cada figura una sola vez.
+
+    La imagen compuesta no se puede exportar en PDF, así que con pdf
+    se omite para ese formato y se avisa.
+    """
+
+    import renderizador
+    from consulta import build_bars, build_map, build_table
+    from exportar import exportar
+
+    from configuracion import MOTOR_MAPA, MOTOR_TABLA
+
+    constructores = {"mapa": build_map, "tabla": build_table, "barras": build_bars}
+
+    if "pdf" in argumentos.formatos and "compuesta" in argumentos.graficas:
+        print("La imagen compuesta no se puede exportar en PDF; se omite ese formato para ella.")
+
+    with renderizador.sesion():
+        for clave in argumentos.consultas:
+            config = CONSULTAS[clave]
+            figuras = dict()
+            dibujantes = dict()
+
+            # Con el motor PIL el mapa y la tabla no pasan por kaleido en los formatos raster.
+            if (argumentos.motor or config.get("motor", MOTOR_MAPA)) == "pil":
+                from rasterizador import dibujar_mapa
+                dibujantes["mapa"] = dibujar_mapa
+
+            if (argumentos.motor or config.get("motor", MOTOR_TABLA)) == "pil":
+                from tablas import dibujar_tabla
+                dibujantes["tabla"] = dibujar_tabla
+
+            for grafica in argumentos.graficas:
+                # La imagen compuesta es el mapa con la tabla abajo.
+                nombres = ["mapa", "tabla"] if grafica == "compuesta" else [grafica]
+
+                formatos = argumentos.formatos
+
+                if grafica == "compuesta":
+                    formatos = [formato for formato in formatos if formato != "pdf"]
+
+                if not formatos:
+                    continue
+
+                for nombre in nombres:
+                    if nombre not in figuras:
+                        figuras[nombre] = constructores[nombre](config)
+
+                rutas = exportar(
+                    [figuras[nombre] for nombre in nombres],
+                    os.path.join(argumentos.carpeta, f"{clave}-{grafica}"),
+                    formatos,
+                    argumentos.tamanos,
+                    argumentos.optimizar,
+                    [dibujantes.get(nombre) for nombre in nombres]
+                )
+
+                for ruta in rutas:
+                    print(f"{ruta} guardado.")
+
+
+def comando_compare(argumentos):
+    """
+    Esta función compara las consultas pedidas. Todas las gráficas
+    salen de la misma matriz y se renderizan en una sola sesión.
+    """
+
+    import renderizador
+    from comparacion import construir_matriz, create_comparison
+
+    if len(argumentos.consultas) < 2:
+        print("Se necesitan al menos dos consultas para compararlas.")
+        return 1
+
+    os.makedirs(argumentos.carpeta, exist_ok=True)
+
+    matriz = construir_matriz(argumentos.consultas)
+    base = f"comparacion-{argumentos.variable}-{argumentos.consultas[0]}-{argumentos.consultas[-1]}"
+
+    with renderizador.sesion():
+        imagenes = create_comparison(matriz, argumentos.variable, argumentos.graficas)
+
+    for grafica, imagen in imagenes.items():
+        ruta = os.path.join(argumentos.carpeta, f"{base}-{grafica}.png")
+
+        with open(ruta, "wb") as archivo:
+            archivo.write(imagen)
+
+        print(f"{ruta} guardado.")
+
+
+def comando_analyze(argumentos):
+    """
+    Esta función calcula las estadísticas de cada consulta y las guarda
+    como CSV. Con --graficas también genera la tabla de intervalos y
+    las barras de las entidades (y actas) más atípicas.
+    """
+
+    import renderizador
+    from estadistica import analizar_consulta, build_interval_table, build_outlier_bars, exportar_resultados
+
+    os.makedirs(argumentos.carpeta, exist_ok=True)
+
+    for clave in argumentos.consultas:
+        config = CONSULTAS[clave]
+        base = os.path.join(argumentos.carpeta, f"{clave}-analisis")
+
+        resultados = analizar_consulta(config, argumentos.remuestras, argumentos.confianza, argumentos.semilla)
+
+        nacional = resultados["intervalos"].loc["nacional"]
+        print(
+            f"{clave}: participación {nacional['participacion']:,.4f}% "
+            f"(IC {argumentos.confianza:.0%}: {nacional['inferior']:,.4f} - {nacional['superior']:,.4f}%)"
+        )
+
+        for nombre, descripcion in [("atipicos_entidad", "entidades atípicas"), ("atipicos_acta", "actas atípicas")]:
+            if nombre in resultados:
+                print(f"  {descripcion}: {int(resultados[nombre]['atipico'].sum())}")
+
+        for ruta in exportar_resultados(resultados, base):
+            print(f"{ruta} guardado.")
+
+        if not argumentos.graficas:
+            continue
+
+        fuente = f"Fuente: INE ({config['anio']})"
+        figuras = {
+            "intervalos": build_interval_table(resultados["intervalos"], argumentos.confianza),
+            "atipicos": build_outlier_bars(
+                resultados["atipicos_entidad"],
+                f"Entidades ordenadas por lo atípico de sus respuestas en {config['descripcion']}",
+                fuente
+            ),
+        }
+
+        if "atipicos_acta" in resultados:
+            figuras["atipicos-actas"] = build_outlier_bars(
+                resultados["atipicos_acta"],
+                f"Actas con las respuestas más atípicas para su entidad en {config['descripcion']}",
+                fuente,
+                "casilla" if "casilla" in resultados["atipicos_acta"] else None
+            )
+
+        with renderizador.sesion():
+            imagenes = renderizador.renderizar(figuras)
+
+        for nombre, imagen in imagenes.items():
+            ruta = f"{base}-{nombre}.png"
+
+            with open(ruta, "wb") as archivo:
+                archivo.write(imagen)
+
+            print(f"{ruta} guardado.")
+
+
+def crear_parser():
+    """
+    Esta función arma el parser con todos los subcomandos.
+    """
+
+    parser = argparse.ArgumentParser(description="Genera las gráficas de las consultas populares.")
+    parser.add_argument("--tiempo", action="store_true", help="Muestra el tiempo de arranque.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    def agregar(nombre, funcion, ayuda):
+        subparser = comandos.add_parser(nombre, help=ayuda)
+        subparser.set_defaults(funcion=funcion)
+
+        if nombre != "list":
+            subparser.add_argument("consultas", nargs="*", help=f"De {', '.join(CONSULTAS)}; todas si no se indica.")
+
+        return subparser
+
+    agregar("list", comando_list, "Muestra las consultas configuradas.")
+    agregar("validate", comando_validate, "Revisa el JSON de las consultas.")
+
+    for nombre, funcion, ayuda in [
+        ("map", comando_map, "Genera solo el mapa."),
+        ("table", comando_table, "Genera solo la tabla."),
+    ]:
+        subparser = agregar(nombre, funcion, ayuda)
+        subparser.add_argument("--carpeta", default="./salidas")
+        subparser.add_argument("--motor", choices=MOTORES_MAPA, help="Por defecto kaleido.")
+
+        if nombre == "map":
+            subparser.add_argument("--nivel", default="entidad", choices=list(NIVELES_MAPA))
+
+    agregar("bars", comando_bars, "Genera solo la gráfica de barras.")
+    agregar("compose", comando_compose, "Genera el mapa y la tabla combinados.")
+
+    subparser = agregar("all", comando_all, "Genera todas las gráficas que cambiaron.")
+    subparser.add_argument("--depurar", action="store_true")
+    subparser.add_argument("--forzar", action="store_true")
+
+    # Las opciones son las de exportar.py, que no importamos aquí
+    # porque importa PIL.
+    subparser = agregar("export", comando_export, "Exporta en varios formatos y tamaños.")
+    subparser.add_argument("--graficas", nargs="+", default=["compuesta", "barras"],
+                           choices=["mapa", "tabla", "barras", "compuesta"])
+    subparser.add_argument("--formatos", nargs="+", default=["png"], choices=["png", "webp", "jpg", "svg", "pdf"])
+    subparser.add_argument("--tamanos", nargs="+", default=["original"],
+                           choices=["original", "retina", "social", "miniatura"])
+    subparser.add_argument("--motor", choices=MOTORES_MAPA,
+                           help="Motor del mapa y la tabla en formatos raster. Por defecto kaleido.")
+    subparser.add_argument("--optimizar", action="store_true", help="PNG y WebP más chicos, pero más lentos.")
+    subparser.add_argument("--carpeta", default="./salidas")
+
+    # Las opciones son las de comparacion.py, que importa pandas y plotly.
+    subparser = agregar("compare", comando_compare, "Compara las consultas entre sí.")
+    subparser.add_argument("--variable", default="participacion",
+                           choices=["participacion", "total", "lista_nominal", "si", "no", "nulo"])
+    subparser.add_argument("--graficas", nargs="+", default=["delta", "pendientes", "dispersion"],
+                           choices=["delta", "pendientes", "dispersion"])
+    subparser.add_argument("--carpeta", default="./salidas")
+
+    subparser = agregar("analyze", comando_analyze, "Calcula intervalos, correlaciones y atípicos.")
+    subparser.add_argument("--remuestras", type=int, default=10000)
+    subparser.add_argument("--confianza", type=float, default=0.95)
+    subparser.add_argument("--semilla", type=int, default=None)
+    subparser.add_argument("--graficas", action="store_true", help="También genera la tabla y las barras.")
+    subparser.add_argument("--carpeta", default="./salidas")
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Esta función ejecuta el subcomando indicado y regresa el código
+    de salida.
+    """
+
+    parser = crear_parser()
+    argumentos = parser.parse_args(argv)
+
+    if hasattr(argumentos, "consultas"):
+        for clave in argumentos.consultas:
+            if clave not in CONSULTAS:
+                parser.error(f"Consulta desconocida: {clave}")
+
+        # Si no se indica ninguna consulta, usamos todas.
+        argumentos.consultas = argumentos.consultas or list(CONSULTAS)
+
+    arranque = time.perf_counter() - INICIO
+    codigo = argumentos.funcion(argumentos) or 0
+
+    if argumentos.tiempo:
+        print(f"Arranque: {arranque * 1000:,.0f} ms, total: {(time.perf_counter() - INICIO) * 1000:,.0f} ms")
+
+    return codigo
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
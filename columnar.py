@@ -0,0 +1,244 @@
+"""
+Este módulo guarda las consultas en formato columnar (Parquet).
+
+Cada consulta se normaliza en dos tablas dentro de
+./cache/<consulta>/, más un archivo metadatos.json con el corte:
+
+nodos.parquet, un renglón por nodo (nacional, entidades y el nodo de
+representación proporcional):
+
+    id_nodo                     int16    idNodo (100 es el nacional, 0 es RP)
+    nivel                       string   nivelNodo (NACIONAL, ESTATAL)
+    nombre                      string   nombreNodo tal como lo publica el INE
+    id_nodo_padre               int16    idNodoPadre
+    id_mapa                     string   idMapa (por ejemplo mx-ag)
+    total_actas                 int32    totalActas
+    total_actas_urbanas         int32    totalActasUrbanas
+    total_actas_rurales         int32    totalActasRurales
+    actas_contabilizadas        int32    actasContabilizadas.total
+    actas_contabilizadas_pct    float64  actasContabilizadas.porcentaje
+    actas_capturadas            int32    actasCapturadas.total
+    actas_cotejo                int32    actasCotejo
+    actas_recuento              int32    actasRecuento
+    actas_casilla_no_instalada  int32    actasCasillaNoInstalada
+    actas_paquete_no_entregado  int32    actasPaqueteNoEntregado
+    actas_pendiente             int32    actasPendiente
+    lista_nominal               int64    listaNominal
+    participacion               float64  porcentajeParticipacionCiudadana
+    total_votos                 int64    totalVotos
+
+votacion.parquet, votacionPartidosConDistribucion en formato largo,
+un renglón por nodo y respuesta. Los votos en el extranjero usan
+id_nodo = -1:
+
+    id_nodo                     int16    idNodo
+    orden                       int8     posición de la respuesta en el JSON
+    id_partido                  int16    idPartido (11 SÍ, 12 NO, 91 NULOS, ...)
+    nombre                      string   nombrePartido
+    siglas                      string   siglasPartido
+    total                       int64    total
+    porcentaje                  float64  porcentaje
+
+Las tablas se leen con memory_map, así que leer unas cuantas
+columnas no requiere leer el archivo completo.
+"""
+
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Si cambiamos el esquema, subimos este número.
+VERSION_ESQUEMA = 1
+
+# Id de nodo que usamos para los votos en el extranjero.
+NODO_EXTRANJERO = -1
+
+ESQUEMA_NODOS = pa.schema([
+    ("id_nodo", pa.int16()),
+    ("nivel", pa.string()),
+    ("nombre", pa.string()),
+    ("id_nodo_padre", pa.int16()),
+    ("id_mapa", pa.string()),
+    ("total_actas", pa.int32()),
+    ("total_actas_urbanas", pa.int32()),
+    ("total_actas_rurales", pa.int32()),
+    ("actas_contabilizadas", pa.int32()),
+    ("actas_contabilizadas_pct", pa.float64()),
+    ("actas_capturadas", pa.int32()),
+    ("actas_cotejo", pa.int32()),
+    ("actas_recuento", pa.int32()),
+    ("actas_casilla_no_instalada", pa.int32()),
+    ("actas_paquete_no_entregado", pa.int32()),
+    ("actas_pendiente", pa.int32()),
+    ("lista_nominal", pa.int64()),
+    ("participacion", pa.float64()),
+    ("total_votos", pa.int64()),
+])
+
+ESQUEMA_VOTACION = pa.schema([
+    ("id_nodo", pa.int16()),
+    ("orden", pa.int8()),
+    ("id_partido", pa.int16()),
+    ("nombre", pa.string()),
+    ("siglas", pa.string()),
+    ("total", pa.int64()),
+    ("porcentaje", pa.float64()),
+])
+
+# Campos del corte que guardamos en metadatos.json.
+CAMPOS_CORTE = ["horaCorte", "fechaCorte", "archivoCorte", "cortePrueba"]
+
+
+def normalizar_nodo(nodo):
+    """
+    Esta función convierte un nodo del JSON en un renglón de nodos.parquet.
+    """
+
+    return {
+        "id_nodo": nodo["idNodo"],
+        "nivel": nodo["nivelNodo"],
+        "nombre": nodo["nombreNodo"],
+        "id_nodo_padre": nodo["idNodoPadre"],
+        "id_mapa": nodo["idMapa"],
+        "total_actas": nodo["totalActas"],
+        "total_actas_urbanas": nodo["totalActasUrbanas"],
+        "total_actas_rurales": nodo["totalActasRurales"],
+        "actas_contabilizadas": nodo["actasContabilizadas"]["total"],
+        "actas_contabilizadas_pct": nodo["actasContabilizadas"]["porcentaje"],
+        "actas_capturadas": nodo["actasCapturadas"]["total"],
+        "actas_cotejo": nodo["actasCotejo"],
+        "actas_recuento": nodo["actasRecuento"],
+        "actas_casilla_no_instalada": nodo["actasCasillaNoInstalada"],
+        "actas_paquete_no_entregado": nodo["actasPaqueteNoEntregado"],
+        "actas_pendiente": nodo["actasPendiente"],
+        "lista_nominal": nodo["listaNominal"],
+        "participacion": nodo["porcentajeParticipacionCiudadana"],
+        "total_votos": nodo["totalVotos"],
+    }
+
+
+def normalizar_votacion(id_nodo, votacion):
+    """
+    Esta función convierte la votación de un nodo en renglones de votacion.parquet.
+    """
+
+    return [
+        {
+            "id_nodo": id_nodo,
+            "orden": orden,
+            "id_partido": respuesta["idPartido"],
+            "nombre": respuesta["nombrePartido"],
+            "siglas": respuesta["siglasPartido"],
+            "total": respuesta["total"],
+            "porcentaje": respuesta["porcentaje"],
+        }
+        for orden, respuesta in enumerate(votacion)
+    ]
+
+
+def normalizar_consulta(data):
+    """
+    Esta función convierte el JSON del PREP en las tablas de nodos y
+    votación (como tablas de Arrow) y en los metadatos del corte.
+    """
+
+    nodos = [normalizar_nodo(data)]
+    votacion = normalizar_votacion(data["idNodo"], data["votacionPartidosConDistribucion"])
+
+    for entidad in data["entidadesHijas"]:
+        nodos.append(normalizar_nodo(entidad))
+        votacion.extend(normalizar_votacion(
+            entidad["idNodo"], entidad["votacionPartidosConDistribucion"]))
+
+    if data.get("votosEnElExtranjero"):
+        votacion.extend(normalizar_votacion(NODO_EXTRANJERO, data["votosEnElExtranjero"]))
+
+    metadatos = {campo: data.get(campo) for campo in CAMPOS_CORTE}
+
+    return (
+        pa.Table.from_pylist(nodos, schema=ESQUEMA_NODOS),
+        pa.Table.from_pylist(votacion, schema=ESQUEMA_VOTACION),
+        metadatos,
+    )
+
+
+def escribir_tabla(tabla, ruta):
+    """
+    Esta función guarda una tabla de Arrow o un DataFrame en Parquet.
+    """
+
+    if isinstance(tabla, pd.DataFrame):
+        tabla = pa.Table.from_pandas(tabla, preserve_index=False)
+
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    pq.write_table(tabla, temporal, compression="zstd")
+    os.replace(temporal, ruta)
+
+
+def leer_tabla(ruta, columnas=None, filtros=None):
+    """
+    Esta función lee una tabla Parquet como DataFrame.
+
+    Solo se leen las columnas pedidas y el archivo se abre con
+    memory_map, así que no se copia completo a memoria.
+    """
+
+    tabla = pq.read_table(ruta, columns=columnas, filters=filtros, memory_map=True)
+
+    return tabla.to_pandas(types_mapper={pa.string(): pd.StringDtype()}.get)
+
+
+def escribir_dataset(carpeta, nodos, votacion, metadatos):
+    """
+    Esta función guarda las dos tablas y los metadatos de una consulta.
+
+    metadatos.json se escribe al final: si existe, las tablas
+    están completas.
+    """
+
+    escribir_tabla(nodos, os.path.join(carpeta, "nodos.parquet"))
+    escribir_tabla(votacion, os.path.join(carpeta, "votacion.parquet"))
+    escribir_metadatos(carpeta, metadatos)
+
+
+def escribir_metadatos(carpeta, metadatos):
+    """
+    Esta función guarda los metadatos de un dataset.
+    """
+
+    metadatos = dict(metadatos, version=VERSION_ESQUEMA)
+    ruta = os.path.join(carpeta, "metadatos.json")
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+
+    os.makedirs(carpeta, exist_ok=True)
+
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(metadatos, archivo, ensure_ascii=False, indent=4)
+
+    os.replace(temporal, ruta)
+
+
+def leer_metadatos(carpeta):
+    """
+    Esta función regresa los metadatos de una consulta o None si
+    el dataset no existe o tiene otro esquema.
+    """
+
+    ruta = os.path.join(carpeta, "metadatos.json")
+
+    if not os.path.exists(ruta):
+        return None
+
+    with open(ruta, "r", encoding="utf-8") as archivo:
+        metadatos = json.load(archivo)
+
+    if metadatos.get("version") != VERSION_ESQUEMA:
+        return None
+
+    return metadatos
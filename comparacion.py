@@ -0,0 +1,478 @@
+"""
+Este módulo compara varias consultas entre sí, entidad por entidad.
+
+Todas las consultas se alinean en una sola matriz con un renglón por
+entidad (unidas por su clave, no por su nombre) y una columna por
+variable y consulta. La matriz se arma en una sola pasada a partir
+de las tablas ya procesadas de cada consulta (ver datos.py), así que
+ningún JSON se vuelve a leer, y todas las gráficas salen de ella:
+
+- Un mapa con la diferencia de una variable entre dos consultas.
+- Una gráfica de pendientes con la evolución de cada entidad a lo
+  largo de todas las consultas.
+- Una gráfica de dispersión de una variable en una consulta contra
+  otra (o contra otra variable).
+
+Uso:
+
+    python cli.py compare [2021 2022] [--variable participacion] [--graficas delta pendientes dispersion]
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+import plantillas
+import renderizador
+from configuracion import CONSULTAS, NIVELES_MAPA
+from consulta import calcular_marcas, crear_plantilla_mapa
+from datos import cargar_consulta
+from geometria import cargar_geometria, unir_valores
+
+
+# Variables de la matriz. Las que son porcentajes se comparan en
+# puntos porcentuales; las demás en cambio porcentual.
+VARIABLES = {
+    "participacion": {"nombre": "participación", "porcentaje": True},
+    "total": {"nombre": "total de votos", "porcentaje": False},
+    "lista_nominal": {"nombre": "lista nominal", "porcentaje": False},
+    "si": {"nombre": "respuesta a favor", "porcentaje": True},
+    "no": {"nombre": "respuesta en contra", "porcentaje": True},
+    "nulo": {"nombre": "votos nulos", "porcentaje": True},
+}
+
+GRAFICAS = ["delta", "pendientes", "dispersion"]
+
+
+def construir_matriz(claves):
+    """
+    Esta función arma la matriz alineada de las consultas indicadas.
+
+    Regresa un diccionario con:
+
+    - consultas: las claves de las consultas, en el orden pedido.
+    - entidades: el nombre de cada entidad, indexado por su clave.
+    - valores: un DataFrame indexado por la clave de la entidad, con
+      columnas (variable, consulta).
+    - nacional: un DataFrame con el resumen nacional, un renglón por consulta.
+    """
+
+    if len(claves) < 2:
+        raise ValueError("Se necesitan al menos dos consultas para compararlas.")
+
+    consultas = [cargar_consulta(CONSULTAS[clave]["archivo"]) for clave in claves]
+
+    # Unimos todas las tablas y las alineamos por clave de una sola vez.
+    largo = pd.concat(
+        [consulta["entidades"].reset_index().set_index("clave") for consulta in consultas],
+        keys=claves,
+        names=["consulta", "clave"]
+    )
+
+    valores = largo[list(VARIABLES)].unstack("consulta")
+    valores = valores.reindex(columns=pd.MultiIndex.from_product([list(VARIABLES), claves]))
+
+    # Tomamos el nombre de cada entidad de la consulta más reciente que la tenga.
+    nombres = largo["entidad"].droplevel("consulta")
+    entidades = nombres[~nombres.index.duplicated(keep="last")].reindex(valores.index)
+
+    nacional = pd.DataFrame(
+        [{variable: consulta["nacional"][variable] for variable in VARIABLES} for consulta in consultas],
+        index=pd.Index(claves, name="consulta")
+    )
+
+    return {"consultas": list(claves), "entidades": entidades, "valores": valores, "nacional": nacional}
+
+
+def diferencias(matriz, variable, inicial, final):
+    """
+    Esta función regresa el cambio de una variable entre dos consultas
+    por entidad y a nivel nacional.
+
+    Los porcentajes cambian en puntos porcentuales y los conteos en
+    cambio porcentual.
+    """
+
+    valores = matriz["valores"][variable]
+    nacional = matriz["nacional"][variable]
+
+    if VARIABLES[variable]["porcentaje"]:
+        return valores[final] - valores[inicial], nacional[final] - nacional[inicial]
+
+    return (
+        (valores[final] / valores[inicial] - 1) * 100,
+        (nacional[final] / nacional[inicial] - 1) * 100
+    )
+
+
+def build_delta_map(matriz, variable="participacion", inicial=None, final=None, validar=False):
+    """
+    Esta función crea un mapa Choropleth con el cambio de una variable
+    entre dos consultas (por defecto la primera y la última).
+
+    La escala de colores es divergente y simétrica alrededor de cero.
+    La figura se regresa como diccionario, a menos que validar sea True.
+    """
+
+    inicial = inicial or matriz["consultas"][0]
+    final = final or matriz["consultas"][-1]
+
+    cambio, cambio_nacional = diferencias(matriz, variable, inicial, final)
+
+    limite = float(np.nanmax(np.abs(cambio.to_numpy())))
+    marcas, zmin, zmax, decimales = calcular_marcas(pd.Series([-limite, limite]))
+
+    unidad = "pp" if VARIABLES[variable]["porcentaje"] else "%"
+    etiquetas = [f"{marca:+,.{decimales}f} {unidad}" if marca else "0" for marca in marcas]
+
+    nivel = NIVELES_MAPA["entidad"]
+    geojson = cargar_geometria(nivel["geometria"], nivel["simplificacion"])
+    ubicaciones, valores = unir_valores(geojson, cambio.index, cambio.to_numpy(), nivel["propiedad"])
+
+    fig = plantillas.instanciar("mapa", crear_plantilla_mapa, False)
+
+    escala = fig["data"][0]
+    escala.update(
+        geojson=geojson,
+        locations=ubicaciones,
+        z=valores,
+        featureidkey=f"properties.{nivel['propiedad']}",
+        zmin=zmin,
+        zmax=zmax,
+        colorscale="RdBu"
+    )
+    escala["colorbar"].update(tickvals=marcas, ticktext=etiquetas)
+
+    nombre = VARIABLES[variable]["nombre"]
+
+    if VARIABLES[variable]["porcentaje"]:
+        subtitulo = f"Nacional: {cambio_nacional:+,.2f} puntos porcentuales"
+        leyenda = "Diferencia en puntos porcentuales"
+    else:
+        subtitulo = f"Nacional: {cambio_nacional:+,.2f}%"
+        leyenda = "Cambio porcentual"
+
+    textos = [
+        leyenda,
+        f"{nombre.capitalize()} por entidad: cambio entre la consulta de {inicial} y la de {final}",
+        f"Fuente: INE ({inicial} y {final})",
+        subtitulo,
+    ]
+
+    for anotacion, texto in zip(fig["layout"]["annotations"], textos):
+        anotacion["text"] = texto
+
+    return plantillas.a_figura(fig, validar)
+
+
+def crear_plantilla_pendientes():
+    """
+    Esta función crea la plantilla de la gráfica de pendientes, sin
+    datos ni textos. Las entidades que subieron y las que bajaron son
+    un trazo cada una; el nacional va encima.
+    """
+
+    fig = go.Figure()
+
+    for nombre, color in [("Subió", "#00e676"), ("Bajó", "#ff5722")]:
+        fig.add_trace(
+            go.Scatter(
+                x=[],
+                y=[],
+                text=[],
+                name=nombre,
+                mode="lines+markers+text",
+                textposition="middle right",
+                textfont_size=11,
+                textfont_color=color,
+                line_color=color,
+                line_width=1.5,
+                marker_size=6,
+                opacity=0.8,
+                cliponaxis=False
+            )
+        )
+
+    fig.add_trace(
+        go.Scatter(
+            x=[],
+            y=[],
+            name="Nacional",
+            mode="lines+markers",
+            line_color="#FFFFFF",
+            line_width=4,
+            marker_size=10
+        )
+    )
+
+    fig.update_xaxes(
+        type="category",
+        ticks="outside",
+        ticklen=10,
+        tickcolor="#FFFFFF",
+        linecolor="#FFFFFF",
+        linewidth=2,
+        showgrid=False
+    )
+
+    fig.update_yaxes(
+        ticks="outside",
+        ticklen=10,
+        tickcolor="#FFFFFF",
+        linecolor="#FFFFFF",
+        linewidth=2,
+        gridcolor="#334756",
+        zeroline=False,
+        title_standoff=15
+    )
+
+    fig.update_layout(
+        showlegend=True,
+        legend_orientation="h",
+        legend_x=0.5,
+        legend_xanchor="center",
+        legend_y=1.045,
+        legend_yanchor="top",
+        width=1280,
+        height=1000,
+        font_family="Quicksand",
+        font_color="#FFFFFF",
+        font_size=14,
+        title_text="",
+        title_x=0.5,
+        title_y=0.975,
+        title_font_size=26,
+        margin_t=90,
+        margin_l=100,
+        margin_r=220,
+        margin_b=80,
+        paper_bgcolor="#082032",
+        plot_bgcolor="#082032",
+        annotations=[
+            dict(
+                x=0.01,
+                y=-0.085,
+                xref="paper",
+                yref="paper",
+                xanchor="left",
+                yanchor="top",
+                text="",
+            ),
+            dict(
+                x=1.01,
+                y=-0.085,
+                xref="paper",
+                yref="paper",
+                xanchor="right",
+                yanchor="top",
+                text="🧁 @lapanquecita",
+            )
+        ]
+    )
+
+    return fig
+
+
+def build_slopes(matriz, variable="participacion", validar=False):
+    """
+    Esta función crea una gráfica de pendientes con el valor de una
+    variable en cada consulta, una línea por entidad. El nombre de
+    cada entidad se pone en su último punto.
+
+    La figura se regresa como diccionario, a menos que validar sea True.
+    """
+
+    consultas = matriz["consultas"]
+    valores = matriz["valores"][variable][consultas]
+    nombre = VARIABLES[variable]["nombre"]
+
+    # Todas las líneas de cada grupo van en un solo trazo, separadas
+    # por None; así la figura tiene 3 trazos aunque haya muchas consultas.
+    subio = (valores[consultas[-1]] >= valores[consultas[0]]).to_numpy()
+    separador = np.full((len(valores), 1), None, dtype=object)
+
+    y = np.hstack([valores.to_numpy(dtype=object), separador])
+    x = np.tile(np.array(consultas + [None], dtype=object), (len(valores), 1))
+    textos = np.full(y.shape, "", dtype=object)
+    textos[:, -2] = matriz["entidades"].to_numpy()
+
+    fig = plantillas.instanciar("pendientes", crear_plantilla_pendientes)
+
+    for traza, grupo in zip(fig["data"], [subio, ~subio]):
+        traza.update(x=x[grupo].ravel().tolist(), y=y[grupo].ravel().tolist(), text=textos[grupo].ravel().tolist())
+
+    fig["data"][2].update(x=consultas, y=matriz["nacional"].loc[consultas, variable].tolist())
+
+    fig["layout"]["yaxis"]["ticksuffix"] = "%" if VARIABLES[variable]["porcentaje"] else ""
+    fig["layout"]["yaxis"]["title"] = {"text": nombre.capitalize()}
+    fig["layout"]["title"]["text"] = f"{nombre.capitalize()} por entidad en las consultas populares en México"
+    fig["layout"]["annotations"][0]["text"] = f"Fuente: INE ({', '.join(consultas)})"
+
+    return plantillas.a_figura(fig, validar)
+
+
+def crear_plantilla_dispersion():
+    """
+    Esta función crea la plantilla de la gráfica de dispersión, sin
+    datos ni textos. La línea de identidad es la primera figura del
+    layout y build_scatter la ajusta al rango de los datos.
+    """
+
+    fig = go.Figure()
+
+    fig.add_trace(
+        go.Scatter(
+            x=[],
+            y=[],
+            text=[],
+            mode="markers+text",
+            textposition="top center",
+            textfont_size=11,
+            marker_color="#00e676",
+            marker_line_color="#FFFFFF",
+            marker_line_width=1,
+            marker_sizemode="area",
+            opacity=0.85,
+            showlegend=False,
+            cliponaxis=False
+        )
+    )
+
+    for eje in [fig.update_xaxes, fig.update_yaxes]:
+        eje(
+            ticks="outside",
+            ticklen=10,
+            tickcolor="#FFFFFF",
+            linecolor="#FFFFFF",
+            linewidth=2,
+            gridcolor="#334756",
+            zeroline=False,
+            title_standoff=15
+        )
+
+    fig.add_shape(
+        type="line",
+        x0=0,
+        y0=0,
+        x1=1,
+        y1=1,
+        line_color="#FFFFFF",
+        line_width=1.5,
+        line_dash="dash",
+        layer="below",
+        visible=False
+    )
+
+    fig.update_layout(
+        width=1280,
+        height=1000,
+        font_family="Quicksand",
+        font_color="#FFFFFF",
+        font_size=14,
+        title_text="",
+        title_x=0.5,
+        title_y=0.975,
+        title_font_size=26,
+        margin_t=90,
+        margin_l=120,
+        margin_r=40,
+        margin_b=120,
+        paper_bgcolor="#082032",
+        plot_bgcolor="#082032",
+        annotations=[
+            dict(
+                x=0.01,
+                y=-0.11,
+                xref="paper",
+                yref="paper",
+                xanchor="left",
+                yanchor="top",
+                text="",
+            ),
+            dict(
+                x=1.01,
+                y=-0.11,
+                xref="paper",
+                yref="paper",
+                xanchor="right",
+                yanchor="top",
+                text="🧁 @lapanquecita",
+            )
+        ]
+    )
+
+    return fig
+
+
+def build_scatter(matriz, x=None, y=None, validar=False):
+    """
+    Esta función crea una gráfica de dispersión de dos columnas de la
+    matriz, cada una indicada como (variable, consulta). Por defecto
+    compara la participación de la primera consulta con la de la última.
+
+    El área de cada punto es proporcional a la lista nominal de la
+    entidad. Si ambas columnas son la misma variable se dibuja la
+    línea de identidad: las entidades arriba de ella subieron.
+
+    La figura se regresa como diccionario, a menos que validar sea True.
+    """
+
+    x = x or ("participacion", matriz["consultas"][0])
+    y = y or ("participacion", matriz["consultas"][-1])
+
+    valores = matriz["valores"]
+    lista_nominal = valores["lista_nominal"][y[1]].to_numpy(dtype=np.float64)
+
+    fig = plantillas.instanciar("dispersion", crear_plantilla_dispersion)
+
+    fig["data"][0].update(
+        x=valores[x].to_numpy(),
+        y=valores[y].to_numpy(),
+        text=matriz["entidades"].tolist(),
+    )
+
+    # El punto más grande mide 60 px de diámetro.
+    fig["data"][0]["marker"].update(size=lista_nominal, sizeref=2 * lista_nominal.max() / 60 ** 2, sizemin=4)
+
+    for eje, (variable, consulta) in [("xaxis", x), ("yaxis", y)]:
+        fig["layout"][eje]["title"] = {"text": f"{VARIABLES[variable]['nombre'].capitalize()} en {consulta}"}
+        fig["layout"][eje]["ticksuffix"] = "%" if VARIABLES[variable]["porcentaje"] else ""
+
+    if x[0] == y[0]:
+        minimo = float(np.nanmin(valores[[x, y]].to_numpy()))
+        maximo = float(np.nanmax(valores[[x, y]].to_numpy()))
+
+        fig["layout"]["shapes"][0].update(x0=minimo, y0=minimo, x1=maximo, y1=maximo, visible=True)
+
+    fig["layout"]["title"]["text"] = (
+        f"{VARIABLES[y[0]]['nombre'].capitalize()} en {y[1]} contra "
+        f"{VARIABLES[x[0]]['nombre']} en {x[1]} por entidad"
+    )
+    fig["layout"]["annotations"][0]["text"] = f"Fuente: INE ({', '.join(dict.fromkeys([x[1], y[1]]))})"
+
+    return plantillas.a_figura(fig, validar)
+
+
+def construir_graficas(matriz, variable="participacion", graficas=GRAFICAS):
+    """
+    Esta función construye las figuras de comparación pedidas a partir
+    de la misma matriz y las regresa en un diccionario.
+    """
+
+    constructores = {
+        "delta": lambda: build_delta_map(matriz, variable),
+        "pendientes": lambda: build_slopes(matriz, variable),
+        "dispersion": lambda: build_scatter(
+            matriz, (variable, matriz["consultas"][0]), (variable, matriz["consultas"][-1])),
+    }
+
+    return {grafica: constructores[grafica]() for grafica in graficas}
+
+
+def create_comparison(matriz, variable="participacion", graficas=GRAFICAS):
+    """
+    Esta función renderiza las gráficas de comparación en una sola
+    llamada a kaleido y regresa un diccionario con las imágenes PNG.
+    """
+
+    return renderizador.renderizar(construir_graficas(matriz, variable, graficas))
@@ -0,0 +1,67 @@
+"""
+Este módulo guarda la configuración de las consultas y de los
+niveles del mapa.
+
+Solo importa os, así que leerlo es inmediato; lo usan los comandos
+que no necesitan pandas ni plotly (ver cli.py).
+"""
+
+import os
+
+
+# Configuración de cada consulta. El rango y las marcas de la
+# barra de color se calculan a partir de los datos.
+CONSULTAS = {
+    "2021": {
+        "anio": 2021,
+        "archivo": "./data/2021.json",
+        "descripcion": "la consulta popular del año 2021",
+        "salida_mapa": "./2021-1.png",
+        "salida_barras": "./2021-2.png",
+    },
+    "2022": {
+        "anio": 2022,
+        "archivo": "./data/2022.json",
+        "descripcion": "la consulta popular del año 2022",
+        "salida_mapa": "./2022-1.png",
+        "salida_barras": "./2022-2.png",
+    },
+}
+
+
+# Geometría de cada nivel del mapa. Los archivos de distritos y
+# municipios no vienen en el repositorio, se descargan del INE.
+NIVELES_MAPA = {
+    "entidad": {
+        "geometria": "./mexico.json",
+        "propiedad": "CVE_ENT",
+        "simplificacion": "media",
+    },
+    "distrito": {
+        "geometria": "./distritos.json",
+        "propiedad": "CLAVE",
+        "simplificacion": "baja",
+    },
+    "municipio": {
+        "geometria": "./municipios.json",
+        "propiedad": "CVEGEO",
+        "simplificacion": "baja",
+    },
+}
+
+
+# Mapa base de plotly, el mismo TopoJSON que descarga plotly.js.
+# El rasterizador lo usa para pintar la tierra de los países vecinos.
+# No viene en el repositorio; se descarga una vez a ./cache con
+# python rasterizador.py antes de dibujar con PIL.
+MAPA_BASE = os.environ.get("MAPA_BASE", "./cache/world_110m.json")
+URL_MAPA_BASE = "https://cdn.plot.ly/un/world_110m.json"
+
+
+# Con qué se rasterizan el mapa y la tabla: "kaleido" (Chromium) o
+# "pil", que los dibuja directamente y no necesita un navegador (ver
+# rasterizador.py y tablas.py). Se puede cambiar por consulta con
+# config["motor"]; la tabla usa el motor del mapa si no se indica otro.
+MOTORES_MAPA = ["kaleido", "pil"]
+MOTOR_MAPA = os.environ.get("MOTOR_MAPA", "kaleido")
+MOTOR_TABLA = os.environ.get("MOTOR_TABLA", MOTOR_MAPA)
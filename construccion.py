@@ -0,0 +1,127 @@
+"""
+Este módulo decide qué gráficas hay que volver a generar.
+
+Cada salida tiene una huella calculada a partir de sus entradas:
+el hash del archivo de datos, el hash de la geometría del nivel que
+se dibuja (con su simplificación) y la figura completa de plotly
+(colores, marcas, títulos y valores). Las huellas se guardan en un
+manifiesto y una salida solo se vuelve a generar si su huella
+cambió o si el archivo ya no existe.
+"""
+
+import hashlib
+import json
+import os
+
+import plotly.io as pio
+
+from configuracion import MOTOR_MAPA, MOTOR_TABLA, NIVELES_MAPA
+from datos import CARPETA_CACHE, calcular_hash, obtener_hash
+
+
+RUTA_MANIFIESTO = os.path.join(CARPETA_CACHE, "manifiesto.json")
+
+
+def huella(*partes):
+    """
+    Esta función combina varias cadenas en un solo hash.
+    """
+
+    sha = hashlib.sha256()
+
+    for parte in partes:
+        sha.update(parte.encode("utf-8"))
+        sha.update(b"\0")
+
+    return sha.hexdigest()
+
+
+def huella_figura(fig):
+    """
+    Esta función calcula la huella de una figura de plotly, ya sea
+    una go.Figure o un diccionario hecho con una plantilla.
+    """
+
+    return huella(pio.to_json(fig, validate=False))
+
+
+def huellas_consulta(config, figuras):
+    """
+    Esta función calcula la huella de cada gráfica de una consulta.
+
+    Recibe un diccionario con las figuras ya construidas ("mapa",
+    "tabla" y "barras") y regresa otro con la huella de cada una
+    y la de la imagen compuesta.
+    """
+
+    datos = obtener_hash(config["archivo"])
+    huellas = dict()
+
+    motores = {"mapa": MOTOR_MAPA, "tabla": MOTOR_TABLA}
+
+    for nombre, fig in figuras.items():
+        partes = [datos, huella_figura(fig)]
+
+        # Solo el mapa depende de la geometría, la del nivel que se dibuja.
+        if nombre == "mapa":
+            nivel = NIVELES_MAPA[config.get("nivel", "entidad")]
+            partes.extend([calcular_hash(nivel["geometria"]), nivel["simplificacion"]])
+
+        # El mapa y la tabla dependen del motor que los dibuja.
+        # Las huellas hechas con kaleido no cambian.
+        motor = config.get("motor", motores.get(nombre, "kaleido"))
+
+        if nombre in motores and motor != "kaleido":
+            partes.append(motor)
+
+        huellas[nombre] = huella(*partes)
+
+    if "mapa" in huellas and "tabla" in huellas:
+        huellas["compuesta"] = huella(huellas["mapa"], huellas["tabla"])
+
+    return huellas
+
+
+def cargar_manifiesto(ruta=RUTA_MANIFIESTO):
+    """
+    Esta función carga el manifiesto con las huellas de la última
+    construcción. Si no existe regresa uno vacío.
+    """
+
+    if not os.path.exists(ruta):
+        return dict()
+
+    with open(ruta, "r", encoding="utf-8") as archivo:
+        return json.load(archivo)
+
+
+def guardar_manifiesto(manifiesto, ruta=RUTA_MANIFIESTO):
+    """
+    Esta función guarda el manifiesto en disco.
+    """
+
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(manifiesto, archivo, indent=4, sort_keys=True)
+
+    os.replace(temporal, ruta)
+
+
+def esta_al_dia(manifiesto, salida, valor):
+    """
+    Esta función indica si la salida existe y fue generada
+    con las mismas entradas.
+    """
+
+    return manifiesto.get(os.path.abspath(salida)) == valor and os.path.exists(salida)
+
+
+def registrar(manifiesto, salida, valor):
+    """
+    Esta función guarda la huella con la que se generó la salida.
+    """
+
+    manifiesto[os.path.abspath(salida)] = valor
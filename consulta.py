@@ -0,0 +1,802 @@
+"""
+Este módulo genera las gráficas de cualquier consulta popular.
+
+Cada consulta se describe con una entrada en CONSULTAS (ver
+configuracion.py). Todas las consultas que se pidan se generan en
+el mismo proceso, así que la geometría, los datos y la sesión de
+kaleido se cargan una sola vez.
+
+Uso:
+
+    python consulta.py 2021 2022 [--depurar] [--forzar]
+                       [--cprofile=<etapa>] [--tracemalloc=<etapa>] [--perfil=<archivo>]
+
+Las etapas que se pueden perfilar están en perfil.py.
+"""
+
+import math
+import sys
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+import construccion
+import perfil
+import plantillas
+import renderizador
+from configuracion import CONSULTAS, MOTOR_MAPA, MOTOR_TABLA, NIVELES_MAPA
+from datos import cargar_consulta
+from geometria import cargar_geometria, unir_valores
+
+
+# A partir de este número de polígonos el mapa se dibuja con PIL
+# en lugar de mandar todo el GeoJSON a kaleido.
+LIMITE_VECTORIAL = 500
+
+
+def calcular_marcas(valores, cantidad=10):
+    """
+    Esta función calcula el rango y las marcas de la barra de color.
+
+    Busca un paso "redondo" (1, 2, 2.5, 3 o 5 por una potencia de 10)
+    que deje alrededor de la cantidad de marcas indicada y ajusta
+    el rango a múltiplos de ese paso.
+    """
+
+    minimo = float(valores.min())
+    maximo = float(valores.max())
+
+    bruto = max(maximo - minimo, 1e-9) / cantidad
+    potencia = 10 ** math.floor(math.log10(bruto))
+
+    for factor in (1, 2, 2.5, 3, 5, 10):
+        paso = factor * potencia
+        if paso >= bruto:
+            break
+
+    zmin = math.floor(minimo / paso) * paso
+    zmax = math.ceil(maximo / paso) * paso
+
+    marcas = np.round(np.arange(zmin, zmax + paso / 2, paso), 6)
+
+    # Usamos solo los decimales que necesita el paso.
+    decimales = 0
+
+    while abs(round(paso, decimales) - paso) > 1e-9 and decimales < 3:
+        decimales += 1
+
+    return marcas, zmin, zmax, decimales
+
+
+def cargar_valores_nivel(config, nivel):
+    """
+    Esta función regresa una tabla con la clave y la participación
+    de cada zona del nivel indicado.
+
+    Para las entidades usamos el JSON del PREP. Para los demás niveles
+    la consulta debe indicar en "valores_<nivel>" un CSV con las
+    columnas clave y participacion.
+    """
+
+    if nivel == "entidad":
+        return cargar_consulta(config["archivo"], config.get("validar_datos", True))["entidades"][["clave", "participacion"]]
+
+    llave = f"valores_{nivel}"
+
+    if llave not in config:
+        raise ValueError(f"La consulta {config['anio']} no tiene datos a nivel {nivel}.")
+
+    return pd.read_csv(config[llave], dtype={"clave": "string"})[["clave", "participacion"]]
+
+
+def crear_plantilla_mapa(raster=False):
+    """
+    Esta función crea la plantilla del mapa: todo el formato de la
+    figura, sin datos ni textos.
+
+    Con raster=True el mapa es una imagen de fondo que se dibuja con
+    PIL (ver agregar_mapa_raster) y la barra de color sale de un
+    trazo invisible con la misma escala.
+    """
+
+    colorbar = dict(
+        x=0.03,
+        y=0.5,
+        ypad=50,
+        ticks="outside",
+        outlinewidth=2,
+        outlinecolor="#FFFFFF",
+        tickvals=[],
+        ticktext=[],
+        tickwidth=3,
+        tickcolor="#FFFFFF",
+        ticklen=10,
+        tickfont_size=20
+    )
+
+    fig = go.Figure()
+
+    if raster:
+        fig.add_layout_image(
+            source="",
+            xref="paper",
+            yref="paper",
+            x=0,
+            y=1,
+            sizex=1,
+            sizey=1,
+            sizing="stretch",
+            layer="below"
+        )
+
+        fig.add_trace(
+            go.Scatter(
+                x=[None],
+                y=[None],
+                mode="markers",
+                showlegend=False,
+                hoverinfo="skip",
+                marker=dict(
+                    colorscale="portland",
+                    cmin=0,
+                    cmax=1,
+                    color=[0],
+                    showscale=True,
+                    colorbar=colorbar
+                )
+            )
+        )
+
+        fig.update_xaxes(visible=False, range=[0, 1])
+        fig.update_yaxes(visible=False, range=[0, 1])
+        fig.update_layout(plot_bgcolor="rgba(0, 0, 0, 0)")
+    else:
+        fig.add_traces(
+            go.Choropleth(
+                colorscale="portland",
+                colorbar=colorbar,
+                marker_line_color="#FFFFFF",
+                marker_line_width=1.0
+            )
+        )
+
+        fig.update_geos(
+            fitbounds="geojson",
+            showocean=True,
+            oceancolor="#082032",
+            showcountries=False,
+            framecolor="#FFFFFF",
+            framewidth=2,
+            showlakes=False,
+            coastlinewidth=0,
+            landcolor="#1C0A00"
+        )
+
+    # Los textos de las primeras 4 anotaciones los pone build_map.
+    fig.update_layout(
+        font_family="Quicksand",
+        font_color="#FFFFFF",
+        margin={"r": 40, "t": 50, "l": 40, "b": 30},
+        width=1280,
+        height=720,
+        paper_bgcolor="#334756",
+        annotations=[
+            dict(
+                x=0.0275,
+                y=0.45,
+                textangle=-90,
+                xanchor="center",
+                yanchor="middle",
+                text="",
+                font_size=16
+            ),
+            dict(
+                x=0.5,
+                y=1.0,
+                xanchor="center",
+                yanchor="top",
+                text="",
+                font_size=24
+            ),
+            dict(
+                x=0.01,
+                y=-0.03,
+                xanchor="left",
+                yanchor="top",
+                text="",
+                font_size=22
+            ),
+            dict(
+                x=0.5,
+                y=-0.03,
+                xanchor="center",
+                yanchor="top",
+                text="",
+                font_size=22
+            ),
+            dict(
+                x=1.01,
+                y=-0.03,
+                xanchor="right",
+                yanchor="top",
+                text="🧁 @lapanquecita",
+                font_size=22
+            )
+        ]
+    )
+
+    return fig
+
+
+def build_map(config, validar=False):
+    """
+    Esta función crea un mapa Choropleth con la información
+    de participación por entidad, distrito o municipio.
+
+    Si la geometría tiene demasiados polígonos, el mapa se dibuja
+    con PIL y se pone como imagen de fondo de la figura, así kaleido
+    solo tiene que dibujar la barra de color y los textos.
+
+    La figura se regresa como diccionario, a menos que validar sea True.
+    """
+
+    nombre_nivel = config.get("nivel", "entidad")
+    nivel = NIVELES_MAPA[nombre_nivel]
+
+    # Cargamos la consulta ya procesada.
+    consulta = cargar_consulta(config["archivo"], config.get("validar_datos", True))
+
+    # Obtenemos el total nacional.
+    total_nacional = consulta["nacional"]["total"]
+    participacion_nacional = consulta["nacional"]["participacion"]
+
+    subtitulo = f"Nacional: {participacion_nacional:,.2f}% ({total_nacional:,.0f} votos)"
+
+    df = cargar_valores_nivel(config, nombre_nivel)
+
+    marcas, zmin, zmax, decimales = calcular_marcas(df["participacion"])
+    etiquetas = list()
+
+    for marca in marcas:
+        etiquetas.append(f"{marca:,.{decimales}f}%")
+
+    # Cargamos la geometría simplificada para 1280x720.
+    geojson = cargar_geometria(nivel["geometria"], nivel["simplificacion"])
+
+    # Unimos los valores con el GeoJSON usando la clave de cada zona.
+    ubicaciones, valores = unir_valores(
+        geojson, df["clave"], df["participacion"], nivel["propiedad"])
+
+    raster = len(ubicaciones) > LIMITE_VECTORIAL
+
+    fig = plantillas.instanciar(
+        "mapa-raster" if raster else "mapa", crear_plantilla_mapa, raster)
+
+    if raster:
+        agregar_mapa_raster(fig, geojson, valores, zmin, zmax)
+
+        escala = fig["data"][0]["marker"]
+        escala.update(cmin=zmin, cmax=zmax, color=[zmin])
+    else:
+        escala = fig["data"][0]
+        escala.update(
+            geojson=geojson,
+            locations=ubicaciones,
+            z=valores,
+            featureidkey=f"properties.{nivel['propiedad']}",
+            zmin=zmin,
+            zmax=zmax
+        )
+
+    escala["colorbar"].update(tickvals=marcas, ticktext=etiquetas)
+
+    textos = [
+        f"Proporción relativa al padrón electoral por {nombre_nivel}",
+        f"Distribución por {nombre_nivel} del porcentaje de participación en {config['descripcion']} en México",
+        f"Fuente: INE ({config['anio']})",
+        subtitulo,
+    ]
+
+    for anotacion, texto in zip(fig["layout"]["annotations"], textos):
+        anotacion["text"] = texto
+
+    return plantillas.a_figura(fig, validar)
+
+
+def agregar_mapa_raster(fig, geojson, valores, zmin, zmax):
+    """
+    Esta función dibuja el mapa con PIL y lo pone como imagen de
+    fondo de una figura hecha con la plantilla "mapa-raster".
+    """
+
+    # PIL solo se necesita en este camino, así que lo importamos aquí.
+    from PIL import ImageDraw
+
+    from rasterizador import a_uri, pintar_choropleth
+
+    # El área de graficación mide 1280x720 menos los márgenes.
+    ancho = 1280 - 40 - 40
+    alto = 720 - 50 - 30
+
+    imagen = pintar_choropleth(geojson, valores, zmin, zmax, ancho=ancho, alto=alto)
+
+    # Dibujamos el marco blanco que pone plotly en los mapas.
+    ImageDraw.Draw(imagen).rectangle((0, 0, ancho - 1, alto - 1), outline="#FFFFFF", width=2)
+
+    fig["layout"]["images"][0]["source"] = a_uri(imagen)
+
+
+def create_map(config, depurar=False, fig=None):
+    """
+    Esta función renderiza el mapa. Si no recibe la figura la construye.
+
+    Regresa la imagen PNG en bytes. Si depurar es True también
+    la guarda en ./1.png. Con config["motor"] igual a "pil" el mapa
+    se dibuja con rasterizador.py en lugar de kaleido.
+    """
+
+    if fig is None:
+        fig = build_map(config)
+
+    if config.get("motor", MOTOR_MAPA) == "pil":
+        # PIL solo se necesita en este camino, así que lo importamos aquí.
+        from rasterizador import renderizar_mapa
+
+        with perfil.etapa("rasterizar", "mapa"):
+            imagen = renderizar_mapa(fig)
+    else:
+        imagen = renderizador.renderizar({"mapa": fig})["mapa"]
+
+    if depurar:
+        with open("./1.png", "wb") as archivo:
+            archivo.write(imagen)
+
+    return imagen
+
+
+def crear_plantilla_tabla():
+    """
+    Esta función crea la plantilla de las 2 tablas, cada una
+    con espacio para 16 entidades de México.
+    """
+
+    # Creamos un lienzo con dos subplots de tipo Table.
+    fig = make_subplots(
+        rows=1,
+        cols=2,
+        horizontal_spacing=0.03,
+        specs=[
+            [
+                {"type": "table"},
+                {"type": "table"}
+            ]
+        ]
+    )
+
+    # La primera tabla cubre las primers 16 entidades.
+    fig.add_trace(
+        go.Table(
+            columnwidth=[110, 80],
+            header=dict(
+                values=[
+                    "<b>Entidad</b>",
+                    "<b>Votos</b>",
+                    "<b>Participación ↓</b>"
+                ],
+                font_color="#FFFFFF",
+                fill_color="#ff5722",
+                align="center",
+                height=32,
+                line_width=0.8),
+            cells=dict(
+                values=[
+                    [],
+                    [],
+                    []
+                ],
+                fill_color="#082032",
+                height=32,
+                suffix=["", "", "%"],
+                format=["", ",", ".2f"],
+                line_width=0.8,
+                align=["left", "center"]
+            )
+        ), col=1, row=1
+    )
+
+    # La segunda tabla cubre las últimas 16 entidades.
+    fig.add_trace(
+        go.Table(
+            columnwidth=[110, 80],
+            header=dict(
+                values=[
+                    "<b>Entidad</b>",
+                    "<b>Votos</b>",
+                    "<b>Participación ↓</b>"
+                ],
+                font_color="#FFFFFF",
+                fill_color="#ff5722",
+                align="center",
+                height=32,
+                line_width=0.8),
+            cells=dict(
+                values=[
+                    [],
+                    [],
+                    []
+                ],
+                fill_color="#082032",
+                height=32,
+                suffix=["", "", "%"],
+                format=["", ",", ".2f"],
+                line_width=0.8,
+                align=["left", "center"]
+            )
+        ), col=2, row=1
+    )
+
+    fig.update_layout(
+        width=1280,
+        height=570,
+        font_family="Quicksand",
+        font_color="#FFFFFF",
+        font_size=20,
+        title="",
+        title_x=0.5,
+        title_y=0.95,
+        margin_t=0,
+        margin_l=40,
+        margin_r=40,
+        margin_b=0,
+        title_font_size=26,
+        paper_bgcolor="#334756"
+    )
+
+    return fig
+
+
+def build_table(config, validar=False):
+    """
+    Esta función crea 2 tablas, cada una contiene
+    información de 16 entidades de México.
+
+    La figura se regresa como diccionario, a menos que validar sea True.
+    """
+
+    # Cargamos la consulta ya procesada.
+    consulta = cargar_consulta(config["archivo"], config.get("validar_datos", True))
+
+    df = consulta["entidades"][["participacion", "total"]].copy()
+
+    # ordenamos por participación de mayor a menor.
+    df.sort_values("participacion", ascending=False, inplace=True)
+
+    fig = plantillas.instanciar("tabla", crear_plantilla_tabla)
+
+    # La primera tabla lleva las primeras 16 entidades y la segunda el resto.
+    for traza, renglones in zip(fig["data"], [df[:16], df[16:]]):
+        traza["cells"]["values"] = [
+            renglones.index.tolist(),
+            renglones["total"].to_numpy(),
+            renglones["participacion"].to_numpy()
+        ]
+
+    return plantillas.a_figura(fig, validar)
+
+
+def create_table(config, depurar=False, fig=None):
+    """
+    Esta función renderiza las tablas. Si no recibe la figura la construye.
+
+    Regresa la imagen PNG en bytes. Si depurar es True también
+    la guarda en ./2.png. Con config["motor"] igual a "pil" la tabla
+    se dibuja con tablas.py en lugar de kaleido.
+    """
+
+    if fig is None:
+        fig = build_table(config)
+
+    if config.get("motor", MOTOR_TABLA) == "pil":
+        # PIL solo se necesita en este camino, así que lo importamos aquí.
+        from tablas import renderizar_tabla
+
+        with perfil.etapa("rasterizar", "tabla"):
+            imagen = renderizar_tabla(fig)
+    else:
+        imagen = renderizador.renderizar({"tabla": fig})["tabla"]
+
+    if depurar:
+        with open("./2.png", "wb") as archivo:
+            archivo.write(imagen)
+
+    return imagen
+
+
+def combine_images(mapa, tabla, ruta):
+    """
+    Esta función va a combianr nuestro mapa y tabla en una sola imagen
+    y la guarda en la ruta indicada.
+    """
+
+    from PIL import Image
+
+    with perfil.etapa("componer", ruta):
+        # Abrimos las imágenes directamente desde memoria.
+        image1 = Image.open(BytesIO(mapa))
+        image2 = Image.open(BytesIO(tabla))
+
+        # Calculos el ancho y el alto de la nueva imagen.
+        result_width = image1.width
+        result_height = image1.height + image2.height
+
+        # Copiamos los pixeles de nuestras imágenes en nuestro nueov lienzo.
+        result = Image.new("RGB", (result_width, result_height))
+        result.paste(im=image1, box=(0, 0))
+        result.paste(im=image2, box=(0, image1.height))
+
+    # Guardamos la nueva imagen.
+    with perfil.etapa("guardar", ruta):
+        result.save(ruta)
+
+
+def crear_plantilla_barras():
+    """
+    Esta función crea la plantilla de la gráfica de barras
+    apiladas, sin datos ni textos.
+    """
+
+    # Vamos a crear 3 gráficas de barra apiladas.
+    # Una sera para "SÍ", otra para "NO" y la últim para votos nulos.
+    fig = go.Figure()
+
+    fig.add_trace(
+        go.Bar(
+            x=[],
+            y=[],
+            text=[],
+            textfont_color="#FFFFFF",
+            name="A favor",
+            orientation="h",
+            marker_color="#558b2f",
+            marker_line_width=0
+        )
+    )
+
+    fig.add_trace(
+        go.Bar(
+            x=[],
+            y=[],
+            text=[],
+            textfont_color="#FFFFFF",
+            name="En contra",
+            orientation="h",
+            marker_color="#ff5722",
+            marker_line_width=0
+        )
+    )
+
+    fig.add_trace(
+        go.Bar(
+            x=[],
+            y=[],
+            text=[],
+            textfont_color="#FFFFFF",
+            name="Nulos",
+            orientation="h",
+            marker_color="#9c27b0",
+            marker_line_width=0
+        )
+    )
+
+    fig.update_xaxes(
+        title="Proporción de la respuesta",
+        ticksuffix="%",
+        range=[0, 100],
+        ticks="outside",
+        ticklen=10,
+        zeroline=False,
+        title_standoff=15,
+        tickcolor="#FFFFFF",
+        linecolor="#FFFFFF",
+        linewidth=2,
+        nticks=11
+    )
+
+    fig.update_yaxes(
+        ticks="outside",
+        tickfont_size=14,
+        ticklen=10,
+        title_standoff=8,
+        tickcolor="#FFFFFF",
+        linewidth=2,
+        nticks=32
+    )
+
+    fig.update_layout(
+        showlegend=True,
+        legend_traceorder="normal",
+        legend_orientation="h",
+        legend_x=0.5,
+        legend_xanchor="center",
+        legend_y=1.045,
+        legend_yanchor="top",
+        barmode="stack",
+        width=1280,
+        height=1000,
+        font_family="Quicksand",
+        font_color="#FFFFFF",
+        font_size=14,
+        title_text="",
+        title_x=0.5,
+        title_y=0.975,
+        margin_t=90,
+        margin_l=150,
+        margin_r=40,
+        margin_b=80,
+        title_font_size=26,
+        paper_bgcolor="#082032",
+        plot_bgcolor="#082032",
+        annotations=[
+            dict(
+                x=0.01,
+                y=-0.085,
+                xref="paper",
+                yref="paper",
+                xanchor="left",
+                yanchor="top",
+                text="",
+            ),
+            dict(
+                x=1.01,
+                y=-0.085,
+                xref="paper",
+                yref="paper",
+                xanchor="right",
+                yanchor="top",
+                text="🧁 @lapanquecita",
+            )
+        ]
+    )
+
+    return fig
+
+
+def build_bars(config, validar=False):
+    """
+    Esta función crea una gráfica de barras apiladas para
+    mostrar la distribución de las respuestas.
+
+    La figura se regresa como diccionario, a menos que validar sea True.
+    """
+
+    # Cargamos la consulta ya procesada.
+    consulta = cargar_consulta(config["archivo"], config.get("validar_datos", True))
+
+    df = consulta["entidades"][["si", "no", "nulo"]]
+
+    # Redondeamos a dos decimales.
+    df = df.round(decimals=2)
+
+    # ordenamos por "SÍ" de mayor a menor.
+    df.sort_values("si", inplace=True)
+
+    fig = plantillas.instanciar("barras", crear_plantilla_barras)
+
+    # Las barras de la plantilla están en el orden SÍ, NO y nulos.
+    for traza, columna in zip(fig["data"], ["si", "no", "nulo"]):
+        traza.update(x=df[columna].to_numpy(), y=df.index.tolist(), text=df[columna].to_numpy())
+
+    fig["layout"]["title"]["text"] = f"Distribución por entidad de las respuestas en {config['descripcion']} en México"
+    fig["layout"]["annotations"][0]["text"] = f"Fuente: INE ({config['anio']})"
+
+    return plantillas.a_figura(fig, validar)
+
+
+def create_bars(config, fig=None):
+    """
+    Esta función renderiza la gráfica de barras. Si no recibe
+    la figura la construye.
+
+    Regresa la imagen PNG en bytes.
+    """
+
+    if fig is None:
+        fig = build_bars(config)
+
+    return renderizador.renderizar({"barras": fig})["barras"]
+
+
+def generar_consulta(config, manifiesto, depurar=False, forzar=False):
+    """
+    Esta función genera las gráficas de una consulta.
+
+    Solo se renderizan las salidas cuyas entradas cambiaron desde
+    la última vez, a menos que forzar sea True.
+    """
+
+    # Cargamos la consulta antes de construir las figuras, así su
+    # tiempo no se cuenta como parte de la primera figura.
+    cargar_consulta(config["archivo"], config.get("validar_datos", True))
+
+    constructores = {"mapa": build_map, "tabla": build_table, "barras": build_bars}
+    figuras = dict()
+
+    for nombre, constructor in constructores.items():
+        with perfil.etapa("figura", f"{config['anio']}-{nombre}"):
+            figuras[nombre] = constructor(config)
+
+    huellas = construccion.huellas_consulta(config, figuras)
+
+    # La imagen compuesta se omite si el mapa y la tabla no cambiaron.
+    if forzar or depurar or not construccion.esta_al_dia(
+            manifiesto, config["salida_mapa"], huellas["compuesta"]):
+
+        mapa = create_map(config, depurar, figuras["mapa"])
+        tabla = create_table(config, depurar, figuras["tabla"])
+        combine_images(mapa, tabla, config["salida_mapa"])
+
+        construccion.registrar(manifiesto, config["salida_mapa"], huellas["compuesta"])
+        construccion.guardar_manifiesto(manifiesto)
+    else:
+        print(f"{config['salida_mapa']} está al día.")
+
+    if forzar or not construccion.esta_al_dia(
+            manifiesto, config["salida_barras"], huellas["barras"]):
+
+        imagen = create_bars(config, figuras["barras"])
+
+        with perfil.etapa("guardar", config["salida_barras"]):
+            with open(config["salida_barras"], "wb") as archivo:
+                archivo.write(imagen)
+
+        construccion.registrar(manifiesto, config["salida_barras"], huellas["barras"])
+        construccion.guardar_manifiesto(manifiesto)
+    else:
+        print(f"{config['salida_barras']} está al día.")
+
+
+def generar(claves, depurar=False, forzar=False):
+    """
+    Esta función genera las gráficas de las consultas indicadas
+    usando una sola sesión de kaleido.
+    """
+
+    manifiesto = construccion.cargar_manifiesto()
+
+    with renderizador.sesion():
+        for clave in claves:
+            generar_consulta(CONSULTAS[clave], manifiesto, depurar, forzar)
+
+    print(renderizador.reporte())
+    print(perfil.reporte())
+
+    ruta = perfil.guardar_perfil()
+
+    if ruta:
+        print(f"Perfil guardado en {ruta}")
+
+
+if __name__ == "__main__":
+
+    argumentos = [argumento for argumento in sys.argv[1:] if not argumento.startswith("--")]
+
+    # Con --depurar también guardamos las imágenes intermedias.
+    depurar = "--depurar" in sys.argv[1:]
+
+    # Con --forzar regeneramos todo aunque las entradas no hayan cambiado.
+    forzar = "--forzar" in sys.argv[1:]
+
+    # Con --cprofile=<etapa>, --tracemalloc=<etapa> y --perfil=<archivo>
+    # perfilamos una etapa o guardamos los registros de cada etapa.
+    valores = dict(
+        argumento[2:].split("=", 1) for argumento in sys.argv[1:]
+        if argumento.startswith("--") and "=" in argumento
+    )
+
+    perfil.configurar(valores.get("cprofile"), valores.get("tracemalloc"), valores.get("perfil"))
+
+    # Si no se indica ninguna consulta, generamos todas.
+    generar(argumentos or list(CONSULTAS), depurar, forzar)
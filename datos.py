@@ -0,0 +1,255 @@
+"""
+Este módulo se encarga de cargar los archivos JSON del PREP.
+
+Cada archivo se lee una sola vez, se valida (ver validacion.py) y se
+normaliza en un dataset Parquet (ver columnar.py). A partir de ese
+dataset armamos la tabla con una fila por entidad que usan las
+gráficas. El dataset se guarda en disco y la tabla en memoria, así
+que las siguientes ejecuciones no vuelven a leer el JSON.
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+import columnar
+import perfil
+import validacion
+from configuracion import NIVELES_MAPA
+
+
+# Carpeta donde guardamos las tablas ya procesadas.
+CARPETA_CACHE = "./cache"
+
+# Tipos de cada columna de la tabla de entidades.
+COLUMNAS = {
+    "id_nodo": "int16",
+    "id_mapa": "string",
+    "participacion": "float64",
+    "total": "int64",
+    "lista_nominal": "int64",
+    "si": "float64",
+    "no": "float64",
+    "nulo": "float64",
+}
+
+# Aquí guardamos las consultas que ya cargamos en este proceso.
+_memoria = dict()
+
+
+def limpiar_nombres(nombres):
+    """
+    Esta función limpia los nombres de las entidades para que
+    coincidan con los que usa el GeoJSON.
+
+    Trabaja sobre todos los nombres a la vez y regresa un pd.Index.
+    validacion.limpiar_nombre aplica la misma regla a un solo nombre.
+    """
+
+    nombres = pd.Series(nombres, dtype="string").str.title().str.replace("De", "de")
+    nombres = nombres.replace("México", "Estado de México")
+
+    return pd.Index(nombres, name="entidad")
+
+
+def crear_claves(id_nodo):
+    """
+    Esta función convierte el idNodo del INE en la clave CVE_ENT
+    del GeoJSON. En el nivel estatal ambos usan la clave del INEGI,
+    así que solo hay que rellenar con ceros.
+    """
+
+    return pd.Series(id_nodo).astype("string").str.zfill(2).to_numpy()
+
+
+def calcular_hash(ruta):
+    """
+    Esta función calcula el hash SHA-256 del archivo.
+    """
+
+    sha = hashlib.sha256()
+
+    with open(ruta, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 16), b""):
+            sha.update(bloque)
+
+    return sha.hexdigest()
+
+
+def nombre_cache(ruta):
+    """
+    Esta función regresa el nombre con el que se guarda en ./cache lo
+    que se calcula a partir de un archivo: su nombre sin extensión y
+    el inicio del hash de su ruta absoluta. Así dos archivos con el
+    mismo nombre en carpetas distintas no comparten caché.
+    """
+
+    ruta = os.path.abspath(ruta)
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+
+    return f"{nombre}-{hashlib.sha256(ruta.encode('utf-8')).hexdigest()[:12]}"
+
+
+def procesar_consulta(nodos, votacion, metadatos):
+    """
+    Esta función arma, a partir de las tablas normalizadas, un
+    diccionario con el resumen nacional y una tabla por entidad.
+    """
+
+    # Porcentaje de cada respuesta por nodo. Cada respuesta se reconoce
+    # por su idPartido y no por su posición en el JSON.
+    votacion = votacion.assign(respuesta=votacion["id_partido"].map(validacion.RESPUESTAS))
+    porcentajes = votacion.pivot(index="id_nodo", columns="respuesta", values="porcentaje")
+
+    nacional = nodos[nodos["nivel"] == "NACIONAL"].iloc[0]
+    resumen = porcentajes.loc[nacional["id_nodo"]]
+
+    nacional = {
+        "horaCorte": metadatos["horaCorte"],
+        "fechaCorte": metadatos["fechaCorte"],
+        "archivoCorte": metadatos["archivoCorte"],
+        "participacion": float(nacional["participacion"]),
+        "total": int(nacional["total_votos"]),
+        "lista_nominal": int(nacional["lista_nominal"]),
+        "si": float(resumen["si"]),
+        "no": float(resumen["no"]),
+        "nulo": float(resumen["nulo"]),
+    }
+
+    # El nodo 0 es el de representación proporcional y no nos sirve.
+    estatales = nodos[(nodos["nivel"] == "ESTATAL") & (nodos["id_nodo"] > 0)]
+    respuestas = porcentajes.loc[estatales["id_nodo"]]
+
+    entidades = pd.DataFrame(
+        {
+            "id_nodo": estatales["id_nodo"].to_numpy(),
+            "id_mapa": estatales["id_mapa"].to_numpy(),
+            "participacion": estatales["participacion"].to_numpy(),
+            "total": estatales["total_votos"].to_numpy(),
+            "lista_nominal": estatales["lista_nominal"].to_numpy(),
+            "si": respuestas["si"].to_numpy(),
+            "no": respuestas["no"].to_numpy(),
+            "nulo": respuestas["nulo"].to_numpy(),
+        },
+        index=limpiar_nombres(estatales["nombre"].to_numpy())
+    ).astype(COLUMNAS)
+
+    # La clave nos permite unir la tabla con el GeoJSON sin depender de los nombres.
+    entidades.insert(1, "clave", pd.array(crear_claves(entidades["id_nodo"]), dtype="string"))
+
+    return {"nacional": nacional, "entidades": entidades}
+
+
+def obtener_dataset(ruta, validar=True):
+    """
+    Esta función regresa la carpeta del dataset Parquet de una consulta
+    y sus metadatos, creándolo si no existe o si el JSON cambió.
+
+    Solo calculamos el hash si la fecha de modificación cambió. El
+    JSON se valida antes de normalizarlo; si tiene problemas se lanza
+    un ValueError con todos ellos y no se guarda nada. Con
+    validar=False (consultas sintéticas del benchmark) no se valida y
+    el dataset queda marcado como no validado.
+    """
+
+    ruta = os.path.abspath(ruta)
+    mtime = os.stat(ruta).st_mtime_ns
+
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    carpeta = os.path.join(CARPETA_CACHE, nombre_cache(ruta))
+
+    metadatos = columnar.leer_metadatos(carpeta)
+
+    # Un dataset revisado con otra versión de las validaciones se vuelve a procesar.
+    if (metadatos is not None and metadatos.get("ruta") == ruta and
+            (not validar or metadatos.get("validacion") == validacion.VERSION_VALIDACION)):
+        if metadatos["mtime"] == mtime:
+            return carpeta, metadatos
+
+        if metadatos["hash"] == calcular_hash(ruta):
+            metadatos["mtime"] = mtime
+            columnar.escribir_metadatos(carpeta, metadatos)
+            return carpeta, metadatos
+
+    with perfil.etapa("cargar", nombre):
+        with open(ruta, "r", encoding="utf-8") as archivo:
+            data = json.load(archivo)
+
+    with perfil.etapa("normalizar", nombre):
+        if validar:
+            validacion.validar_consulta(data, ruta, NIVELES_MAPA["entidad"]["geometria"])
+
+        nodos, votacion, metadatos = columnar.normalizar_consulta(data)
+        metadatos.update(
+            ruta=ruta, mtime=mtime, hash=calcular_hash(ruta),
+            validacion=validacion.VERSION_VALIDACION if validar else None)
+
+        columnar.escribir_dataset(carpeta, nodos, votacion, metadatos)
+
+    return carpeta, metadatos
+
+
+def cargar_consulta(ruta, validar=True):
+    """
+    Esta función regresa la consulta ya procesada.
+
+    Primero busca en memoria y después el dataset en disco. Si el
+    archivo cambió (según su fecha de modificación y su hash) lo
+    vuelve a leer y actualiza ambas cachés. validar se pasa a
+    obtener_dataset; en memoria se guarda aparte si la consulta se
+    validó, y una consulta sin validar nunca se regresa a quien pide
+    validarla.
+    """
+
+    ruta = os.path.abspath(ruta)
+    mtime = os.stat(ruta).st_mtime_ns
+
+    # Si ya la cargamos en este proceso y no ha cambiado, la regresamos.
+    for llave in [(ruta, True)] if validar else [(ruta, True), (ruta, False)]:
+        if llave in _memoria and _memoria[llave]["mtime"] == mtime:
+            return _memoria[llave]["consulta"]
+
+    carpeta, metadatos = obtener_dataset(ruta, validar)
+
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+
+    with perfil.etapa("cargar", nombre):
+        nodos = columnar.leer_tabla(os.path.join(carpeta, "nodos.parquet"))
+        votacion = columnar.leer_tabla(
+            os.path.join(carpeta, "votacion.parquet"), ["id_nodo", "id_partido", "porcentaje"])
+
+    with perfil.etapa("normalizar", nombre):
+        consulta = procesar_consulta(nodos, votacion, metadatos)
+
+    _memoria[(ruta, validar)] = {
+        "mtime": mtime,
+        "hash": metadatos["hash"],
+        "consulta": consulta,
+    }
+
+    return consulta
+
+
+def olvidar_consulta(ruta):
+    """
+    Esta función borra de la memoria la consulta, validada o no, para
+    que la siguiente carga la lea del disco.
+    """
+
+    ruta = os.path.abspath(ruta)
+
+    for validar in [True, False]:
+        _memoria.pop((ruta, validar), None)
+
+
+def obtener_hash(ruta):
+    """
+    Esta función regresa el hash del archivo de una consulta,
+    aprovechando el que ya se calculó al cargarla.
+    """
+
+    cargar_consulta(ruta)
+
+    return _memoria[(os.path.abspath(ruta), True)]["hash"]
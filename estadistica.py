@@ -0,0 +1,458 @@
+"""
+Este módulo calcula estadísticas de una consulta: intervalos de
+confianza de la participación, la correlación de la participación con
+el tipo de actas (urbanas o rurales) y las entidades o actas con una
+distribución de respuestas atípica.
+
+Todo se calcula con arreglos de NumPy. El bootstrap genera las
+remuestras por lotes: en cada lote se sortean los índices de todas
+las remuestras a la vez y se suman con una sola operación, así que
+10,000 remuestras de 57 mil actas toman unos cuantos segundos sin
+tener nunca en memoria la matriz completa de índices.
+
+Si la consulta indica en "actas" el zip de actas del PREP (ver
+actas.py), los intervalos salen de remuestrear las actas dentro de
+cada entidad, los atípicos también se buscan entre las actas y las
+actas urbanas y rurales de cada entidad se cuentan con su ubicación
+para las correlaciones. Si no, los intervalos suponen que cada
+persona de la lista nominal vota de forma independiente (bootstrap
+paramétrico binomial por entidad) y no hay correlaciones, porque los
+JSON no traen el desglose de actas por entidad.
+
+Los resultados son DataFrames que se guardan como CSV y que alimentan
+la tabla y la gráfica de barras de consulta.py.
+
+Uso:
+
+    python cli.py analyze [2021 2022] [--remuestras 10000] [--confianza 0.95] [--semilla 0]
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import plantillas
+from consulta import crear_plantilla_barras, crear_plantilla_tabla
+from datos import cargar_consulta, obtener_dataset
+
+
+REMUESTRAS = 10000
+
+CONFIANZA = 0.95
+
+# Cuántos índices sorteamos a la vez en el bootstrap (8 MB). Los lotes
+# chicos caben en la caché y son más rápidos que uno solo enorme.
+ELEMENTOS_POR_LOTE = 1 << 20
+
+# Un valor cuyo z robusto pasa de este umbral es atípico.
+UMBRAL_ATIPICO = 3.5
+
+# Las actas con menos votos tienen proporciones demasiado ruidosas.
+MINIMO_VOTOS_ACTA = 20
+
+RESPUESTAS = ["si", "no", "nulo"]
+
+# Columna de cada valor de UBICACION_CASILLA en el CSV de actas.
+UBICACIONES = {1: "total_actas_urbanas", 2: "total_actas_rurales"}
+
+
+def sumas_bootstrap(valores, grupos=None, remuestras=REMUESTRAS, semilla=None):
+    """
+    Esta función remuestrea con reemplazo los renglones de valores
+    (un arreglo de n renglones por k columnas) dentro de cada grupo y
+    regresa la suma de cada remuestra, con forma (remuestras, grupos, k).
+
+    También regresa las claves de los grupos, en el orden del resultado.
+    Sin grupos todos los renglones forman uno solo.
+    """
+
+    valores = np.asarray(valores)
+    valores = valores[:, None] if valores.ndim == 1 else valores
+
+    if grupos is None:
+        grupos = np.zeros(len(valores), dtype=np.int64)
+
+    # Ordenamos por grupo para que cada uno sea un bloque contiguo.
+    orden = np.argsort(grupos, kind="stable")
+    valores = valores[orden]
+    claves, inicios, tamanos = np.unique(np.asarray(grupos)[orden], return_index=True, return_counts=True)
+
+    n = len(valores)
+
+    # Para cada posición, dónde empieza su grupo y cuántos renglones tiene.
+    base = np.repeat(inicios, tamanos).astype(np.uint64)
+    largo = np.repeat(tamanos, tamanos).astype(np.uint64)
+
+    generador = np.random.default_rng(semilla)
+    lote = max(1, ELEMENTOS_POR_LOTE // max(n, 1))
+    sumas = np.empty((remuestras, len(claves), valores.shape[1]), dtype=valores.dtype)
+
+    for inicio in range(0, remuestras, lote):
+        cantidad = min(lote, remuestras - inicio)
+
+        # Cada índice se sortea dentro del bloque de su grupo: un entero
+        # de 32 bits por el tamaño del grupo, quedándonos con los 32 bits
+        # altos, es uniforme en [0, tamaño) sin divisiones ni flotantes.
+        indices = generador.integers(0, 1 << 32, size=(cantidad, n), dtype=np.uint32).astype(np.uint64)
+        indices *= largo
+        indices >>= np.uint64(32)
+        indices += base
+        indices = indices.view(np.int64)
+
+        for columna in range(valores.shape[1]):
+            sumas[inicio:inicio + cantidad, :, columna] = np.add.reduceat(
+                valores[:, columna][indices], inicios, axis=1)
+
+    return claves, sumas
+
+
+def resumir_intervalos(estimado, remuestras, confianza=CONFIANZA):
+    """
+    Esta función arma una tabla con el valor estimado, el error
+    estándar y el intervalo de percentiles de cada columna.
+    """
+
+    alfa = (1 - confianza) / 2
+    inferior, superior = np.nanpercentile(remuestras, [alfa * 100, (1 - alfa) * 100], axis=0)
+
+    return pd.DataFrame({
+        "participacion": estimado,
+        "error_estandar": np.nanstd(remuestras, axis=0, ddof=1),
+        "inferior": inferior,
+        "superior": superior,
+    })
+
+
+def intervalos_actas(actas, remuestras=REMUESTRAS, confianza=CONFIANZA, semilla=None):
+    """
+    Esta función calcula el intervalo de confianza de la participación
+    de cada entidad y de la nacional remuestreando las actas dentro de
+    cada entidad.
+
+    La participación nacional de cada remuestra es la suma de las
+    entidades, así que sale del mismo sorteo.
+    """
+
+    valores = actas[["total", "lista_nominal"]].to_numpy(dtype=np.int64)
+    claves, sumas = sumas_bootstrap(valores, actas["entidad"].to_numpy(), remuestras, semilla)
+
+    votos = np.concatenate([sumas[:, :, 0], sumas[:, :, 0].sum(axis=1, keepdims=True)], axis=1)
+    lista = np.concatenate([sumas[:, :, 1], sumas[:, :, 1].sum(axis=1, keepdims=True)], axis=1)
+
+    por_entidad = actas.groupby("entidad")[["total", "lista_nominal"]].sum().loc[claves]
+    estimado = np.append(
+        por_entidad["total"] / por_entidad["lista_nominal"],
+        por_entidad["total"].sum() / por_entidad["lista_nominal"].sum()
+    ) * 100
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tabla = resumir_intervalos(estimado, votos / lista * 100, confianza)
+
+    tabla.index = pd.Index([f"{clave:02d}" for clave in claves] + ["nacional"], name="clave")
+
+    return tabla
+
+
+def intervalos_binomiales(entidades, remuestras=REMUESTRAS, confianza=CONFIANZA, semilla=None):
+    """
+    Esta función calcula el intervalo de confianza de la participación
+    cuando no hay actas: los votos de cada remuestra se sortean con una
+    binomial sobre la lista nominal de cada entidad.
+    """
+
+    lista = entidades["lista_nominal"].to_numpy(dtype=np.int64)
+    votos = entidades["total"].to_numpy(dtype=np.int64)
+
+    generador = np.random.default_rng(semilla)
+    sorteo = generador.binomial(lista, votos / lista, size=(remuestras, len(lista)))
+
+    participacion = np.column_stack([sorteo / lista, sorteo.sum(axis=1) / lista.sum()]) * 100
+    estimado = np.append(votos / lista, votos.sum() / lista.sum()) * 100
+
+    tabla = resumir_intervalos(estimado, participacion, confianza)
+    tabla.index = pd.Index(entidades["clave"].tolist() + ["nacional"], name="clave")
+
+    return tabla
+
+
+def correlacionar(x, y):
+    """
+    Esta función calcula la correlación de Pearson renglón por renglón
+    de dos matrices, para todas las remuestras a la vez.
+    """
+
+    x = x - x.mean(axis=-1, keepdims=True)
+    y = y - y.mean(axis=-1, keepdims=True)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (x * y).sum(axis=-1) / np.sqrt((x ** 2).sum(axis=-1) * (y ** 2).sum(axis=-1))
+
+
+def correlaciones_participacion(entidades, remuestras=REMUESTRAS, confianza=CONFIANZA, semilla=None):
+    """
+    Esta función calcula la correlación entre la participación de cada
+    entidad y sus actas urbanas, rurales y la proporción urbana.
+
+    Regresa Pearson con su intervalo bootstrap (remuestreando entidades)
+    y Spearman, que no depende de la forma de la relación.
+
+    Solo se usan las entidades que traen su desglose de actas. Los JSON
+    de 2021 y 2022 solo lo traen en el nodo nacional, así que el
+    desglose sale del zip de actas (ver contar_ubicaciones); con menos
+    de 3 entidades las correlaciones quedan vacías.
+    """
+
+    entidades = entidades[entidades["total_actas_urbanas"] + entidades["total_actas_rurales"] > 0]
+
+    variables = {
+        "actas_urbanas": entidades["total_actas_urbanas"],
+        "actas_rurales": entidades["total_actas_rurales"],
+        "proporcion_urbana": entidades["total_actas_urbanas"] /
+        (entidades["total_actas_urbanas"] + entidades["total_actas_rurales"]),
+    }
+
+    participacion = entidades["participacion"].to_numpy(dtype=np.float64)
+
+    generador = np.random.default_rng(semilla)
+    indices = generador.integers(0, len(participacion), size=(remuestras, len(participacion)))
+
+    alfa = (1 - confianza) / 2
+    renglones = dict()
+
+    for nombre, valores in variables.items():
+        if len(entidades) < 3:
+            renglones[nombre] = {"entidades": len(entidades)}
+            continue
+
+        valores = valores.to_numpy(dtype=np.float64)
+        remuestreo = correlacionar(valores[indices], participacion[indices])
+        inferior, superior = np.nanpercentile(remuestreo, [alfa * 100, (1 - alfa) * 100])
+
+        renglones[nombre] = {
+            "entidades": len(entidades),
+            "pearson": correlacionar(valores, participacion),
+            "inferior": inferior,
+            "superior": superior,
+            "spearman": correlacionar(
+                pd.Series(valores).rank().to_numpy(), pd.Series(participacion).rank().to_numpy()),
+        }
+
+    columnas = ["entidades", "pearson", "inferior", "superior", "spearman"]
+
+    return pd.DataFrame.from_dict(renglones, orient="index").reindex(columns=columnas).rename_axis("variable")
+
+
+def z_robusto(valores, grupos=None):
+    """
+    Esta función calcula el z robusto (con la mediana y la desviación
+    absoluta mediana) de cada columna, dentro de cada grupo si se indica.
+
+    Si la desviación mediana es cero (por ejemplo, cuando la mayoría de
+    las actas no tiene votos nulos) se usa la desviación media.
+    """
+
+    if grupos is None:
+        mediana = valores.median()
+        absolutas = (valores - mediana).abs()
+        mediana_absoluta = absolutas.median()
+        media_absoluta = absolutas.mean()
+    else:
+        mediana = valores.groupby(grupos).transform("median")
+        absolutas = (valores - mediana).abs().groupby(grupos)
+        mediana_absoluta = absolutas.transform("median")
+        media_absoluta = absolutas.transform("mean")
+
+    # Las constantes hacen que el z robusto sea comparable con el z normal.
+    escala = (mediana_absoluta / 0.6745).where(mediana_absoluta > 0, media_absoluta * 1.2533)
+
+    return (valores - mediana) / escala.where(escala > 0)
+
+
+def buscar_atipicos(tabla, grupos=None, umbral=UMBRAL_ATIPICO):
+    """
+    Esta función marca los renglones con una proporción de sí, no o
+    nulos atípica y los ordena del más al menos atípico.
+
+    tabla debe traer las proporciones (en porcentaje) en las columnas
+    si, no y nulo. Con grupos cada renglón se compara contra los de su
+    grupo; para las actas, contra las demás actas de su entidad.
+    """
+
+    z = z_robusto(tabla[RESPUESTAS], grupos).add_prefix("z_")
+
+    resultado = pd.concat([tabla, z], axis=1)
+    resultado["z_maximo"] = z.abs().max(axis=1)
+    resultado["atipico"] = resultado["z_maximo"] > umbral
+
+    return resultado.sort_values("z_maximo", ascending=False)
+
+
+def atipicos_actas(actas, umbral=UMBRAL_ATIPICO, minimo_votos=MINIMO_VOTOS_ACTA):
+    """
+    Esta función busca las actas con una distribución de respuestas
+    atípica para su entidad. Solo considera las actas con al menos
+    minimo_votos votos.
+    """
+
+    actas = actas[actas["total"] >= minimo_votos]
+
+    proporciones = actas[RESPUESTAS].div(actas["total"], axis=0) * 100
+    tabla = pd.concat([actas.drop(columns=RESPUESTAS), proporciones], axis=1)
+
+    return buscar_atipicos(tabla, actas["entidad"], umbral)
+
+
+def contar_ubicaciones(actas, id_nodo):
+    """
+    Esta función cuenta las actas urbanas y no urbanas de cada entidad
+    a partir de la columna ubicacion de las actas, en el orden de id_nodo.
+    """
+
+    conteo = pd.crosstab(actas["entidad"], actas["ubicacion"])
+    conteo = conteo.reindex(index=id_nodo, columns=list(UBICACIONES), fill_value=0)
+
+    return conteo.rename(columns=UBICACIONES)
+
+
+def cargar_entidades(config):
+    """
+    Esta función regresa la tabla de entidades de la consulta con el
+    número de actas urbanas y rurales de cada una.
+    """
+
+    entidades = cargar_consulta(config["archivo"])["entidades"]
+
+    carpeta, _ = obtener_dataset(config["archivo"])
+    nodos = columnar.leer_tabla(
+        os.path.join(carpeta, "nodos.parquet"), ["id_nodo", "total_actas_urbanas", "total_actas_rurales"])
+
+    actas = nodos.set_index("id_nodo").loc[entidades["id_nodo"]]
+
+    return entidades.assign(
+        total_actas_urbanas=actas["total_actas_urbanas"].to_numpy(),
+        total_actas_rurales=actas["total_actas_rurales"].to_numpy()
+    )
+
+
+def analizar_consulta(config, remuestras=REMUESTRAS, confianza=CONFIANZA, semilla=None):
+    """
+    Esta función calcula todas las estadísticas de una consulta y las
+    regresa en un diccionario de DataFrames.
+
+    Las correlaciones solo se incluyen si hay al menos 3 entidades con
+    su desglose de actas urbanas y rurales, que en la práctica solo
+    sale del zip de actas.
+    """
+
+    entidades = cargar_entidades(config)
+    nombres = pd.Series(entidades.index, index=entidades["clave"].to_numpy())
+    nombres["nacional"] = "Nacional"
+
+    resultados = dict()
+
+    if "actas" in config:
+        # actas.py solo se necesita si la consulta tiene actas.
+        from actas import cargar_actas
+
+        actas = cargar_actas(config["actas"], niveles=["casilla"])["casilla"]
+
+        if actas is None:
+            raise ValueError(f"El zip de actas de {config['anio']} no trae las casillas.")
+
+        resultados["intervalos"] = intervalos_actas(actas, remuestras, confianza, semilla)
+        resultados["atipicos_acta"] = atipicos_actas(actas)
+
+        if "ubicacion" in actas:
+            conteo = contar_ubicaciones(actas, entidades["id_nodo"])
+            entidades = entidades.assign(
+                total_actas_urbanas=conteo["total_actas_urbanas"].to_numpy(),
+                total_actas_rurales=conteo["total_actas_rurales"].to_numpy()
+            )
+    else:
+        resultados["intervalos"] = intervalos_binomiales(entidades, remuestras, confianza, semilla)
+
+    resultados["intervalos"].insert(0, "entidad", nombres.reindex(resultados["intervalos"].index).to_numpy())
+    correlaciones = correlaciones_participacion(entidades, remuestras, confianza, semilla)
+
+    if correlaciones["pearson"].notna().any():
+        resultados["correlaciones"] = correlaciones
+    resultados["atipicos_entidad"] = buscar_atipicos(entidades[RESPUESTAS + ["participacion", "total"]])
+
+    return resultados
+
+
+def exportar_resultados(resultados, base):
+    """
+    Esta función guarda cada tabla de resultados como
+    <base>-<nombre>.csv y regresa las rutas.
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(base)), exist_ok=True)
+
+    rutas = list()
+
+    for nombre, tabla in resultados.items():
+        ruta = f"{base}-{nombre}.csv"
+        tabla.to_csv(ruta, encoding="utf-8")
+        rutas.append(ruta)
+
+    return rutas
+
+
+def build_interval_table(intervalos, confianza=CONFIANZA, validar=False):
+    """
+    Esta función llena la plantilla de la tabla de consulta.py con la
+    participación de cada entidad y su intervalo de confianza.
+
+    La figura se regresa como diccionario, a menos que validar sea True.
+    """
+
+    df = intervalos.drop(index="nacional", errors="ignore").sort_values("participacion", ascending=False)
+
+    fig = plantillas.instanciar("tabla", crear_plantilla_tabla)
+
+    rangos = [f"{inferior:,.2f} - {superior:,.2f}%" for inferior, superior in zip(df["inferior"], df["superior"])]
+
+    # Cambiamos la columna de votos por la del intervalo.
+    for traza, inicio, fin in zip(fig["data"], [0, 16], [16, len(df)]):
+        traza["header"]["values"] = ["<b>Entidad</b>", "<b>Participación ↓</b>", f"<b>IC {confianza:.0%}</b>"]
+        traza["cells"].update(format=["", ".2f", ""], suffix=["", "%", ""])
+        traza["cells"]["values"] = [
+            df["entidad"][inicio:fin].tolist(),
+            df["participacion"][inicio:fin].to_numpy(),
+            rangos[inicio:fin]
+        ]
+
+    return plantillas.a_figura(fig, validar)
+
+
+def build_outlier_bars(atipicos, titulo, fuente, etiquetas=None, cantidad=32, validar=False):
+    """
+    Esta función llena la plantilla de barras de consulta.py con la
+    distribución de respuestas de los renglones más atípicos.
+
+    etiquetas es la columna con el nombre de cada barra; si no se
+    indica se usa el índice.
+
+    La figura se regresa como diccionario, a menos que validar sea True.
+    """
+
+    df = atipicos.head(cantidad)
+    nombres = df.index if etiquetas is None else df[etiquetas]
+
+    # El más atípico queda hasta arriba.
+    df = df.iloc[::-1]
+    nombres = [str(nombre) for nombre in nombres[::-1]]
+
+    fig = plantillas.instanciar("barras", crear_plantilla_barras)
+
+    for traza, columna in zip(fig["data"], RESPUESTAS):
+        valores = df[columna].round(2).to_numpy()
+        traza.update(x=valores, y=nombres, text=valores)
+
+    fig["layout"]["title"]["text"] = titulo
+    fig["layout"]["annotations"][0]["text"] = fuente
+
+    return plantillas.a_figura(fig, validar)
@@ -0,0 +1,266 @@
+"""
+Este módulo exporta las gráficas en varios formatos y tamaños.
+
+Para publicar se necesitan SVG o PDF y PNG de varios tamaños
+(miniaturas para redes sociales, versiones retina). En lugar de
+renderizar la figura una vez por tamaño, kaleido la renderiza una
+sola vez a la escala más grande que se pidió y los demás tamaños se
+obtienen reduciendo esa imagen con PIL. Cada formato vectorial sale
+de una sola llamada a kaleido.
+
+Con el motor PIL (--motor pil) el mapa y la tabla se dibujan con
+rasterizador.py y tablas.py en lugar de kaleido. Esos motores dibujan
+a tamaño original, así que los tamaños más grandes se escalan desde
+esa imagen. Las barras y los formatos vectoriales siempre usan kaleido.
+
+Uso:
+
+    python cli.py export 2021 --formatos png svg webp --tamanos original retina miniatura
+"""
+
+import os
+from io import BytesIO
+
+from PIL import Image
+
+import renderizador
+
+
+# Cada tamaño se indica con una escala o con el ancho final en pixeles.
+TAMANOS = {
+    "original": {"escala": 1},
+    "retina": {"escala": 2},
+    "social": {"ancho": 1200},
+    "miniatura": {"ancho": 400},
+}
+
+FORMATOS_RASTER = ["png", "webp", "jpg"]
+FORMATOS_VECTORIALES = ["svg", "pdf"]
+
+
+def calcular_escala(tamano, ancho):
+    """
+    Esta función regresa la escala de un tamaño para una figura
+    del ancho indicado.
+    """
+
+    if tamano not in TAMANOS:
+        raise ValueError(f"El tamaño {tamano} no existe. Los tamaños son: {', '.join(TAMANOS)}")
+
+    if "ancho" in TAMANOS[tamano]:
+        return TAMANOS[tamano]["ancho"] / ancho
+
+    return TAMANOS[tamano]["escala"]
+
+
+def nombrar(base, tamano, formato):
+    """
+    Esta función regresa la ruta de una salida. El tamaño original
+    no lleva sufijo.
+    """
+
+    if tamano == "original":
+        return f"{base}.{formato}"
+
+    return f"{base}-{tamano}.{formato}"
+
+
+def codificar(imagen, formato, optimizar=False):
+    """
+    Esta función codifica una imagen de PIL en el formato indicado.
+
+    Con optimizar=True el PNG se comprime al máximo y el WebP usa el
+    método más lento, que da los archivos más chicos. El WebP siempre
+    es sin pérdida, porque las gráficas tienen colores planos.
+    """
+
+    buffer = BytesIO()
+
+    if formato == "png":
+        imagen.save(buffer, "PNG", optimize=optimizar)
+    elif formato == "webp":
+        imagen.save(buffer, "WEBP", lossless=True, method=6 if optimizar else 4)
+    elif formato == "jpg":
+        imagen.convert("RGB").save(buffer, "JPEG", quality=90, optimize=optimizar)
+    else:
+        raise ValueError(f"El formato {formato} no es raster. Los formatos son: {', '.join(FORMATOS_RASTER)}")
+
+    return buffer.getvalue()
+
+
+def reducir(maestra, escala_maestra, escala):
+    """
+    Esta función obtiene un tamaño a partir de la imagen maestra,
+    que se renderizó a escala_maestra.
+    """
+
+    if escala == escala_maestra:
+        return maestra
+
+    factor = escala / escala_maestra
+    tamano = (max(1, round(maestra.width * factor)), max(1, round(maestra.height * factor)))
+
+    return maestra.resize(tamano, Image.LANCZOS)
+
+
+def apilar(imagenes):
+    """
+    Esta función pone varias imágenes de PIL una debajo de otra,
+    como la imagen compuesta del mapa y la tabla.
+    """
+
+    ancho = max(imagen.width for imagen in imagenes)
+    alto = sum(imagen.height for imagen in imagenes)
+
+    resultado = Image.new("RGB", (ancho, alto))
+    y = 0
+
+    for imagen in imagenes:
+        resultado.paste(imagen, (0, y))
+        y += imagen.height
+
+    return resultado
+
+
+def atributo_svg(documento, nombre):
+    """
+    Esta función regresa el valor de un atributo de la etiqueta <svg>
+    principal de un documento.
+    """
+
+    inicio = documento.index("<svg")
+    etiqueta = documento[inicio:documento.index(">", inicio)]
+    inicio = etiqueta.index(f' {nombre}="') + len(nombre) + 3
+
+    return etiqueta[inicio:etiqueta.index('"', inicio)]
+
+
+def apilar_svg(documentos):
+    """
+    Esta función pone varios SVG de kaleido uno debajo de otro en un
+    solo SVG, anidando cada documento con su desplazamiento.
+    """
+
+    ancho = 0
+    y = 0
+    partes = list()
+
+    for documento in documentos:
+        documento = documento.decode("utf-8") if isinstance(documento, bytes) else documento
+
+        # Quitamos la declaración XML y bajamos el documento anidado.
+        documento = documento[documento.index("<svg"):]
+        partes.append(documento.replace("<svg", f'<svg y="{y:g}"', 1))
+
+        ancho = max(ancho, float(atributo_svg(documento, "width")))
+        y += float(atributo_svg(documento, "height"))
+
+    encabezado = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        f'width="{ancho:g}" height="{y:g}" viewBox="0 0 {ancho:g} {y:g}">'
+    )
+
+    return (encabezado + "".join(partes) + "</svg>").encode("utf-8")
+
+
+def generar_salidas(figuras, formatos=("png",), tamanos=("original",), optimizar=False,
+                    dibujantes=None):
+    """
+    Esta función genera una gráfica en todos los formatos y tamaños
+    pedidos y regresa un diccionario de (tamaño, formato) -> bytes.
+
+    figuras es una lista de figuras que se apilan en una sola imagen;
+    para una gráfica sola es una lista de un elemento y para la
+    imagen compuesta es [mapa, tabla]. Los formatos vectoriales se
+    generan una sola vez, con el tamaño "original". El PDF solo se
+    puede generar para una gráfica sola.
+
+    dibujantes es una lista paralela a figuras con la función de PIL
+    que dibuja cada una a tamaño original (rasterizador.dibujar_mapa,
+    tablas.dibujar_tabla) o None para renderizarla con kaleido.
+    """
+
+    for formato in formatos:
+        if formato not in FORMATOS_RASTER + FORMATOS_VECTORIALES:
+            raise ValueError(
+                f"El formato {formato} no existe. Los formatos son: "
+                f"{', '.join(FORMATOS_RASTER + FORMATOS_VECTORIALES)}")
+
+    if "pdf" in formatos and len(figuras) > 1:
+        raise ValueError("El PDF solo se puede exportar para una gráfica sola.")
+
+    nombres = {f"figura-{indice}": figura for indice, figura in enumerate(figuras)}
+    ancho = max(
+        (figura.to_dict() if hasattr(figura, "to_dict") else figura)["layout"]["width"]
+        for figura in figuras
+    )
+
+    salidas = dict()
+
+    for formato in formatos:
+        if formato not in FORMATOS_VECTORIALES:
+            continue
+
+        documentos = list(renderizador.renderizar(nombres, formato=formato).values())
+
+        if len(documentos) > 1:
+            salidas[("original", formato)] = apilar_svg(documentos)
+        else:
+            salidas[("original", formato)] = documentos[0]
+
+    raster = [formato for formato in formatos if formato in FORMATOS_RASTER]
+
+    if raster:
+        escalas = {tamano: calcular_escala(tamano, ancho) for tamano in tamanos}
+        dibujantes = dibujantes or [None] * len(figuras)
+
+        # Renderizamos una sola vez, a la escala más grande que se pidió.
+        # Si todas las figuras se dibujan con PIL, la maestra es de tamaño original.
+        kaleido = {
+            nombre: figura for (nombre, figura), dibujante in zip(nombres.items(), dibujantes)
+            if dibujante is None
+        }
+        escala_maestra = max(escalas.values()) if kaleido else 1
+
+        if kaleido:
+            imagenes = renderizador.renderizar(kaleido, formato="png", escala=escala_maestra)
+
+        partes = list()
+
+        for (nombre, figura), dibujante in zip(nombres.items(), dibujantes):
+            if dibujante is None:
+                partes.append(Image.open(BytesIO(imagenes[nombre])))
+            else:
+                partes.append(reducir(dibujante(figura), 1, escala_maestra))
+
+        maestra = apilar(partes)
+
+        for tamano, escala in escalas.items():
+            imagen = reducir(maestra, escala_maestra, escala)
+
+            for formato in raster:
+                salidas[(tamano, formato)] = codificar(imagen, formato, optimizar)
+
+    return salidas
+
+
+def exportar(figuras, base, formatos=("png",), tamanos=("original",), optimizar=False,
+             dibujantes=None):
+    """
+    Esta función guarda una gráfica en todos los formatos y tamaños
+    pedidos (ver generar_salidas) y regresa la lista de rutas.
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(base)), exist_ok=True)
+
+    rutas = list()
+
+    for (tamano, formato), contenido in generar_salidas(figuras, formatos, tamanos, optimizar, dibujantes).items():
+        ruta = nombrar(base, tamano, formato)
+
+        with open(ruta, "wb") as archivo:
+            archivo.write(contenido)
+
+        rutas.append(ruta)
+
+    return rutas
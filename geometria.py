@@ -0,0 +1,584 @@
+"""
+Este módulo prepara una versión simplificada de mexico.json.
+
+El GeoJSON original tiene mucha más resolución de la que se
+alcanza a ver en una imagen de 1280x720. Aquí lo convertimos a
+una topología (TopoJSON) con coordenadas cuantizadas, donde cada
+frontera compartida entre dos entidades se guarda y se simplifica
+una sola vez, así que las entidades vecinas siguen embonando.
+
+El resultado se guarda en ./cache y el mapa lo convierte de vuelta
+a GeoJSON con muchas menos coordenadas.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from datos import CARPETA_CACHE, calcular_hash, nombre_cache
+
+
+# Tamaño de la cuadrícula usada para cuantizar las coordenadas.
+CUANTIZACION = 10000
+
+# Tolerancia de simplificación para cada nivel, en pixeles de la
+# imagen final. Con medio pixel la diferencia no se alcanza a notar.
+NIVELES = {
+    "alta": 0.25,
+    "media": 0.5,
+    "baja": 1.5,
+}
+
+# Tamaño de la imagen del mapa y el área que ocupa la geografía.
+ANCHO = 1280
+ALTO = 720
+MARGEN = 80
+
+# Decimales que conservamos al convertir de vuelta a GeoJSON.
+DECIMALES = 4
+
+# Versión del formato de la topología guardada en ./cache. Si cambia
+# la forma de construirla, subimos este número para reconstruirla.
+VERSION_CACHE = 2
+
+# Aquí guardamos las geometrías que ya cargamos en este proceso.
+_memoria = dict()
+
+
+def obtener_poligonos(geometria):
+    """
+    Esta función regresa la lista de polígonos de una geometría,
+    sin importar si es Polygon o MultiPolygon.
+    """
+
+    if geometria["type"] == "Polygon":
+        return [geometria["coordinates"]]
+
+    return geometria["coordinates"]
+
+
+def recorrer_anillos(geometria):
+    """
+    Esta función regresa las listas de arcos de cada anillo
+    de una geometría de la topología.
+    """
+
+    if geometria["type"] == "Polygon":
+        return geometria["arcs"]
+
+    return [anillo for poligono in geometria["arcs"] for anillo in poligono]
+
+
+def cuantizar(geojson, cuantizacion=CUANTIZACION):
+    """
+    Esta función convierte todos los anillos a coordenadas enteras.
+
+    Regresa los anillos de cada entidad y la transformación
+    necesaria para volver a grados.
+    """
+
+    puntos = np.concatenate([
+        np.asarray(anillo, dtype=np.float64)[:, :2]
+        for item in geojson["features"]
+        for poligono in obtener_poligonos(item["geometry"])
+        for anillo in poligono
+    ])
+
+    minimo = puntos.min(axis=0)
+    maximo = puntos.max(axis=0)
+
+    escala = (maximo - minimo) / (cuantizacion - 1)
+    escala[escala == 0] = 1.0
+
+    entidades = list()
+
+    for item in geojson["features"]:
+
+        poligonos = list()
+
+        for poligono in obtener_poligonos(item["geometry"]):
+
+            anillos = list()
+
+            for anillo in poligono:
+                anillo = np.asarray(anillo, dtype=np.float64)[:, :2]
+                enteros = np.round((anillo - minimo) / escala).astype(np.int64)
+
+                # Quitamos los puntos repetidos que deja la cuantización.
+                cambio = np.any(np.diff(enteros, axis=0) != 0, axis=1)
+                enteros = enteros[np.concatenate([[True], cambio])]
+
+                # Nos aseguramos de que el anillo esté cerrado.
+                if not np.array_equal(enteros[0], enteros[-1]):
+                    enteros = np.vstack([enteros, enteros[:1]])
+
+                if len(enteros) >= 4:
+                    anillos.append(enteros)
+
+            if anillos:
+                poligonos.append(anillos)
+
+        entidades.append(poligonos)
+
+    transformacion = {
+        "scale": escala.tolist(),
+        "translate": minimo.tolist(),
+    }
+
+    return entidades, transformacion
+
+
+def buscar_uniones(entidades):
+    """
+    Esta función encuentra los puntos donde se juntan fronteras distintas.
+
+    Un punto es unión si aparece en más de un anillo con vecinos
+    diferentes; ahí es donde cortamos los anillos en arcos.
+    """
+
+    vecinos = dict()
+
+    for poligonos in entidades:
+        for anillos in poligonos:
+            for anillo in anillos:
+
+                puntos = [tuple(punto) for punto in anillo[:-1].tolist()]
+                total = len(puntos)
+
+                for i, punto in enumerate(puntos):
+                    par = frozenset((puntos[i - 1], puntos[(i + 1) % total]))
+                    vecinos.setdefault(punto, set()).add(par)
+
+    return {punto for punto, pares in vecinos.items() if len(pares) > 1}
+
+
+def cortar_anillo(anillo, uniones):
+    """
+    Esta función corta un anillo cerrado en los arcos que
+    quedan entre dos uniones consecutivas.
+    """
+
+    puntos = [tuple(punto) for punto in anillo[:-1].tolist()]
+    indices = [i for i, punto in enumerate(puntos) if punto in uniones]
+
+    # Un anillo sin uniones es un solo arco cerrado. Lo rotamos para
+    # que empiece en su punto menor y así detectar anillos repetidos.
+    if not indices:
+        inicio = puntos.index(min(puntos))
+        puntos = puntos[inicio:] + puntos[:inicio]
+        return [puntos + puntos[:1]]
+
+    inicio = indices[0]
+    puntos = puntos[inicio:] + puntos[:inicio]
+    indices = [i - inicio for i in indices] + [len(puntos)]
+    puntos = puntos + puntos[:1]
+
+    return [
+        puntos[indices[i]:indices[i + 1] + 1]
+        for i in range(len(indices) - 1)
+    ]
+
+
+def simplificar_arco(arco, tolerancia):
+    """
+    Esta función aplica Douglas-Peucker a un arco y regresa
+    los índices de los puntos que se conservan.
+
+    Los extremos del arco siempre se conservan para que los
+    arcos vecinos sigan conectados.
+    """
+
+    total = len(arco)
+
+    if total <= 2 or tolerancia <= 0:
+        return np.arange(total)
+
+    conservar = np.zeros(total, dtype=bool)
+    conservar[0] = conservar[-1] = True
+
+    pendientes = [(0, total - 1)]
+
+    while pendientes:
+
+        inicio, fin = pendientes.pop()
+
+        if fin - inicio < 2:
+            continue
+
+        a = arco[inicio]
+        b = arco[fin]
+        medio = arco[inicio + 1:fin]
+
+        segmento = b - a
+        longitud = np.hypot(*segmento)
+
+        # En un arco cerrado los extremos coinciden, así que
+        # medimos la distancia al punto en lugar de a la recta.
+        if longitud == 0:
+            distancias = np.hypot(*(medio - a).T)
+        else:
+            distancias = np.abs(
+                segmento[0] * (medio[:, 1] - a[1]) -
+                segmento[1] * (medio[:, 0] - a[0])
+            ) / longitud
+
+        indice = int(np.argmax(distancias))
+
+        if distancias[indice] > tolerancia:
+            indice += inicio + 1
+            conservar[indice] = True
+            pendientes.append((inicio, indice))
+            pendientes.append((indice, fin))
+
+    return np.flatnonzero(conservar)
+
+
+def calcular_tolerancia(transformacion, pixeles, ancho=ANCHO, alto=ALTO):
+    """
+    Esta función convierte una tolerancia en pixeles de la imagen
+    final a grados.
+
+    La proyección equirectangular usa la misma escala en los dos
+    ejes, así que la tolerancia en grados vale igual para x y para y.
+    La cuadrícula cuantizada no: cada eje tiene su propia escala, por
+    eso los arcos se simplifican en grados y no en la cuadrícula.
+    """
+
+    escala = np.asarray(transformacion["scale"])
+    extension = escala * (CUANTIZACION - 1)
+
+    # El mapa se ajusta al lado que limite primero.
+    grados_por_pixel = max(
+        extension[0] / (ancho - 2 * MARGEN),
+        extension[1] / (alto - 2 * MARGEN)
+    )
+
+    return pixeles * grados_por_pixel
+
+
+def construir_topologia(geojson, pixeles=NIVELES["media"], cuantizacion=CUANTIZACION):
+    """
+    Esta función convierte el GeoJSON en una topología simplificada.
+
+    Las fronteras compartidas se guardan como un solo arco y se
+    simplifican una sola vez. Las islas que quedan por debajo de la
+    tolerancia se descartan, excepto si son lo único que tiene una entidad.
+    """
+
+    entidades, transformacion = cuantizar(geojson, cuantizacion)
+    uniones = buscar_uniones(entidades)
+    tolerancia = calcular_tolerancia(transformacion, pixeles)
+
+    arcos = list()
+    indice_arcos = dict()
+
+    def registrar(arco):
+        """
+        Regresa el índice del arco, usando ~índice si ya
+        existía en sentido contrario.
+        """
+
+        llave = tuple(arco)
+
+        if llave in indice_arcos:
+            return indice_arcos[llave]
+
+        # Los anillos sin uniones ya empiezan en su punto menor,
+        # así que su reverso también se encuentra aquí.
+        reverso = tuple(reversed(arco))
+
+        if reverso in indice_arcos:
+            return ~indice_arcos[reverso]
+
+        indice_arcos[llave] = len(arcos)
+        arcos.append(np.asarray(arco, dtype=np.int64))
+
+        return indice_arcos[llave]
+
+    # Primero cortamos todos los anillos en arcos.
+    referencias = [
+        [
+            [
+                [registrar(arco) for arco in cortar_anillo(anillo, uniones)]
+                for anillo in anillos
+            ]
+            for anillos in poligonos
+        ]
+        for poligonos in entidades
+    ]
+
+    # Después simplificamos cada arco una sola vez, medido en grados
+    # para que la tolerancia sea la misma en los dos ejes.
+    escala = np.asarray(transformacion["scale"])
+
+    simplificados = [
+        arco[simplificar_arco(arco * escala, tolerancia)]
+        for arco in arcos
+    ]
+
+    def contar_puntos(anillo, lista):
+        """
+        Regresa cuántos puntos tendría el anillo ya ensamblado.
+        """
+
+        return sum(len(lista[~i if i < 0 else i]) - 1 for i in anillo) + 1
+
+    geometrias = list()
+
+    for item, poligonos in zip(geojson["features"], referencias):
+
+        conservados = list()
+
+        for anillos in poligonos:
+
+            # Si el anillo exterior desaparece, desaparece todo el polígono.
+            if contar_puntos(anillos[0], simplificados) < 4:
+                continue
+
+            conservados.append([
+                anillo for anillo in anillos
+                if contar_puntos(anillo, simplificados) >= 4
+            ])
+
+        # Si la entidad se quedó sin polígonos, restauramos sus
+        # arcos originales para no perderla del mapa.
+        if not conservados and poligonos:
+            for anillo in poligonos[0]:
+                for i in anillo:
+                    i = ~i if i < 0 else i
+                    simplificados[i] = arcos[i]
+
+            conservados = [poligonos[0]]
+
+        if len(conservados) == 1:
+            geometria = {"type": "Polygon", "arcs": conservados[0]}
+        else:
+            geometria = {"type": "MultiPolygon", "arcs": conservados}
+
+        geometria["properties"] = item["properties"]
+        geometrias.append(geometria)
+
+    # Quitamos los arcos de las islas descartadas y renumeramos.
+    usados = sorted({
+        ~i if i < 0 else i
+        for geometria in geometrias
+        for anillo in recorrer_anillos(geometria)
+        for i in anillo
+    })
+
+    nuevo_indice = {viejo: nuevo for nuevo, viejo in enumerate(usados)}
+
+    for geometria in geometrias:
+        for anillo in recorrer_anillos(geometria):
+            anillo[:] = [
+                ~nuevo_indice[~i] if i < 0 else nuevo_indice[i] for i in anillo
+            ]
+
+    # Guardamos los arcos con codificación delta, como pide TopoJSON.
+    arcos_delta = list()
+
+    for arco in (simplificados[i] for i in usados):
+        delta = np.vstack([arco[:1], np.diff(arco, axis=0)])
+        arcos_delta.append(delta.tolist())
+
+    return {
+        "type": "Topology",
+        "transform": transformacion,
+        "objects": {
+            "entidades": {
+                "type": "GeometryCollection",
+                "geometries": geometrias
+            }
+        },
+        "arcs": arcos_delta,
+    }
+
+
+def topologia_a_geojson(topologia, decimales=DECIMALES, objeto="entidades"):
+    """
+    Esta función convierte la topología de vuelta a GeoJSON
+    para poder usarla en go.Choropleth.
+
+    Por defecto convierte el objeto de las entidades; con objeto
+    se puede leer otro, como la tierra del mapa base de plotly.
+    """
+
+    # Los arcos de una topología cuantizada vienen como diferencias
+    # enteras; sin transform ya están en grados.
+    if "transform" in topologia:
+        escala = np.asarray(topologia["transform"]["scale"])
+        traslado = np.asarray(topologia["transform"]["translate"])
+
+        def decodificar(arco):
+            return np.cumsum(np.asarray(arco, dtype=np.float64)[:, :2], axis=0) * escala + traslado
+    else:
+        def decodificar(arco):
+            return np.asarray(arco, dtype=np.float64)[:, :2]
+
+    # Decodificamos todos los arcos a grados una sola vez.
+    arcos = [np.round(decodificar(arco), decimales) for arco in topologia["arcs"]]
+
+    def armar_anillo(indices):
+        """
+        Une los arcos de un anillo en una sola lista de coordenadas.
+        """
+
+        partes = list()
+
+        for i in indices:
+            arco = arcos[~i][::-1] if i < 0 else arcos[i]
+            partes.append(arco if not partes else arco[1:])
+
+        return np.concatenate(partes).tolist()
+
+    features = list()
+
+    # El objeto puede ser una colección o una sola geometría.
+    geometrias = topologia["objects"][objeto]
+    geometrias = geometrias.get("geometries", [geometrias])
+
+    for geometria in geometrias:
+
+        if geometria["type"] not in ("Polygon", "MultiPolygon"):
+            continue
+
+        if geometria["type"] == "Polygon":
+            coordenadas = [armar_anillo(anillo) for anillo in geometria["arcs"]]
+        else:
+            coordenadas = [
+                [armar_anillo(anillo) for anillo in poligono]
+                for poligono in geometria["arcs"]
+            ]
+
+        features.append({
+            "type": "Feature",
+            "properties": geometria.get("properties", dict()),
+            "geometry": {"type": geometria["type"], "coordinates": coordenadas}
+        })
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+def unir_valores(geojson, claves, valores, propiedad="CVE_ENT"):
+    """
+    Esta función alinea los valores de una tabla con las features del GeoJSON.
+
+    Recibe las claves y los valores de cada fila de la tabla y regresa
+    dos arreglos en el orden de las features: sus claves (para usarlas
+    como locations) y el valor de cada una (para usarlo como z).
+    La unión se hace con un índice hash, así que no crece como
+    features × filas aunque haya miles de municipios.
+    """
+
+    ubicaciones = pd.Index(
+        [item["properties"][propiedad] for item in geojson["features"]])
+
+    posiciones = pd.Index(claves).get_indexer(ubicaciones)
+
+    if (posiciones < 0).any():
+        faltantes = ubicaciones[posiciones < 0].tolist()
+        raise ValueError(f"No hay valores para las claves {faltantes} del GeoJSON.")
+
+    return ubicaciones.to_numpy(), np.asarray(valores)[posiciones]
+
+
+def ruta_topologia(ruta, nivel):
+    """
+    Esta función regresa dónde se guarda en ./cache la topología de un
+    archivo para el nivel indicado.
+    """
+
+    return os.path.join(CARPETA_CACHE, f"{nombre_cache(ruta)}-{nivel}.topojson")
+
+
+def guardar_topologia(topologia, ruta_cache):
+    """
+    Esta función guarda la topología en ./cache sin dejar un archivo
+    a medias si el proceso se interrumpe.
+    """
+
+    os.makedirs(os.path.dirname(ruta_cache), exist_ok=True)
+
+    temporal = f"{ruta_cache}.{os.getpid()}.tmp"
+
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(topologia, archivo, ensure_ascii=False, separators=(",", ":"))
+
+    os.replace(temporal, ruta_cache)
+
+
+def cargar_geometria(ruta="./mexico.json", nivel="media"):
+    """
+    Esta función regresa el GeoJSON simplificado para el nivel indicado.
+
+    La topología se construye una sola vez y se guarda en ./cache.
+    Solo se vuelve a construir si cambia el archivo original, la
+    tolerancia del nivel, la cuantización o VERSION_CACHE. Si solo
+    cambió la fecha de modificación y el hash es el mismo, se guarda
+    la nueva fecha para no volver a calcular el hash.
+    """
+
+    ruta = os.path.abspath(ruta)
+    mtime = os.stat(ruta).st_mtime_ns
+    llave = (ruta, nivel)
+
+    if llave in _memoria and _memoria[llave]["mtime"] == mtime:
+        return _memoria[llave]["geojson"]
+
+    ruta_cache = ruta_topologia(ruta, nivel)
+
+    parametros = {
+        "version": VERSION_CACHE,
+        "tolerancia": NIVELES[nivel],
+        "cuantizacion": CUANTIZACION,
+    }
+
+    topologia = None
+
+    if os.path.exists(ruta_cache):
+        with open(ruta_cache, "r", encoding="utf-8") as archivo:
+            topologia = json.load(archivo)
+
+        fuente = topologia.get("fuente", dict())
+
+        if topologia.get("parametros") != parametros:
+            topologia = None
+        elif fuente.get("mtime") != mtime:
+            if fuente.get("hash") == calcular_hash(ruta):
+                fuente["mtime"] = mtime
+                guardar_topologia(topologia, ruta_cache)
+            else:
+                topologia = None
+
+    if topologia is None:
+        with open(ruta, "r", encoding="utf-8") as archivo:
+            geojson = json.load(archivo)
+
+        topologia = construir_topologia(geojson, NIVELES[nivel])
+        topologia["fuente"] = {"mtime": mtime, "hash": calcular_hash(ruta)}
+        topologia["parametros"] = parametros
+
+        guardar_topologia(topologia, ruta_cache)
+
+    geojson = topologia_a_geojson(topologia)
+    _memoria[llave] = {"mtime": mtime, "geojson": geojson}
+
+    return geojson
+
+
+if __name__ == "__main__":
+
+    # Construimos todos los niveles y mostramos cuánto se redujo cada uno.
+    original = os.path.getsize("./mexico.json")
+
+    for nivel in NIVELES:
+        geojson = cargar_geometria(nivel=nivel)
+        topologia = os.path.getsize(ruta_topologia("./mexico.json", nivel))
+        figura = len(json.dumps(geojson, separators=(",", ":")))
+
+        print(
+            f"{nivel}: topojson {topologia / 1024:,.0f} KB, "
+            f"geojson {figura / 1024:,.0f} KB (original {original / 1024:,.0f} KB)"
+        )
@@ -0,0 +1,447 @@
+"""
+Este módulo guarda la historia de todos los cortes de una consulta.
+
+Durante la noche de la consulta el PREP publica un corte nuevo cada
+pocos minutos. En lugar de guardar cientos de JSON de 200 KB, aquí
+guardamos los contadores de cada nodo como enteros: el primer corte
+completo y después solo la diferencia contra el corte anterior. Cada
+CADA_LLAVE cortes guardamos también el estado completo para poder
+reconstruir cualquier momento sin sumar toda la historia.
+
+Todo se guarda en un archivo .npz comprimido; las diferencias son
+casi todas cero y se comprimen muy bien. Cuando se sigue la noche
+completa, cada guardado escribe solo los cortes nuevos en un bloque
+aparte (historial.npz.d/bloque_000123.npz), así que no se reescribe
+la historia con cada corte y un guardado interrumpido no daña los
+cortes anteriores.
+
+Uso:
+
+    python historial.py cortes/2022/*.json --salida cortes/2022/historial.npz
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import zipfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import validacion
+
+
+# Contadores que guardamos de cada nodo y por cuánto se multiplican
+# para guardarlos como enteros (los porcentajes traen 4 decimales).
+CONTADORES = {
+    "total_actas": 1,
+    "actas_contabilizadas": 1,
+    "actas_contabilizadas_pct": 10000,
+    "lista_nominal": 1,
+    "participacion": 10000,
+    "total_votos": 1,
+    "si": 1,
+    "no": 1,
+    "nulo": 1,
+}
+
+# Cada cuántos cortes guardamos el estado completo.
+CADA_LLAVE = 32
+
+MESES = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6,
+    "julio": 7, "agosto": 8, "septiembre": 9, "octubre": 10, "noviembre": 11,
+    "diciembre": 12,
+}
+
+
+def leer_momento(data):
+    """
+    Esta función convierte fechaCorte y horaCorte (por ejemplo
+    "02 agosto 2021" y "21:30") en un datetime.
+    """
+
+    dia, mes, anio = data["fechaCorte"].lower().split()
+    hora, minuto = data["horaCorte"].split(":")
+
+    return datetime(int(anio), MESES[mes], int(dia), int(hora), int(minuto))
+
+
+def matriz_corte(data):
+    """
+    Esta función regresa los ids de los nodos y una matriz de enteros
+    con un renglón por nodo y una columna por contador.
+    """
+
+    nodos, votacion, _ = columnar.normalizar_consulta(data)
+    nodos = nodos.to_pandas().set_index("id_nodo")
+
+    # Votos de cada respuesta por nodo, según su idPartido.
+    votacion = votacion.to_pandas()
+    votacion["respuesta"] = votacion["id_partido"].map(validacion.RESPUESTAS)
+
+    respuestas = votacion.pivot(index="id_nodo", columns="respuesta", values="total")
+    respuestas = respuestas.reindex(nodos.index).fillna(0)
+
+    columnas = list()
+
+    for contador, escala in CONTADORES.items():
+        if contador in ("si", "no", "nulo"):
+            valores = respuestas[contador]
+        else:
+            valores = nodos[contador].fillna(0)
+
+        columnas.append(np.round(valores.to_numpy(dtype=np.float64) * escala))
+
+    return nodos.index.to_numpy(dtype=np.int16), np.column_stack(columnas).astype(np.int64)
+
+
+def crear_historial():
+    """
+    Esta función regresa un historial vacío.
+
+    Las diferencias y las llaves se guardan como listas de matrices
+    para que agregar un corte no copie toda la historia; se apilan
+    solo al guardar o al reconstruir todos los cortes.
+    """
+
+    return {
+        "momentos": np.array([], dtype="datetime64[s]"),
+        "cortes": np.array([], dtype=str),
+        "nodos": None,
+        "contadores": np.array(list(CONTADORES)),
+        "deltas": list(),
+        "llaves": list(),
+        "ultimo": None,
+        "guardado": None,
+    }
+
+
+def agregar_corte(historial, data):
+    """
+    Esta función agrega un corte al historial.
+
+    Si el corte ya estaba (mismo archivoCorte) no hace nada. Los cortes
+    deben llegar en orden; uno más viejo que el último se rechaza, igual
+    que uno con problemas (ver validacion.py).
+    """
+
+    if data["archivoCorte"] in historial["cortes"]:
+        return historial
+
+    validacion.validar_consulta(data, data["archivoCorte"])
+
+    momento = np.datetime64(leer_momento(data), "s")
+
+    if len(historial["momentos"]) and momento < historial["momentos"][-1]:
+        raise ValueError(f"El corte {data['archivoCorte']} es anterior al último del historial.")
+
+    nodos, matriz = matriz_corte(data)
+
+    if historial["nodos"] is None:
+        historial["nodos"] = nodos
+        anterior = np.zeros_like(matriz)
+    else:
+        if not np.array_equal(nodos, historial["nodos"]):
+            raise ValueError("El corte no tiene los mismos nodos que el historial.")
+
+        anterior = historial["ultimo"]
+
+    indice = len(historial["momentos"])
+
+    historial["deltas"].append(matriz - anterior)
+
+    if indice % CADA_LLAVE == 0:
+        historial["llaves"].append(matriz)
+
+    historial["momentos"] = np.append(historial["momentos"], momento)
+    historial["cortes"] = np.append(historial["cortes"], data["archivoCorte"])
+    historial["ultimo"] = matriz
+
+    return historial
+
+
+def construir_historial(archivos):
+    """
+    Esta función arma un historial a partir de varios JSON de cortes,
+    ordenándolos por fecha y hora.
+    """
+
+    datas = list()
+
+    for ruta in archivos:
+        with open(ruta, "r", encoding="utf-8") as archivo:
+            datas.append(json.load(archivo))
+
+    historial = crear_historial()
+
+    for data in sorted(datas, key=leer_momento):
+        agregar_corte(historial, data)
+
+    return historial
+
+
+# Nombre de los bloques que se agregan junto al .npz.
+_BLOQUE = re.compile(r"^bloque_(\d{6})\.npz$")
+
+
+def apilar(matrices, forma):
+    """
+    Esta función apila una lista de matrices en un arreglo de
+    forma (n,) + forma, aunque la lista esté vacía.
+    """
+
+    if not matrices:
+        return np.empty((0,) + forma, dtype=np.int64)
+
+    return np.stack(matrices)
+
+
+def listar_bloques(ruta):
+    """
+    Esta función regresa el número del primer corte y la ruta de
+    cada bloque agregado junto al .npz, en orden.
+    """
+
+    carpeta = f"{ruta}.d"
+
+    if not os.path.isdir(carpeta):
+        return list()
+
+    bloques = list()
+
+    for nombre in os.listdir(carpeta):
+        coincidencia = _BLOQUE.match(nombre)
+
+        if coincidencia is not None:
+            bloques.append((int(coincidencia.group(1)), os.path.join(carpeta, nombre)))
+
+    return sorted(bloques)
+
+
+def guardar_historial(historial, ruta):
+    """
+    Esta función guarda el historial en un .npz comprimido.
+
+    Si el historial ya se había guardado en esa ruta, solo escribe un
+    bloque con los cortes nuevos en la carpeta ruta.d. Si no, escribe
+    el archivo completo y borra los bloques. Todo se escribe en un
+    temporal que luego reemplaza al archivo, así que si el proceso
+    muere a la mitad lo que ya estaba guardado no se pierde.
+    """
+
+    ruta = os.path.abspath(ruta)
+    total = len(historial["momentos"])
+    forma = historial["ultimo"].shape if historial["ultimo"] is not None else (0, len(CONTADORES))
+
+    guardado = historial.get("guardado")
+
+    if guardado is not None and guardado[0] == ruta and os.path.exists(ruta):
+        inicio = guardado[1]
+
+        if inicio == total:
+            return
+    else:
+        inicio = 0
+
+    # Las llaves del bloque son las de sus cortes múltiplos de CADA_LLAVE.
+    llave = -(-inicio // CADA_LLAVE)
+    arreglos = {
+        "momentos": historial["momentos"][inicio:].astype(np.int64),
+        "cortes": historial["cortes"][inicio:],
+        "deltas": apilar(historial["deltas"][inicio:], forma),
+        "llaves": apilar(historial["llaves"][llave:], forma),
+    }
+
+    if inicio == 0:
+        destino = ruta
+        arreglos.update({
+            "nodos": historial["nodos"],
+            "contadores": historial["contadores"],
+            "cada_llave": np.array(CADA_LLAVE),
+        })
+    else:
+        # El bloque recuerda el corte anterior para saber que
+        # continúa este historial y no uno que ya se reescribió.
+        destino = os.path.join(f"{ruta}.d", f"bloque_{inicio:06d}.npz")
+        arreglos["previo"] = historial["cortes"][inicio - 1]
+
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+
+    temporal = f"{destino}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(temporal, **arreglos)
+    os.replace(temporal, destino)
+
+    # Los bloques posteriores a este son de un guardado que no se
+    # pudo leer completo; ya no sirven.
+    if inicio == 0:
+        shutil.rmtree(f"{ruta}.d", ignore_errors=True)
+    else:
+        for numero, ruta_bloque in listar_bloques(ruta):
+            if numero > inicio:
+                os.remove(ruta_bloque)
+
+    historial["guardado"] = (ruta, total)
+
+
+def cargar_historial(ruta):
+    """
+    Esta función carga un historial guardado con guardar_historial.
+
+    Los bloques se agregan en orden mientras continúen el historial.
+    Si uno está incompleto (el proceso murió mientras se escribía) o no
+    sigue al anterior, se ignora junto con los que vienen después y
+    el historial llega hasta el último corte que sí se guardó.
+    """
+
+    ruta = os.path.abspath(ruta)
+
+    with np.load(ruta) as archivo:
+        if int(archivo["cada_llave"]) != CADA_LLAVE:
+            raise ValueError("El historial se guardó con otra separación entre llaves.")
+
+        momentos = [archivo["momentos"]]
+        cortes = [archivo["cortes"]]
+
+        historial = {
+            "nodos": archivo["nodos"],
+            "contadores": archivo["contadores"],
+            "deltas": list(archivo["deltas"]),
+            "llaves": list(archivo["llaves"]),
+        }
+
+    for numero, ruta_bloque in listar_bloques(ruta):
+        try:
+            with np.load(ruta_bloque) as bloque:
+                if numero != len(historial["deltas"]) or str(bloque["previo"]) != cortes[-1][-1]:
+                    raise ValueError("no sigue al corte anterior")
+
+                nuevos = (bloque["momentos"], bloque["cortes"], list(bloque["deltas"]), list(bloque["llaves"]))
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as error:
+            print(f"Se ignoran los bloques del historial desde {ruta_bloque}: {error}")
+            break
+
+        momentos.append(nuevos[0])
+        cortes.append(nuevos[1])
+        historial["deltas"].extend(nuevos[2])
+        historial["llaves"].extend(nuevos[3])
+
+    historial["momentos"] = np.concatenate(momentos).astype("datetime64[s]")
+    historial["cortes"] = np.concatenate(cortes)
+
+    historial["ultimo"] = reconstruir(historial, len(historial["momentos"]) - 1)
+    historial["guardado"] = (ruta, len(historial["momentos"]))
+
+    return historial
+
+
+def reconstruir(historial, indice):
+    """
+    Esta función regresa la matriz de enteros del corte indicado,
+    partiendo de la llave más cercana anterior.
+    """
+
+    llave = indice // CADA_LLAVE
+    inicio = llave * CADA_LLAVE
+
+    return historial["llaves"][llave] + sum(historial["deltas"][inicio + 1:indice + 1], 0)
+
+
+def a_tabla(historial, matriz):
+    """
+    Esta función convierte una matriz de enteros en un DataFrame
+    con los valores en sus unidades originales.
+    """
+
+    escalas = np.array([CONTADORES[contador] for contador in historial["contadores"]])
+
+    return pd.DataFrame(
+        matriz / escalas,
+        index=pd.Index(historial["nodos"], name="id_nodo"),
+        columns=historial["contadores"]
+    )
+
+
+def estado_en(historial, momento):
+    """
+    Esta función regresa el estado de todos los nodos según el último
+    corte publicado antes o en el momento indicado.
+    """
+
+    indice = np.searchsorted(historial["momentos"], np.datetime64(momento, "s"), side="right") - 1
+
+    if indice < 0:
+        raise ValueError(f"No hay cortes antes de {momento}.")
+
+    return a_tabla(historial, reconstruir(historial, indice))
+
+
+def estados(historial):
+    """
+    Esta función reconstruye todos los cortes de una sola vez.
+
+    Regresa un arreglo de enteros de forma (cortes, nodos, contadores).
+    Como el primer delta es el corte completo, basta con una suma
+    acumulada.
+    """
+
+    return np.cumsum(np.stack(historial["deltas"]), axis=0)
+
+
+def serie(historial, contador, nodos=None):
+    """
+    Esta función regresa la evolución de un contador en el tiempo,
+    con un renglón por corte y una columna por nodo.
+    """
+
+    columna = list(historial["contadores"]).index(contador)
+    valores = estados(historial)[:, :, columna] / CONTADORES[contador]
+
+    tabla = pd.DataFrame(
+        valores,
+        index=pd.DatetimeIndex(historial["momentos"], name="momento"),
+        columns=pd.Index(historial["nodos"], name="id_nodo")
+    )
+
+    return tabla if nodos is None else tabla[nodos]
+
+
+def avance(historial, id_nodo=100):
+    """
+    Esta función regresa, para un nodo (por defecto el nacional),
+    la participación contra el porcentaje de actas contabilizadas
+    en cada corte.
+    """
+
+    todos = estados(historial)
+    fila = int(np.flatnonzero(historial["nodos"] == id_nodo)[0])
+    contadores = list(historial["contadores"])
+
+    columnas = ["actas_contabilizadas_pct", "participacion", "total_votos"]
+
+    return pd.DataFrame(
+        {
+            columna: todos[:, fila, contadores.index(columna)] / CONTADORES[columna]
+            for columna in columnas
+        },
+        index=pd.DatetimeIndex(historial["momentos"], name="momento")
+    )
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Arma el historial de cortes de una consulta.")
+    parser.add_argument("archivos", nargs="+")
+    parser.add_argument("--salida", required=True)
+    argumentos = parser.parse_args()
+
+    historial = construir_historial(
+        [ruta for ruta in argumentos.archivos if os.path.basename(ruta) != "actual.json"])
+    guardar_historial(historial, argumentos.salida)
+
+    print(f"{len(historial['momentos'])} cortes, {os.path.getsize(argumentos.salida) / 1024:,.1f} KB")
+    print(avance(historial))
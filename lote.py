@@ -0,0 +1,311 @@
+"""
+Este módulo genera varias consultas y gráficas en paralelo.
+
+Las figuras se construyen una sola vez en el proceso principal, que
+las necesita para calcular sus huellas, y cada una se renderiza en un
+proceso del pool. Si alguna gráfica del lote usa kaleido, cada proceso
+abre su propia sesión al iniciar y la reutiliza para todas las
+gráficas que le toquen. Las imágenes regresan al proceso principal,
+que es el único que escribe archivos, así que el resultado no
+depende del orden en que terminen los procesos.
+
+Con --serie las mismas gráficas se renderizan después una por una en
+el proceso principal, para medir la aceleración real del pool.
+
+Uso:
+
+    python lote.py [--consultas 2021,2022] [--salidas mapa,tabla,barras,compuesta]
+                   [--carpeta ./salidas] [--procesos 4] [--forzar] [--serie]
+                   [--cprofile <etapa>] [--tracemalloc <etapa>] [--perfil <archivo>]
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import util
+
+import construccion
+import perfil
+import renderizador
+from configuracion import MOTOR_MAPA, MOTOR_TABLA
+from consulta import (CONSULTAS, build_bars, build_map, build_table, combine_images,
+                      create_bars, create_map, create_table)
+
+
+# Función que genera cada tipo de gráfica.
+GRAFICAS = {
+    "mapa": create_map,
+    "tabla": create_table,
+    "barras": create_bars,
+}
+
+# Función que construye la figura de cada gráfica.
+FIGURAS = {
+    "mapa": build_map,
+    "tabla": build_table,
+    "barras": build_bars,
+}
+
+# Las salidas que se pueden pedir. La compuesta necesita el mapa y la tabla.
+SALIDAS = ["mapa", "tabla", "barras", "compuesta"]
+
+# Motor de las gráficas que se pueden dibujar sin kaleido; las
+# barras siempre usan kaleido.
+MOTORES = {"mapa": MOTOR_MAPA, "tabla": MOTOR_TABLA}
+
+
+def usa_kaleido(clave, grafica):
+    """
+    Esta función indica si la gráfica de una consulta se renderiza
+    con kaleido, igual que lo decide consulta.py.
+    """
+
+    if grafica not in MOTORES:
+        return True
+
+    return CONSULTAS[clave].get("motor", MOTORES[grafica]) == "kaleido"
+
+
+def iniciar_proceso(opciones_perfil=None, kaleido=True):
+    """
+    Esta función se ejecuta una vez en cada proceso del pool
+    y, si el lote usa kaleido, deja lista su sesión.
+
+    También copia las opciones de perfil.py del proceso principal.
+    """
+
+    perfil.opciones.update(opciones_perfil or dict())
+
+    # Con fork el proceso hereda los registros del principal; los
+    # borramos para no contarlos dos veces.
+    perfil.registros.clear()
+
+    if kaleido:
+        renderizador.iniciar()
+
+    # Los procesos del pool no ejecutan atexit, así que usamos
+    # el mecanismo de multiprocessing para cerrar la sesión.
+    util.Finalize(None, renderizador.detener, exitpriority=10)
+
+    # Si se pidió cProfile, cada proceso guarda su propio perfil.
+    util.Finalize(None, perfil.guardar_perfil, exitpriority=5)
+
+
+def renderizar_grafica(clave, grafica, figura):
+    """
+    Esta función renderiza dentro del pool la figura ya construida de
+    una gráfica y regresa sus bytes junto con el tiempo que tardó y
+    los registros de cada etapa.
+    """
+
+    inicio = time.perf_counter()
+    imagen = GRAFICAS[grafica](CONSULTAS[clave], fig=figura)
+
+    return clave, grafica, imagen, time.perf_counter() - inicio, perfil.extraer()
+
+
+def renderizar_en_serie(tareas, figuras):
+    """
+    Esta función renderiza las mismas gráficas una por una en el
+    proceso principal, con su propia sesión de kaleido, y regresa
+    cuántos segundos tardó. Las imágenes no se guardan.
+    """
+
+    # Los registros de esta pasada no son parte del lote.
+    previos = len(perfil.registros)
+    inicio = time.perf_counter()
+
+    with renderizador.sesion():
+        for clave, grafica in tareas:
+            GRAFICAS[grafica](CONSULTAS[clave], fig=figuras[(clave, grafica)])
+
+    segundos = time.perf_counter() - inicio
+    del perfil.registros[previos:]
+
+    return segundos
+
+
+def planear(pendientes):
+    """
+    Esta función regresa la lista ordenada de gráficas que hay
+    que renderizar para obtener las salidas pendientes.
+    """
+
+    graficas = set()
+
+    for clave, salida in pendientes:
+        if salida == "compuesta":
+            graficas.update([(clave, "mapa"), (clave, "tabla")])
+        else:
+            graficas.add((clave, salida))
+
+    return sorted(graficas, key=lambda tarea: (tarea[0], list(GRAFICAS).index(tarea[1])))
+
+
+def buscar_pendientes(claves, salidas, carpeta, manifiesto, forzar=False):
+    """
+    Esta función regresa las salidas que hay que generar, la huella
+    de cada una y las figuras construidas para calcularlas, que son
+    las que se renderizan. Las salidas cuyas entradas no cambiaron se
+    omiten.
+    """
+
+    pendientes = list()
+    huellas = dict()
+    construidas = dict()
+
+    for clave in claves:
+        config = CONSULTAS[clave]
+
+        figuras = dict()
+
+        for grafica in GRAFICAS:
+            if grafica in salidas or (grafica != "barras" and "compuesta" in salidas):
+                with perfil.etapa("figura", f"{clave}-{grafica}"):
+                    figuras[grafica] = FIGURAS[grafica](config)
+
+        huellas_consulta = construccion.huellas_consulta(config, figuras)
+        construidas.update({(clave, grafica): figura for grafica, figura in figuras.items()})
+
+        for salida in SALIDAS:
+            if salida not in salidas:
+                continue
+
+            ruta = os.path.join(carpeta, f"{clave}-{salida}.png")
+            huellas[ruta] = huellas_consulta[salida]
+
+            if forzar or not construccion.esta_al_dia(manifiesto, ruta, huellas[ruta]):
+                pendientes.append((clave, salida))
+
+    return pendientes, huellas, construidas
+
+
+def generar_lote(claves, salidas, carpeta="./salidas", procesos=None, forzar=False, serie=False):
+    """
+    Esta función renderiza en paralelo las gráficas cuyas entradas
+    cambiaron y guarda las salidas pedidas en la carpeta indicada.
+
+    Regresa un resumen con el tiempo real, el del renderizado en el
+    pool y lo que tardó cada gráfica. Con serie=True también renderiza
+    las mismas gráficas una por una y la aceleración es el tiempo en
+    serie entre el del pool, los dos medidos de principio a fin
+    (incluyendo el arranque de Chromium).
+    """
+
+    inicio = time.perf_counter()
+
+    manifiesto = construccion.cargar_manifiesto()
+    pendientes, huellas, figuras = buscar_pendientes(claves, salidas, carpeta, manifiesto, forzar)
+
+    tareas = planear(pendientes)
+    procesos = procesos or max(1, min(len(tareas), os.cpu_count() or 1))
+
+    os.makedirs(carpeta, exist_ok=True)
+
+    imagenes = dict()
+    tiempos = dict()
+    paralelo = 0.0
+
+    if tareas:
+        kaleido = any(usa_kaleido(clave, grafica) for clave, grafica in tareas)
+        inicio_pool = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=procesos, initializer=iniciar_proceso,
+                                 initargs=(dict(perfil.opciones), kaleido)) as pool:
+            futuros = [
+                pool.submit(renderizar_grafica, clave, grafica, figuras[(clave, grafica)])
+                for clave, grafica in tareas
+            ]
+
+            for futuro in futuros:
+                clave, grafica, imagen, segundos, registros = futuro.result()
+                perfil.registros.extend(registros)
+                imagenes[(clave, grafica)] = imagen
+                tiempos[f"{clave}-{grafica}"] = segundos
+
+        paralelo = time.perf_counter() - inicio_pool
+
+    # Escribimos los archivos en un orden fijo.
+    for clave, salida in pendientes:
+
+        ruta = os.path.join(carpeta, f"{clave}-{salida}.png")
+
+        if salida == "compuesta":
+            combine_images(imagenes[(clave, "mapa")], imagenes[(clave, "tabla")], ruta)
+        else:
+            with perfil.etapa("guardar", ruta):
+                with open(ruta, "wb") as archivo:
+                    archivo.write(imagenes[(clave, salida)])
+
+        construccion.registrar(manifiesto, ruta, huellas[ruta])
+
+    construccion.guardar_manifiesto(manifiesto)
+
+    resumen = {
+        "procesos": procesos,
+        "omitidas": len(huellas) - len(pendientes),
+        "graficas": tiempos,
+        "segundos_real": time.perf_counter() - inicio,
+        "segundos_paralelo": paralelo,
+    }
+
+    if serie and tareas:
+        resumen["segundos_serie"] = renderizar_en_serie(tareas, figuras)
+        resumen["aceleracion"] = resumen["segundos_serie"] / paralelo
+
+    return resumen
+
+
+def imprimir_resumen(resumen):
+    """
+    Esta función muestra el resumen de generar_lote.
+    """
+
+    for nombre, segundos in resumen["graficas"].items():
+        print(f"{nombre:<24}{segundos * 1000:>10,.0f} ms")
+
+    print(f"\nProcesos: {resumen['procesos']}")
+    print(f"Salidas al día (omitidas): {resumen['omitidas']}")
+    print(f"Tiempo real: {resumen['segundos_real']:,.2f} s")
+    print(f"Renderizado en el pool: {resumen['segundos_paralelo']:,.2f} s")
+
+    if "aceleracion" in resumen:
+        print(f"Renderizado en serie: {resumen['segundos_serie']:,.2f} s")
+        print(f"Aceleración (serie / pool): {resumen['aceleracion']:,.2f}x")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Genera varias consultas en paralelo.")
+    parser.add_argument("--consultas", default=",".join(CONSULTAS))
+    parser.add_argument("--salidas", default=",".join(SALIDAS))
+    parser.add_argument("--carpeta", default="./salidas")
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--forzar", action="store_true")
+    parser.add_argument("--serie", action="store_true",
+                        help="Renderiza también en serie para medir la aceleración.")
+    parser.add_argument("--cprofile", default=None, choices=perfil.ETAPAS)
+    parser.add_argument("--tracemalloc", default=None, choices=perfil.ETAPAS)
+    parser.add_argument("--perfil", default=None, help="Archivo JSON lines para los registros.")
+    argumentos = parser.parse_args()
+
+    perfil.configurar(argumentos.cprofile, argumentos.tracemalloc, argumentos.perfil)
+
+    claves = argumentos.consultas.split(",")
+    salidas = argumentos.salidas.split(",")
+
+    for clave in claves:
+        if clave not in CONSULTAS:
+            parser.error(f"Consulta desconocida: {clave}")
+
+    for salida in salidas:
+        if salida not in SALIDAS:
+            parser.error(f"Salida desconocida: {salida}")
+
+    imprimir_resumen(generar_lote(
+        claves, salidas, argumentos.carpeta, argumentos.procesos, argumentos.forzar,
+        argumentos.serie))
+
+    print()
+    print(perfil.reporte())
@@ -0,0 +1,238 @@
+"""
+Este módulo mide cada etapa de una ejecución normal.
+
+Las etapas son cargar, normalizar, figura, serializar, rasterizar,
+componer y guardar. Cada vez que se ejecuta una etapa anotamos su
+tiempo real, su tiempo de CPU y la memoria máxima del proceso.
+
+Además se puede activar cProfile o tracemalloc para una sola etapa,
+sin editar los scripts, con variables de entorno:
+
+    PERFIL_CPROFILE=rasterizar python consulta.py 2022
+    PERFIL_TRACEMALLOC=normalizar python consulta2021.py
+
+o con las opciones --cprofile=<etapa> y --tracemalloc=<etapa> de
+consulta.py. Con PERFIL_SALIDA (o --perfil=<archivo>) los registros
+se guardan en un archivo JSON lines.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # En Windows no existe el módulo resource.
+    resource = None
+
+
+ETAPAS = ["cargar", "normalizar", "figura", "serializar", "rasterizar", "componer", "guardar"]
+
+# Carpeta donde guardamos los archivos .prof de cProfile.
+CARPETA_PERFILES = "./salidas/perfiles"
+
+# Aquí guardamos un registro por cada vez que se ejecuta una etapa.
+registros = list()
+
+opciones = {
+    "cprofile": os.environ.get("PERFIL_CPROFILE"),
+    "tracemalloc": os.environ.get("PERFIL_TRACEMALLOC"),
+    "salida": os.environ.get("PERFIL_SALIDA"),
+}
+
+# Un solo perfil de cProfile acumula todas las veces que se ejecuta la etapa.
+_perfil = None
+
+
+def configurar(etapa_cprofile=None, etapa_tracemalloc=None, salida=None):
+    """
+    Esta función indica en qué etapa activar cProfile o tracemalloc
+    y en qué archivo guardar los registros. Los valores None no
+    cambian la configuración.
+    """
+
+    cambios = {"cprofile": etapa_cprofile, "tracemalloc": etapa_tracemalloc, "salida": salida}
+
+    for nombre, valor in cambios.items():
+        if valor is not None:
+            if nombre != "salida" and valor not in ETAPAS:
+                raise ValueError(f"La etapa {valor} no existe. Las etapas son: {', '.join(ETAPAS)}")
+
+            opciones[nombre] = valor
+
+
+def memoria_maxima():
+    """
+    Esta función regresa la memoria máxima que ha usado el proceso,
+    en MB, o None si el sistema no la reporta.
+    """
+
+    if resource is None:
+        return None
+
+    maxima = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux la reporta en KB y macOS en bytes.
+    if sys.platform == "darwin":
+        return maxima / 1024 ** 2
+
+    return maxima / 1024
+
+
+@contextmanager
+def etapa(nombre, detalle=""):
+    """
+    Esta función mide una etapa durante todo el bloque with.
+
+    detalle identifica qué se procesó (por ejemplo la consulta o la
+    gráfica). Si la etapa tiene cProfile o tracemalloc activado,
+    solo se perfila el código dentro del bloque.
+    """
+
+    global _perfil
+
+    perfilar = opciones["cprofile"] == nombre
+    rastrear = opciones["tracemalloc"] == nombre and not tracemalloc.is_tracing()
+
+    if rastrear:
+        tracemalloc.start()
+
+    if perfilar:
+        _perfil = _perfil or cProfile.Profile()
+        _perfil.enable()
+
+    memoria_inicial = memoria_maxima()
+    cpu = time.process_time()
+    inicio = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        cpu = time.process_time() - cpu
+
+        if perfilar:
+            _perfil.disable()
+
+        registro = {
+            "etapa": nombre,
+            "detalle": detalle,
+            "segundos": segundos,
+            "cpu": cpu,
+            "memoria_mb": memoria_maxima(),
+        }
+
+        # Si la memoria máxima subió, esta etapa marcó un nuevo pico.
+        if memoria_inicial is not None:
+            registro["aumento_mb"] = registro["memoria_mb"] - memoria_inicial
+
+        if rastrear:
+            _, pico = tracemalloc.get_traced_memory()
+            estadisticas = tracemalloc.take_snapshot().statistics("lineno")
+            tracemalloc.stop()
+
+            registro["tracemalloc_pico_mb"] = pico / 1024 ** 2
+            registro["asignaciones"] = [
+                {"linea": str(estadistica.traceback), "mb": estadistica.size / 1024 ** 2}
+                for estadistica in estadisticas[:10]
+            ]
+
+        registros.append(registro)
+
+        if opciones["salida"]:
+            guardar_registro(registro, opciones["salida"])
+
+
+def guardar_registro(registro, ruta):
+    """
+    Esta función agrega un registro al archivo JSON lines indicado.
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+
+    with open(ruta, "a", encoding="utf-8") as archivo:
+        archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+
+def extraer():
+    """
+    Esta función regresa los registros acumulados y los borra.
+
+    Sirve para mandar al proceso principal los registros de un
+    proceso del pool.
+    """
+
+    extraidos = list(registros)
+    registros.clear()
+
+    return extraidos
+
+
+def guardar_perfil(carpeta=CARPETA_PERFILES):
+    """
+    Esta función guarda el perfil de cProfile en un archivo .prof
+    y regresa su ruta, o None si no se perfiló ninguna etapa.
+    """
+
+    if _perfil is None:
+        return None
+
+    os.makedirs(carpeta, exist_ok=True)
+
+    ruta = os.path.join(carpeta, f"{opciones['cprofile']}-{os.getpid()}.prof")
+    _perfil.dump_stats(ruta)
+
+    return ruta
+
+
+def reporte(funciones=15):
+    """
+    Esta función regresa un texto con el tiempo total, el número de
+    veces y la memoria máxima de cada etapa.
+
+    Si se usó cProfile, agrega las funciones que más tiempo tomaron,
+    y si se usó tracemalloc, las líneas que más memoria asignaron.
+    """
+
+    lineas = [f"{'Etapa':<14}{'Veces':>6}{'Real':>12}{'CPU':>12}{'Memoria':>12}"]
+
+    for nombre in ETAPAS:
+        propios = [registro for registro in registros if registro["etapa"] == nombre]
+
+        if not propios:
+            continue
+
+        segundos = sum(registro["segundos"] for registro in propios)
+        cpu = sum(registro["cpu"] for registro in propios)
+        memoria = max(registro["memoria_mb"] or 0 for registro in propios)
+
+        lineas.append(
+            f"{nombre:<14}{len(propios):>6}{segundos * 1000:>10,.0f}ms"
+            f"{cpu * 1000:>10,.0f}ms{memoria:>10,.0f}MB"
+        )
+
+    rastreados = [registro for registro in registros if "asignaciones" in registro]
+
+    for registro in rastreados:
+        lineas.append(
+            f"\ntracemalloc en {registro['etapa']} ({registro['detalle']}): "
+            f"pico de {registro['tracemalloc_pico_mb']:,.1f} MB")
+
+        for asignacion in registro["asignaciones"][:5]:
+            lineas.append(f"  {asignacion['mb']:>8,.2f} MB  {asignacion['linea']}")
+
+    if _perfil is not None:
+        texto = io.StringIO()
+        pstats.Stats(_perfil, stream=texto).sort_stats("cumulative").print_stats(funciones)
+
+        lineas.append(f"\ncProfile en {opciones['cprofile']}:")
+        lineas.append(texto.getvalue().strip())
+
+    return "\n".join(lineas)
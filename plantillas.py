@@ -0,0 +1,101 @@
+"""
+Este módulo guarda las plantillas de las figuras.
+
+Construir una figura con go.Figure y update_layout valida cada
+propiedad, y eso toma decenas de milisegundos por figura. Aquí cada
+plantilla (todo el formato de una gráfica, sin datos) se construye y
+se valida una sola vez, y se guarda como JSON en memoria y en
+./cache/plantillas/. Cada figura nueva es una copia de ese JSON a la
+que solo se le ponen los datos y los textos.
+
+Las figuras que salen de una plantilla son diccionarios que ya no
+se validan; renderizador.py y plotly.io los aceptan tal cual.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+from importlib.metadata import version
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from datos import CARPETA_CACHE, calcular_hash
+
+
+CARPETA_PLANTILLAS = os.path.join(CARPETA_CACHE, "plantillas")
+
+# Aquí guardamos el JSON de cada plantilla ya construida.
+_memoria = dict()
+
+
+def huella_plantilla(nombre, crear):
+    """
+    Esta función calcula la huella de una plantilla a partir de su
+    nombre, la versión de plotly y el código del módulo que la crea.
+
+    Si cambia cualquier parte del formato en ese módulo, la plantilla
+    guardada deja de servir y se vuelve a construir.
+    """
+
+    sha = hashlib.sha256()
+
+    for parte in [nombre, version("plotly"), calcular_hash(inspect.getsourcefile(crear))]:
+        sha.update(parte.encode("utf-8"))
+        sha.update(b"\0")
+
+    return sha.hexdigest()[:16]
+
+
+def obtener_plantilla(nombre, crear, *argumentos):
+    """
+    Esta función regresa el JSON de una plantilla.
+
+    Primero la busca en memoria, después en disco, y si no existe
+    llama a crear(*argumentos), que debe regresar una go.Figure.
+    """
+
+    if nombre in _memoria:
+        return _memoria[nombre]
+
+    ruta = os.path.join(CARPETA_PLANTILLAS, f"{nombre}-{huella_plantilla(nombre, crear)}.json")
+
+    if os.path.exists(ruta):
+        with open(ruta, "r", encoding="utf-8") as archivo:
+            texto = archivo.read()
+    else:
+        texto = pio.to_json(crear(*argumentos), validate=False)
+
+        os.makedirs(CARPETA_PLANTILLAS, exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            archivo.write(texto)
+
+        os.replace(temporal, ruta)
+
+    _memoria[nombre] = texto
+
+    return texto
+
+
+def instanciar(nombre, crear, *argumentos):
+    """
+    Esta función regresa una copia nueva de la plantilla como
+    diccionario, lista para ponerle los datos.
+    """
+
+    return json.loads(obtener_plantilla(nombre, crear, *argumentos))
+
+
+def a_figura(especificacion, validar=False):
+    """
+    Esta función regresa la especificación tal cual o, si validar
+    es True, como una go.Figure validada por plotly.
+    """
+
+    if validar:
+        return go.Figure(especificacion)
+
+    return especificacion
@@ -0,0 +1,316 @@
+"""
+Este módulo sigue el PREP en vivo durante la noche de la consulta.
+
+Consultamos periódicamente el JSON del PREP con una sesión de
+requests que reutiliza conexiones. Mandamos ETag e If-Modified-Since
+para que el servidor responda 304 si nada cambió, y solo cuando
+cambia el corte (fechaCorte, horaCorte y archivoCorte) guardamos
+el JSON, lo agregamos al historial y volvemos a generar las gráficas.
+
+También incluye un servidor local que repite cortes ya guardados,
+para probar todo sin depender del INE.
+
+Uso:
+
+    python prep.py seguir URL --consulta 2022 [--intervalo 60]
+    python prep.py repetir cortes/2022/*.json [--puerto 8000] [--cada 30]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import historial
+import validacion
+
+
+# Carpeta donde guardamos cada corte descargado.
+CARPETA_CORTES = "./cortes"
+
+# Tiempo máximo de espera entre intentos cuando el servidor falla.
+ESPERA_MAXIMA = 600
+
+
+def crear_sesion(conexiones=4, reintentos=3):
+    """
+    Esta función crea una sesión de requests con un pool de conexiones
+    y reintentos automáticos con espera exponencial.
+    """
+
+    reintento = Retry(
+        total=reintentos,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True
+    )
+
+    adaptador = HTTPAdapter(
+        pool_connections=conexiones, pool_maxsize=conexiones, max_retries=reintento)
+
+    sesion = requests.Session()
+    sesion.mount("http://", adaptador)
+    sesion.mount("https://", adaptador)
+    sesion.headers["Accept-Encoding"] = "gzip, deflate"
+
+    return sesion
+
+
+def identificar_corte(data):
+    """
+    Esta función regresa el identificador del corte de un JSON del PREP.
+    """
+
+    return f"{data['fechaCorte']} {data['horaCorte']} {data['archivoCorte']}"
+
+
+def descargar(sesion, url, estado, tiempo_espera=30):
+    """
+    Esta función descarga el JSON solo si cambió desde la última vez.
+
+    estado guarda el ETag y el Last-Modified de la última respuesta.
+    Regresa los bytes del JSON o None si el servidor respondió 304.
+    """
+
+    encabezados = dict()
+
+    if estado.get("etag"):
+        encabezados["If-None-Match"] = estado["etag"]
+
+    if estado.get("modificado"):
+        encabezados["If-Modified-Since"] = estado["modificado"]
+
+    respuesta = sesion.get(url, headers=encabezados, timeout=tiempo_espera)
+
+    if respuesta.status_code == 304:
+        return None
+
+    respuesta.raise_for_status()
+
+    estado["etag"] = respuesta.headers.get("ETag")
+    estado["modificado"] = respuesta.headers.get("Last-Modified")
+
+    return respuesta.content
+
+
+def guardar_corte(contenido, data, carpeta):
+    """
+    Esta función guarda el corte con su fecha y hora en el nombre y
+    actualiza actual.json, que es el que usan las gráficas.
+    """
+
+    os.makedirs(carpeta, exist_ok=True)
+
+    nombre = os.path.splitext(data["archivoCorte"])[0] or f"{data['fechaCorte']} {data['horaCorte']}"
+    nombre = "".join(letra if letra.isalnum() or letra in "-_" else "_" for letra in nombre)
+
+    rutas = [os.path.join(carpeta, f"{nombre}.json"), os.path.join(carpeta, "actual.json")]
+
+    for ruta in rutas:
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+
+        with open(temporal, "wb") as archivo:
+            archivo.write(contenido)
+
+        os.replace(temporal, ruta)
+
+    return rutas[1]
+
+
+def seguir(url, clave, intervalo=60, carpeta=None, renderizar=True, maximo_cortes=None,
+           sesion=None):
+    """
+    Esta función consulta el PREP cada cierto intervalo y vuelve a
+    generar las gráficas cada vez que aparece un corte nuevo.
+
+    Si el servidor falla, la espera se duplica hasta ESPERA_MAXIMA y
+    vuelve al intervalo normal con la primera respuesta correcta; el
+    azar solo se aplica a cada pausa, no a la espera que se duplica.
+    Un corte que no se puede leer, que tiene problemas o que el
+    historial rechaza se ignora y esperamos al siguiente, igual que
+    uno que ya estaba en el historial (por ejemplo, al reiniciar).
+    Regresa la lista de cortes nuevos procesados.
+    """
+
+    carpeta = carpeta or os.path.join(CARPETA_CORTES, clave)
+    sesion = sesion or crear_sesion()
+
+    # Cada corte nuevo también se agrega al historial de la consulta.
+    ruta_historial = os.path.join(carpeta, "historial.npz")
+
+    if os.path.exists(ruta_historial):
+        cortes_previos = historial.cargar_historial(ruta_historial)
+    else:
+        cortes_previos = historial.crear_historial()
+
+    estado = dict()
+    cortes = list()
+    espera = intervalo
+
+    if renderizar:
+        import construccion
+        import renderizador
+        from consulta import CONSULTAS, generar_consulta
+
+        manifiesto = construccion.cargar_manifiesto()
+
+    try:
+        while True:
+
+            try:
+                contenido = descargar(sesion, url, estado)
+                espera = intervalo
+            except (requests.RequestException, ValueError) as error:
+                espera = min(espera * 2, ESPERA_MAXIMA)
+                pausa = espera * random.uniform(0.8, 1.2)
+                print(f"Error al consultar el PREP ({error}), reintentando en {pausa:,.0f} s.")
+                time.sleep(pausa)
+                continue
+
+            ruta = None
+
+            # Un corte que no se puede leer, con problemas o que el historial
+            # rechaza (más viejo o con otros nodos) no se guarda ni se grafica.
+            if contenido is not None:
+                try:
+                    data = json.loads(contenido)
+                    validacion.validar_consulta(data, "El corte")
+
+                    corte = identificar_corte(data)
+
+                    # Comparamos contra todo el historial, no solo contra
+                    # los cortes de esta sesión. El JSON se guarda antes
+                    # que el historial: si el proceso muere entre los dos,
+                    # el corte se vuelve a procesar al reiniciar.
+                    if data["archivoCorte"] not in cortes_previos["cortes"]:
+                        historial.agregar_corte(cortes_previos, data)
+
+                        ruta = guardar_corte(contenido, data, carpeta)
+                        historial.guardar_historial(cortes_previos, ruta_historial)
+
+                        cortes.append(corte)
+                        print(f"Nuevo corte: {corte}")
+                except (ValueError, KeyError) as error:
+                    print(f"No se pudo procesar el corte, esperamos al siguiente: {error}")
+
+                    # Sin ETag volvemos a descargarlo completo la próxima vez.
+                    estado.clear()
+
+            if renderizar and ruta is not None:
+                config = dict(CONSULTAS[clave], archivo=ruta)
+                generar_consulta(config, manifiesto)
+
+            if maximo_cortes and len(cortes) >= maximo_cortes:
+                break
+
+            time.sleep(espera)
+    finally:
+        if renderizar:
+            renderizador.detener()
+
+    return cortes
+
+
+class ManejadorRepeticion(BaseHTTPRequestHandler):
+    """
+    Esta clase responde con el corte que toca según el tiempo
+    transcurrido, como lo haría el servidor del PREP.
+    """
+
+    archivos = list()
+    cada = 30.0
+    inicio = 0.0
+
+    def do_GET(self):
+
+        transcurrido = time.monotonic() - self.inicio
+        indice = min(int(transcurrido / self.cada), len(self.archivos) - 1)
+
+        with open(self.archivos[indice], "rb") as archivo:
+            contenido = archivo.read()
+
+        etag = '"' + hashlib.sha1(contenido).hexdigest()[:16] + '"'
+        modificado = formatdate(time.time() - transcurrido + indice * self.cada, usegmt=True)
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(contenido)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", modificado)
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def log_message(self, formato, *argumentos):
+        pass
+
+
+def crear_servidor_repeticion(archivos, puerto=8000, cada=30.0, anfitrion="127.0.0.1"):
+    """
+    Esta función crea un servidor local que repite los cortes
+    indicados, avanzando uno cada cierto número de segundos.
+
+    Con puerto=0 el sistema elige un puerto libre; se puede consultar
+    en servidor.server_address.
+    """
+
+    manejador = type("Manejador", (ManejadorRepeticion,), {
+        "archivos": sorted(archivos),
+        "cada": cada,
+        "inicio": time.monotonic(),
+    })
+
+    return ThreadingHTTPServer((anfitrion, puerto), manejador)
+
+
+def iniciar_en_segundo_plano(servidor):
+    """
+    Esta función pone a correr el servidor en un hilo y lo regresa.
+    """
+
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+
+    return hilo
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Sigue el PREP en vivo.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    parser_seguir = comandos.add_parser("seguir", help="Consulta el PREP y genera las gráficas.")
+    parser_seguir.add_argument("url")
+    parser_seguir.add_argument("--consulta", required=True)
+    parser_seguir.add_argument("--intervalo", type=float, default=60)
+    parser_seguir.add_argument("--sin-graficas", action="store_true")
+
+    parser_repetir = comandos.add_parser("repetir", help="Repite cortes guardados.")
+    parser_repetir.add_argument("archivos", nargs="+")
+    parser_repetir.add_argument("--puerto", type=int, default=8000)
+    parser_repetir.add_argument("--cada", type=float, default=30)
+
+    argumentos = parser.parse_args()
+
+    if argumentos.comando == "seguir":
+        seguir(argumentos.url, argumentos.consulta, argumentos.intervalo,
+               renderizar=not argumentos.sin_graficas)
+    else:
+        servidor = crear_servidor_repeticion(argumentos.archivos, argumentos.puerto, argumentos.cada)
+        print(f"Repitiendo {len(argumentos.archivos)} cortes en http://127.0.0.1:{argumentos.puerto}/")
+        servidor.serve_forever()
@@ -0,0 +1,556 @@
+"""
+Este módulo dibuja mapas Choropleth directamente con PIL.
+
+Cuando el GeoJSON tiene miles de polígonos (distritos o municipios)
+mandarlo completo a kaleido es muy lento. Aquí proyectamos todas las
+coordenadas de una sola vez con NumPy y rellenamos los polígonos con
+ImageDraw, que es código en C. La imagen resultante se puede usar
+sola o como fondo de una figura de plotly.
+
+También puede dibujar la figura completa del mapa (barra de color,
+marcas y anotaciones) a partir de lo que regresa build_map, sin
+plotly.js ni Chromium (ver dibujar_mapa). La tierra de los países
+vecinos sale del mismo mapa base que usa plotly.js, que se descarga
+una sola vez con:
+
+    python rasterizador.py
+
+Los emojis de las anotaciones (como el de @lapanquecita) no se
+dibujan: las fuentes de texto no los traen y PIL no mezcla fuentes.
+"""
+
+import base64
+import json
+import os
+import re
+from functools import lru_cache
+from io import BytesIO
+
+import numpy as np
+import requests
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+from plotly.colors import get_colorscale, unlabel_rgb
+
+from configuracion import MAPA_BASE, URL_MAPA_BASE
+from geometria import obtener_poligonos, topologia_a_geojson
+
+
+# Fuentes que buscamos, en orden. Quicksand es la que usan las
+# gráficas; si no está instalada usamos DejaVu Sans.
+FUENTES = ["Quicksand-Regular.ttf", "Quicksand-Medium.ttf", "Quicksand.ttf", "DejaVuSans.ttf"]
+FUENTES_NEGRITAS = ["Quicksand-Bold.ttf", "Quicksand-SemiBold.ttf", "DejaVuSans-Bold.ttf"]
+
+# Plotly deja un margen alrededor de la geometría con fitbounds.
+# Al calcular el trazo Choropleth, plotly.js acolcha los extremos de
+# longitud y latitud ("padded") con el 5% del largo del eje de cada
+# lado, igual que el autorange de los ejes cartesianos, y fitbounds
+# escala para que quepa ese rango acolchado. La geometría ocupa
+# entonces 1 - 2 * 0.05 del marco en la dimensión que la limita
+# (descontando el grosor del marco, ver dibujar_mapa).
+ACOLCHADO_GEO = 0.05
+AJUSTE_GEO = 1 - 2 * ACOLCHADO_GEO
+
+# Emojis y otros caracteres fuera del plano básico, que las
+# fuentes de texto no tienen.
+_FUERA_DE_PLANO = re.compile(r"[\U00010000-\U0010FFFF]\s*")
+
+
+def crear_paleta(escala="portland", niveles=256):
+    """
+    Esta función convierte una escala de colores de plotly
+    en una tabla de colores RGB de 0 a niveles - 1.
+
+    La escala puede ser un nombre o una lista de [posición, color],
+    como la que regresa una figura de plotly.
+    """
+
+    if isinstance(escala, str):
+        escala = get_colorscale(escala)
+
+    posiciones = np.array([float(posicion) for posicion, _ in escala])
+    colores = np.array([
+        unlabel_rgb(color) if color.startswith("rgb") else ImageColor.getrgb(color)
+        for _, color in escala
+    ], dtype=np.float64)
+
+    muestras = np.linspace(0, 1, niveles)
+
+    paleta = np.column_stack([
+        np.interp(muestras, posiciones, colores[:, canal]) for canal in range(3)
+    ])
+
+    return np.round(paleta).astype(np.uint8)
+
+
+def aplanar_anillos(geojson):
+    """
+    Esta función junta todos los anillos en un solo arreglo de puntos.
+
+    Regresa los puntos, dónde empieza cada anillo, a qué feature
+    pertenece y si es un anillo exterior o un hueco.
+    """
+
+    anillos = list()
+    features = list()
+    exteriores = list()
+
+    for i, item in enumerate(geojson["features"]):
+        for poligono in obtener_poligonos(item["geometry"]):
+            for j, anillo in enumerate(poligono):
+                anillos.append(np.asarray(anillo, dtype=np.float64)[:, :2])
+                features.append(i)
+                exteriores.append(j == 0)
+
+    inicios = np.cumsum([0] + [len(anillo) for anillo in anillos])
+
+    return np.concatenate(anillos), inicios, np.array(features), np.array(exteriores)
+
+
+def proyectar(puntos, ancho, alto, margen=0, ajuste=1.0, limites=None):
+    """
+    Esta función proyecta longitud y latitud a pixeles.
+
+    Usa la misma proyección equirectangular que plotly usa por
+    defecto y ajusta la geometría al área disponible sin deformarla,
+    como hace fitbounds="geojson". Con ajuste menor a 1 la geometría
+    ocupa solo esa fracción del área.
+
+    Con limites (mínimo y máximo) el ajuste se hace a esos límites en
+    lugar de a los de los puntos, para proyectar otra capa, como la
+    tierra, en el mismo encuadre.
+    """
+
+    minimo, maximo = limites if limites is not None else (puntos.min(axis=0), puntos.max(axis=0))
+    extension = np.maximum(maximo - minimo, 1e-12)
+
+    escala = ajuste * min((ancho - 2 * margen) / extension[0], (alto - 2 * margen) / extension[1])
+
+    # Centramos la geometría en el lienzo.
+    desplazamiento = np.array([ancho, alto]) / 2 - extension * escala / 2
+
+    x = (puntos[:, 0] - minimo[0]) * escala + desplazamiento[0]
+    y = (maximo[1] - puntos[:, 1]) * escala + desplazamiento[1]
+
+    return np.column_stack([x, y])
+
+
+def pintar_choropleth(geojson, valores, zmin, zmax, escala="portland", ancho=1200, alto=640,
+                      margen=10, fondo="#082032", borde="#FFFFFF", ancho_borde=1.0,
+                      sin_dato="#1C0A00", suavizado=2, ajuste=1.0, tierra=None):
+    """
+    Esta función dibuja un mapa Choropleth y regresa una imagen de PIL.
+
+    Los valores deben venir en el orden de las features (ver
+    geometria.unir_valores). Dibujamos a una resolución mayor y
+    luego reducimos para suavizar los bordes.
+
+    Si se pasa tierra (un GeoJSON), se pinta debajo de las features
+    con el color sin_dato, como la capa de tierra de plotly.
+    """
+
+    puntos, inicios, features, exteriores = aplanar_anillos(geojson)
+    limites = (puntos.min(axis=0), puntos.max(axis=0))
+
+    # Proyectamos todos los puntos en una sola operación.
+    puntos = proyectar(puntos, ancho * suavizado, alto * suavizado, margen * suavizado, ajuste)
+
+    # Calculamos el color de cada feature de una sola vez.
+    paleta = crear_paleta(escala)
+    valores = np.asarray(valores, dtype=np.float64)
+    normalizados = np.nan_to_num(np.clip((valores - zmin) / max(zmax - zmin, 1e-12), 0, 1))
+    indices = np.round(normalizados * (len(paleta) - 1)).astype(np.int64)
+
+    colores = [tuple(color) for color in paleta[indices].tolist()]
+    color_sin_dato = ImageColor.getrgb(sin_dato)
+    color_fondo = ImageColor.getrgb(fondo)
+
+    imagen = Image.new("RGB", (ancho * suavizado, alto * suavizado), color_fondo)
+    dibujo = ImageDraw.Draw(imagen)
+
+    # La tierra va debajo de todo, en el encuadre de las features.
+    if tierra is not None:
+        puntos_tierra, inicios_tierra, _, exteriores_tierra = aplanar_anillos(tierra)
+        puntos_tierra = proyectar(
+            puntos_tierra, ancho * suavizado, alto * suavizado, margen * suavizado, ajuste, limites)
+
+        for i, exterior in enumerate(exteriores_tierra):
+            dibujo.polygon(
+                puntos_tierra[inicios_tierra[i]:inicios_tierra[i + 1]].ravel().tolist(),
+                fill=color_sin_dato if exterior else color_fondo)
+
+    anillos = [
+        puntos[inicios[i]:inicios[i + 1]].ravel().tolist()
+        for i in range(len(inicios) - 1)
+    ]
+
+    # Primero rellenamos; los huecos se pintan con el color del fondo.
+    for anillo, feature, exterior in zip(anillos, features, exteriores):
+        if exterior:
+            color = color_sin_dato if np.isnan(valores[feature]) else colores[feature]
+        else:
+            color = color_fondo
+
+        dibujo.polygon(anillo, fill=color)
+
+    # Después dibujamos todos los bordes para que ningún
+    # relleno vecino los tape.
+    grosor = max(1, round(ancho_borde * suavizado))
+
+    if ancho_borde > 0:
+        for anillo in anillos:
+            dibujo.line(anillo, fill=borde, width=grosor)
+
+    if suavizado > 1:
+        imagen = imagen.resize((ancho, alto), Image.BOX)
+
+    return imagen
+
+
+def descargar_mapa_base(ruta=MAPA_BASE):
+    """
+    Esta función descarga el mapa base de plotly del mismo CDN que
+    usa plotly.js y lo guarda en ruta.
+
+    Se corre una sola vez al preparar el servidor; al dibujar
+    nunca se usa la red.
+    """
+
+    respuesta = requests.get(URL_MAPA_BASE, timeout=30)
+    respuesta.raise_for_status()
+
+    if "land" not in respuesta.json().get("objects", dict()):
+        raise ValueError(f"{URL_MAPA_BASE} no tiene el objeto land.")
+
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+
+    with open(temporal, "wb") as archivo:
+        archivo.write(respuesta.content)
+
+    os.replace(temporal, ruta)
+
+
+@lru_cache(maxsize=None)
+def cargar_tierra(ruta=MAPA_BASE):
+    """
+    Esta función carga la tierra del mapa base de plotly y la
+    regresa como GeoJSON.
+
+    Si el archivo no existe lanza un error en lugar de dibujar
+    el mapa sin los países vecinos (ver descargar_mapa_base).
+    """
+
+    if not os.path.exists(ruta):
+        raise FileNotFoundError(
+            f"No existe el mapa base {ruta}. Descárgalo una vez con: python rasterizador.py")
+
+    with open(ruta, "r", encoding="utf-8") as archivo:
+        topologia = json.load(archivo)
+
+    return topologia_a_geojson(topologia, objeto="land")
+
+
+def a_uri(imagen):
+    """
+    Esta función convierte una imagen de PIL en un data URI PNG,
+    que es lo que espera plotly en layout.images.
+    """
+
+    buffer = BytesIO()
+    imagen.save(buffer, "PNG")
+
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+@lru_cache(maxsize=None)
+def cargar_fuente(tamano, negrita=False):
+    """
+    Esta función regresa la primera fuente de FUENTES (o de
+    FUENTES_NEGRITAS) que esté instalada, en el tamaño indicado.
+
+    Se guarda en memoria para no leer el archivo en cada texto.
+    """
+
+    for nombre in FUENTES_NEGRITAS + FUENTES if negrita else FUENTES:
+        try:
+            return ImageFont.truetype(nombre, tamano)
+        except OSError:
+            continue
+
+    return ImageFont.load_default(tamano)
+
+
+def dibujar_texto(imagen, texto, x, y, tamano, color, xanchor="center", yanchor="middle", angulo=0):
+    """
+    Esta función dibuja un texto acomodado como en plotly: (x, y) es
+    el punto de anclaje de la caja del texto, en pixeles.
+
+    angulo es el textangle de plotly; -90 se lee de abajo hacia arriba.
+    Los caracteres fuera del plano básico, como los emojis, se quitan
+    porque Quicksand y DejaVu Sans no los tienen.
+    """
+
+    fuente = cargar_fuente(tamano)
+    texto = _FUERA_DE_PLANO.sub("", texto)
+
+    ascenso, descenso = fuente.getmetrics()
+
+    # Plotly deja 1 pixel de relleno alrededor del texto.
+    caja = Image.new("LA", (round(fuente.getlength(texto)) + 2, ascenso + descenso + 2), (0, 0))
+    ImageDraw.Draw(caja).text((1, 1), texto, font=fuente, fill=(255, 255))
+
+    if angulo:
+        caja = caja.rotate(-angulo, expand=True, resample=Image.BICUBIC)
+
+    ancho, alto = caja.size
+
+    izquierda = x - {"left": 0, "center": ancho / 2, "right": ancho}[xanchor]
+    arriba = y - {"top": 0, "middle": alto / 2, "bottom": alto}[yanchor]
+
+    relleno = Image.new("RGB", caja.size, color)
+    imagen.paste(relleno, (round(izquierda), round(arriba)), caja.getchannel("A"))
+
+
+def dibujar_barra_color(imagen, barra, escala, zmin, zmax, area, color_texto):
+    """
+    Esta función dibuja la barra de color de un trazo con sus marcas.
+
+    barra es el diccionario colorbar de la figura y area es el
+    rectángulo (x0, y0, x1, y1) del área de graficación en pixeles.
+    """
+
+    x0, y0, x1, y1 = area
+    dibujo = ImageDraw.Draw(imagen)
+
+    grosor = barra.get("thickness", 30)
+    izquierda = round(x0 + barra.get("x", 1.02) * (x1 - x0) + barra.get("xpad", 10))
+    derecha = izquierda + grosor
+
+    centro = y0 + (1 - barra.get("y", 0.5)) * (y1 - y0)
+    largo = barra.get("len", 1) * (y1 - y0)
+    arriba = round(centro - largo / 2 + barra.get("ypad", 10))
+    abajo = round(centro + largo / 2 - barra.get("ypad", 10))
+
+    # El degradado va de zmax arriba a zmin abajo.
+    paleta = crear_paleta(escala)
+    indices = np.round(np.linspace(len(paleta) - 1, 0, abajo - arriba)).astype(np.int64)
+    degradado = np.repeat(paleta[indices][:, np.newaxis, :], grosor, axis=1)
+
+    imagen.paste(Image.fromarray(degradado), (izquierda, arriba))
+
+    # Plotly centra el contorno sobre el borde de la barra.
+    contorno = barra.get("outlinewidth", 1)
+
+    if contorno > 0:
+        dibujo.rectangle(
+            (izquierda - contorno // 2, arriba - contorno // 2,
+             derecha + contorno // 2 - 1, abajo + contorno // 2 - 1),
+            outline=barra.get("outlinecolor", "#444444"),
+            width=contorno
+        )
+
+    largo_marca = barra.get("ticklen", 5) if barra.get("ticks") == "outside" else 0
+    inicio_marca = derecha + contorno // 2
+    tamano = barra.get("tickfont", dict()).get("size", 12)
+
+    for valor, etiqueta in zip(barra.get("tickvals", list()), barra.get("ticktext", list())):
+        if not zmin <= valor <= zmax:
+            continue
+
+        y = abajo - (valor - zmin) / max(zmax - zmin, 1e-12) * (abajo - arriba)
+
+        if largo_marca:
+            dibujo.line(
+                [(inicio_marca, y), (inicio_marca + largo_marca - 1, y)],
+                fill=barra.get("tickcolor", "#444444"),
+                width=barra.get("tickwidth", 1)
+            )
+
+        dibujar_texto(imagen, etiqueta, inicio_marca + largo_marca + 2, y, tamano, color_texto, "left")
+
+
+def dibujar_marco(dibujo, caja, color, grosor):
+    """
+    Esta función dibuja un marco centrado sobre el borde de la caja,
+    como los contornos de plotly.
+    """
+
+    if grosor > 0:
+        x0, y0, x1, y1 = caja
+        dibujo.rectangle(
+            (x0 - grosor // 2, y0 - grosor // 2, x1 + grosor // 2 - 1, y1 + grosor // 2 - 1),
+            outline=color,
+            width=grosor
+        )
+
+
+def dibujar_mapa(fig):
+    """
+    Esta función dibuja con PIL la figura completa de un mapa, como
+    la regresa build_map, y regresa una imagen de PIL.
+
+    Entiende las dos plantillas del mapa: la que tiene un trazo
+    Choropleth y la que ya trae el mapa como imagen de fondo. Los
+    países vecinos se pintan con la tierra del mapa base de plotly
+    (ver cargar_tierra).
+    """
+
+    if hasattr(fig, "to_dict"):
+        fig = fig.to_dict()
+
+    layout = fig["layout"]
+    trazo = fig["data"][0]
+
+    ancho = layout.get("width", 700)
+    alto = layout.get("height", 450)
+    margen = {"l": 80, "r": 80, "t": 100, "b": 80, **layout.get("margin", dict())}
+    area = (margen["l"], margen["t"], ancho - margen["r"], alto - margen["b"])
+    ancho_area = area[2] - area[0]
+    alto_area = area[3] - area[1]
+
+    color_texto = layout.get("font", dict()).get("color", "#444444")
+    tamano_texto = layout.get("font", dict()).get("size", 12)
+
+    imagen = Image.new("RGB", (ancho, alto), layout.get("paper_bgcolor", "#FFFFFF"))
+    dibujo = ImageDraw.Draw(imagen)
+
+    if trazo.get("type") == "choropleth":
+        geo = layout.get("geo", dict())
+        linea = trazo.get("marker", dict()).get("line", dict())
+
+        # Plotly conserva la proporción 2:1 de la proyección
+        # equirectangular y centra el marco en el área de graficación.
+        ancho_marco = min(ancho_area, 2 * alto_area)
+        alto_marco = ancho_marco // 2
+        x_marco = area[0] + (ancho_area - ancho_marco) // 2
+        y_marco = area[1] + (alto_area - alto_marco) // 2
+
+        # Acomodamos z en el orden de las features del GeoJSON.
+        propiedad = trazo.get("featureidkey", "id").split(".")[-1]
+        por_clave = dict(zip(map(str, trazo["locations"]), trazo["z"]))
+        valores = np.array([
+            por_clave.get(str(item["properties"].get(propiedad)), np.nan)
+            for item in trazo["geojson"]["features"]
+        ], dtype=np.float64)
+
+        zmin = trazo.get("zmin", np.nanmin(valores))
+        zmax = trazo.get("zmax", np.nanmax(valores))
+        escala = trazo.get("colorscale", "portland")
+        barra = trazo.get("colorbar", dict())
+
+        # En los mapas de kaleido la geometría cabe en el marco menos
+        # su grosor: con framewidth=2 mide 0.9 * 598 pixeles de alto.
+        grosor_marco = geo.get("framewidth", 1)
+
+        mapa = pintar_choropleth(
+            trazo["geojson"], valores, zmin, zmax, escala,
+            ancho=ancho_marco,
+            alto=alto_marco,
+            margen=grosor_marco / 2,
+            fondo=geo.get("oceancolor", "#FFFFFF"),
+            borde=linea.get("color", "#444444"),
+            ancho_borde=linea.get("width", 0.5),
+            sin_dato=geo.get("landcolor", "#F0F0F0"),
+            ajuste=AJUSTE_GEO,
+            tierra=cargar_tierra() if geo.get("showland", True) else None
+        )
+
+        imagen.paste(mapa, (x_marco, y_marco))
+        dibujar_marco(
+            dibujo, (x_marco, y_marco, x_marco + ancho_marco, y_marco + alto_marco),
+            geo.get("framecolor", "#444444"), grosor_marco)
+    else:
+        # El mapa ya viene rasterizado en layout.images.
+        for fondo in layout.get("images", list()):
+            datos = base64.b64decode(fondo["source"].split(",", 1)[1])
+            tamano = (round(fondo.get("sizex", 1) * ancho_area), round(fondo.get("sizey", 1) * alto_area))
+
+            posicion = (
+                round(area[0] + fondo.get("x", 0) * ancho_area),
+                round(area[3] - fondo.get("y", 1) * alto_area)
+            )
+
+            imagen.paste(Image.open(BytesIO(datos)).convert("RGB").resize(tamano, Image.LANCZOS), posicion)
+
+        marcador = trazo["marker"]
+        zmin = marcador["cmin"]
+        zmax = marcador["cmax"]
+        escala = marcador.get("colorscale", "portland")
+        barra = marcador.get("colorbar", dict())
+
+    dibujar_barra_color(imagen, barra, escala, zmin, zmax, area, color_texto)
+
+    for anotacion in layout.get("annotations", list()):
+        x = area[0] + anotacion.get("x", 0.5) * ancho_area
+        y = area[3] - anotacion.get("y", 0.5) * alto_area
+
+        # Como en plotly, si no se desactiva la flecha el texto se
+        # acomoda en la cola de la flecha, que no dibujamos.
+        if anotacion.get("showarrow", True):
+            x += anotacion.get("ax", -10)
+            y += anotacion.get("ay", -30)
+
+        fuente = anotacion.get("font", dict())
+
+        dibujar_texto(
+            imagen, anotacion.get("text", ""), x, y,
+            fuente.get("size", tamano_texto),
+            fuente.get("color", color_texto),
+            anotacion.get("xanchor", "center"),
+            anotacion.get("yanchor", "middle"),
+            anotacion.get("textangle", 0)
+        )
+
+    return imagen
+
+
+def renderizar_mapa(fig, formato="png"):
+    """
+    Esta función dibuja el mapa con PIL y regresa la imagen
+    codificada en bytes, igual que renderizador.renderizar.
+    """
+
+    buffer = BytesIO()
+    dibujar_mapa(fig).save(buffer, formato.upper())
+
+    return buffer.getvalue()
+
+
+def comparar_imagenes(imagen, referencia, umbral=48):
+    """
+    Esta función compara dos imágenes del mismo tamaño.
+
+    Recibe imágenes de PIL, bytes o rutas. Regresa la diferencia
+    media por canal (de 0 a 255) y la fracción de pixeles que
+    difieren más que umbral en algún canal.
+    """
+
+    def abrir(origen):
+        if isinstance(origen, Image.Image):
+            return origen.convert("RGB")
+
+        if isinstance(origen, bytes):
+            origen = BytesIO(origen)
+
+        return Image.open(origen).convert("RGB")
+
+    imagen = abrir(imagen)
+    referencia = abrir(referencia)
+
+    if imagen.size != referencia.size:
+        raise ValueError(f"Las imágenes miden {imagen.size} y {referencia.size}.")
+
+    diferencia = np.abs(
+        np.asarray(imagen, dtype=np.int16) - np.asarray(referencia, dtype=np.int16))
+
+    return {
+        "diferencia_media": float(diferencia.mean()),
+        "pixeles_distintos": float((diferencia.max(axis=2) > umbral).mean()),
+    }
+
+
+if __name__ == "__main__":
+
+    descargar_mapa_base()
+    print(f"Mapa base guardado en {MAPA_BASE} ({os.path.getsize(MAPA_BASE) / 1024:,.0f} KB)")
@@ -0,0 +1,194 @@
+"""
+Este módulo mantiene una sola sesión de kaleido por proceso.
+
+Con kaleido 1.x cada llamada a write_image abre y cierra su propio
+Chromium si no hay un servidor corriendo. Aquí lo iniciamos una vez
+y mandamos todas las figuras por la misma sesión, midiendo cuánto
+tarda cada una.
+"""
+
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+import plotly.io as pio
+
+import perfil
+
+
+# Aquí guardamos cuánto tardó cada figura en esta sesión.
+tiempos = list()
+
+_activa = False
+
+
+def version_kaleido():
+    """
+    Esta función regresa la versión mayor de kaleido instalada.
+    """
+
+    from importlib.metadata import version
+
+    return int(version("kaleido").split(".")[0])
+
+
+def iniciar(pestanas=1):
+    """
+    Esta función inicia la sesión de Chromium si aún no existe.
+
+    En kaleido 1.x pestanas indica cuántas figuras se pueden
+    renderizar al mismo tiempo. En kaleido 0.x plotly ya mantiene
+    un solo subproceso vivo, así que no hay nada que iniciar.
+    """
+
+    global _activa
+
+    if _activa:
+        return
+
+    inicio = time.perf_counter()
+
+    if version_kaleido() >= 1:
+        import kaleido
+
+        kaleido.start_sync_server(n=pestanas, silence_warnings=True)
+
+    _activa = True
+    tiempos.append({"figura": "(inicio)", "segundos": time.perf_counter() - inicio})
+
+
+def detener():
+    """
+    Esta función cierra la sesión de Chromium.
+    """
+
+    global _activa
+
+    if not _activa:
+        return
+
+    if version_kaleido() >= 1:
+        import kaleido
+
+        kaleido.stop_sync_server(silence_warnings=True)
+
+    _activa = False
+
+
+@contextmanager
+def sesion():
+    """
+    Esta función abre una sesión que dura todo el bloque with.
+
+    Chromium se inicia con la primera figura, así que si no hay
+    nada que renderizar no se llega a abrir.
+    """
+
+    try:
+        yield
+    finally:
+        detener()
+
+
+def renderizar(figuras, formato="png", escala=1):
+    """
+    Esta función convierte varias figuras en imágenes usando la misma sesión.
+
+    Recibe un diccionario de nombre -> figura y regresa otro
+    de nombre -> bytes de la imagen. Con escala mayor a 1 las
+    imágenes raster salen más grandes que la figura.
+    """
+
+    iniciar()
+
+    imagenes = dict()
+
+    for nombre, figura in figuras.items():
+        inicio = time.perf_counter()
+
+        # Convertimos la figura en un diccionario aparte para saber
+        # cuánto tarda plotly y cuánto tarda kaleido.
+        with perfil.etapa("serializar", nombre):
+            if hasattr(figura, "to_dict"):
+                figura = figura.to_dict()
+
+        with perfil.etapa("rasterizar", nombre):
+            imagenes[nombre] = pio.to_image(figura, format=formato, scale=escala, validate=False)
+
+        tiempos.append({"figura": nombre, "segundos": time.perf_counter() - inicio})
+
+    return imagenes
+
+
+def guardar(figuras):
+    """
+    Esta función renderiza y guarda varias figuras.
+
+    Recibe un diccionario de ruta -> figura. El formato se
+    toma de la extensión de cada ruta.
+    """
+
+    for ruta, figura in figuras.items():
+        formato = ruta.rsplit(".", 1)[-1]
+        imagen = renderizar({ruta: figura}, formato=formato)[ruta]
+
+        with open(ruta, "wb") as archivo:
+            archivo.write(imagen)
+
+
+def guardar_lote(trabajos, tamano_lote=32, pestanas=1):
+    """
+    Esta función renderiza y guarda muchas figuras ya convertidas en
+    diccionarios, por ejemplo los cuadros de una animación.
+
+    Recibe un iterable de (ruta, figura) y lo consume de tamano_lote
+    en tamano_lote, así que nunca hay más de un lote en memoria. Las
+    figuras no se validan. Con kaleido 1.x cada lote se reparte entre
+    las pestañas de la sesión. Regresa cuántas figuras guardó.
+    """
+
+    iniciar(pestanas)
+
+    trabajos = iter(trabajos)
+    guardadas = 0
+
+    while True:
+        lote = list(islice(trabajos, tamano_lote))
+
+        if not lote:
+            break
+
+        inicio = time.perf_counter()
+
+        if version_kaleido() >= 1:
+            import kaleido
+
+            kaleido.write_fig_from_object_sync(
+                [
+                    {"fig": figura, "path": ruta, "opts": {"format": ruta.rsplit(".", 1)[-1]}}
+                    for ruta, figura in lote
+                ],
+                cancel_on_error=True
+            )
+        else:
+            for ruta, figura in lote:
+                imagen = pio.to_image(figura, format=ruta.rsplit(".", 1)[-1], validate=False)
+
+                with open(ruta, "wb") as archivo:
+                    archivo.write(imagen)
+
+        guardadas += len(lote)
+        tiempos.append({"figura": f"(lote de {len(lote)})", "segundos": time.perf_counter() - inicio})
+
+    return guardadas
+
+
+def reporte():
+    """
+    Esta función regresa un texto con el tiempo de cada figura.
+    """
+
+    lineas = [f"{t['figura']:<24}{t['segundos'] * 1000:>10,.0f} ms" for t in tiempos]
+    lineas.append(f"{'Total':<24}{sum(t['segundos'] for t in tiempos) * 1000:>10,.0f} ms")
+
+    return "\n".join(lineas)
@@ -0,0 +1,420 @@
+"""
+Este módulo es un servicio HTTP que sirve las gráficas a los tableros.
+
+Cada gráfica se pide con una URL como
+
+    http://localhost:8050/mapa?consulta=2022&nivel=entidad&formato=png
+
+Las rutas son /mapa, /tabla, /barras y /compuesta. Los parámetros son
+consulta (la última configurada si no se indica), nivel (solo cambia
+el mapa y la compuesta), formato (png, webp, jpg, svg o pdf) y tamano
+(original, retina, social o miniatura). /metricas regresa en JSON
+los aciertos y fallos del cache, cuántas peticiones esperaron un
+renderizado que ya estaba en curso y la latencia de cada ruta.
+
+El servicio mantiene abierta una sola sesión de kaleido y un cache
+LRU con las imágenes ya codificadas, limitado en bytes. La llave de
+cada imagen es la huella de sus parámetros y de los archivos de
+entrada (tamaño y fecha de modificación), así que si cambian los
+datos la imagen se vuelve a generar. Si llegan varias peticiones de
+la misma imagen mientras se renderiza, todas esperan ese único
+renderizado.
+
+Solo usa la biblioteca estándar, no hace falta instalar un servidor web.
+
+Uso:
+
+    python servidor.py [--host 127.0.0.1] [--puerto 8050] [--cache-mb 64]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import renderizador
+from configuracion import CONSULTAS, NIVELES_MAPA
+from construccion import huella
+from consulta import build_bars, build_map, build_table
+from exportar import FORMATOS_RASTER, FORMATOS_VECTORIALES, TAMANOS, generar_salidas
+
+
+# Las figuras que forman cada gráfica. La compuesta es el mapa con la tabla abajo.
+GRAFICAS = {
+    "mapa": ["mapa"],
+    "tabla": ["tabla"],
+    "barras": ["barras"],
+    "compuesta": ["mapa", "tabla"],
+}
+
+CONSTRUCTORES = {"mapa": build_map, "tabla": build_table, "barras": build_bars}
+
+TIPOS = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpg": "image/jpeg",
+    "svg": "image/svg+xml",
+    "pdf": "application/pdf",
+}
+
+ESTADOS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           500: "Internal Server Error"}
+
+# Cuántas latencias recientes guardamos por ruta.
+LATENCIAS_GUARDADAS = 1000
+
+# Imágenes ya codificadas, de la menos a la más usada recientemente.
+_cache = OrderedDict()
+
+# Renderizados en curso; las peticiones repetidas esperan el mismo.
+_pendientes = dict()
+
+cache = {"bytes": 0, "limite": 64 * 1024 ** 2}
+
+metricas = {"aciertos": 0, "fallos": 0, "unidas": 0, "errores": 0, "descartadas": 0}
+
+latencias = dict()
+
+# kaleido usa una sola pestaña, así que renderizamos en un solo hilo
+# y el ciclo de asyncio queda libre para los aciertos del cache.
+_ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="renderizador")
+
+
+def leer_parametros(grafica, consulta):
+    """
+    Esta función valida los parámetros de una petición y los regresa
+    con sus valores por defecto. Lanza ValueError si alguno no sirve.
+    """
+
+    parametros = {campo: valores[-1] for campo, valores in parse_qs(consulta).items()}
+
+    clave = parametros.get("consulta", list(CONSULTAS)[-1])
+    nivel = parametros.get("nivel", "entidad")
+    formato = parametros.get("formato", "png")
+    tamano = parametros.get("tamano", "original")
+
+    if clave not in CONSULTAS:
+        raise ValueError(f"La consulta {clave} no existe. Las consultas son: {', '.join(CONSULTAS)}")
+
+    if nivel not in NIVELES_MAPA:
+        raise ValueError(f"El nivel {nivel} no existe. Los niveles son: {', '.join(NIVELES_MAPA)}")
+
+    if formato not in TIPOS:
+        raise ValueError(f"El formato {formato} no existe. Los formatos son: {', '.join(TIPOS)}")
+
+    if tamano not in TAMANOS:
+        raise ValueError(f"El tamaño {tamano} no existe. Los tamaños son: {', '.join(TAMANOS)}")
+
+    if formato == "pdf" and grafica == "compuesta":
+        raise ValueError("El PDF solo se puede pedir para una gráfica sola.")
+
+    # El nivel solo cambia el mapa y los formatos vectoriales no
+    # tienen tamaño; así no guardamos la misma imagen dos veces.
+    if "mapa" not in GRAFICAS[grafica]:
+        nivel = "entidad"
+
+    if formato in FORMATOS_VECTORIALES:
+        tamano = "original"
+
+    return {"grafica": grafica, "consulta": clave, "nivel": nivel, "formato": formato, "tamano": tamano}
+
+
+def entradas(parametros):
+    """
+    Esta función regresa los archivos de los que depende una gráfica.
+    """
+
+    config = CONSULTAS[parametros["consulta"]]
+    archivos = [config["archivo"]]
+
+    if "mapa" in GRAFICAS[parametros["grafica"]]:
+        nivel = parametros["nivel"]
+        archivos.append(NIVELES_MAPA[nivel]["geometria"])
+
+        if nivel != "entidad":
+            if f"valores_{nivel}" not in config:
+                raise ValueError(f"La consulta {config['anio']} no tiene datos a nivel {nivel}.")
+
+            archivos.append(config[f"valores_{nivel}"])
+
+    return archivos
+
+
+def calcular_llave(parametros):
+    """
+    Esta función calcula la huella de una imagen a partir de sus
+    parámetros y de la fecha y el tamaño de sus archivos de entrada.
+
+    Solo consulta el sistema de archivos, así que es inmediata.
+    """
+
+    partes = [parametros[campo] for campo in ["grafica", "consulta", "nivel", "formato", "tamano"]]
+
+    for ruta in entradas(parametros):
+        estado = os.stat(ruta)
+        partes.append(f"{os.path.abspath(ruta)}:{estado.st_mtime_ns}:{estado.st_size}")
+
+    return huella(*partes)[:32]
+
+
+def renderizar_imagen(parametros):
+    """
+    Esta función construye las figuras de una gráfica y regresa la
+    imagen codificada. Se ejecuta en el hilo del renderizador.
+    """
+
+    config = dict(CONSULTAS[parametros["consulta"]], nivel=parametros["nivel"])
+    figuras = [CONSTRUCTORES[nombre](config) for nombre in GRAFICAS[parametros["grafica"]]]
+
+    salidas = generar_salidas(figuras, [parametros["formato"]], [parametros["tamano"]])
+
+    return salidas[(parametros["tamano"], parametros["formato"])]
+
+
+def buscar_en_cache(llave):
+    """
+    Esta función regresa una imagen del cache, o None si no está,
+    y la marca como la más usada recientemente.
+    """
+
+    if llave not in _cache:
+        return None
+
+    _cache.move_to_end(llave)
+
+    return _cache[llave]
+
+
+def guardar_en_cache(llave, contenido):
+    """
+    Esta función guarda una imagen en el cache y saca las menos
+    usadas hasta que el cache vuelve a caber en su límite.
+    """
+
+    # Una imagen más grande que todo el cache no se guarda.
+    if len(contenido) > cache["limite"]:
+        return
+
+    # Si la llave ya estaba, su imagen anterior deja de contar.
+    if llave in _cache:
+        cache["bytes"] -= len(_cache.pop(llave))
+
+    _cache[llave] = contenido
+    cache["bytes"] += len(contenido)
+
+    while cache["bytes"] > cache["limite"]:
+        _, descartada = _cache.popitem(last=False)
+        cache["bytes"] -= len(descartada)
+        metricas["descartadas"] += 1
+
+
+async def obtener_imagen(parametros, llave):
+    """
+    Esta función regresa la imagen pedida y de dónde salió: "acierto"
+    si ya estaba en el cache, "unida" si esperó un renderizado en
+    curso y "fallo" si hubo que renderizarla.
+    """
+
+    contenido = buscar_en_cache(llave)
+
+    if contenido is not None:
+        metricas["aciertos"] += 1
+        return contenido, "acierto"
+
+    if llave in _pendientes:
+        metricas["unidas"] += 1
+        return await asyncio.shield(_pendientes[llave]), "unida"
+
+    metricas["fallos"] += 1
+
+    ciclo = asyncio.get_running_loop()
+    pendiente = ciclo.create_future()
+    _pendientes[llave] = pendiente
+
+    try:
+        contenido = await ciclo.run_in_executor(_ejecutor, renderizar_imagen, parametros)
+    except Exception as error:
+        pendiente.set_exception(error)
+
+        # Marcamos la excepción como vista por si nadie más la esperaba.
+        pendiente.exception()
+        raise
+    else:
+        guardar_en_cache(llave, contenido)
+        pendiente.set_result(contenido)
+    finally:
+        del _pendientes[llave]
+
+    return contenido, "fallo"
+
+
+def reporte_metricas():
+    """
+    Esta función regresa las métricas del servicio: contadores del
+    cache y la latencia de cada ruta en milisegundos.
+    """
+
+    reporte = dict(metricas)
+    total = metricas["aciertos"] + metricas["fallos"] + metricas["unidas"]
+
+    reporte["proporcion_aciertos"] = (metricas["aciertos"] + metricas["unidas"]) / total if total else None
+    reporte["cache"] = {"imagenes": len(_cache), "bytes": cache["bytes"], "limite": cache["limite"]}
+    reporte["renderizando"] = len(_pendientes)
+    reporte["latencias_ms"] = dict()
+
+    for ruta, valores in latencias.items():
+        ordenados = sorted(valores)
+
+        reporte["latencias_ms"][ruta] = {
+            "peticiones": len(ordenados),
+            "mediana": statistics.median(ordenados) * 1000,
+            "p95": ordenados[round(0.95 * (len(ordenados) - 1))] * 1000,
+            "maxima": ordenados[-1] * 1000,
+        }
+
+    return reporte
+
+
+async def responder(escritor, estado, cuerpo=b"", tipo="text/plain; charset=utf-8", encabezados=None):
+    """
+    Esta función escribe una respuesta HTTP completa y cierra la conexión.
+    """
+
+    if isinstance(cuerpo, str):
+        cuerpo = cuerpo.encode("utf-8")
+
+    lineas = [
+        f"HTTP/1.1 {estado} {ESTADOS[estado]}",
+        f"Content-Type: {tipo}",
+        f"Content-Length: {len(cuerpo)}",
+        "Connection: close",
+    ]
+
+    lineas.extend(f"{nombre}: {valor}" for nombre, valor in (encabezados or dict()).items())
+
+    escritor.write(("\r\n".join(lineas) + "\r\n\r\n").encode("latin-1") + cuerpo)
+    await escritor.drain()
+
+
+async def atender(lector, escritor):
+    """
+    Esta función atiende una conexión: lee la petición, la resuelve
+    y anota cuánto tardó.
+    """
+
+    inicio = time.perf_counter()
+    ruta = None
+
+    try:
+        try:
+            linea = await asyncio.wait_for(lector.readline(), timeout=10)
+            metodo, objetivo, _ = linea.decode("latin-1").split(" ", 2)
+
+            encabezados = dict()
+
+            while (linea := await asyncio.wait_for(lector.readline(), timeout=10)) not in (b"\r\n", b"\n", b""):
+                nombre, _, valor = linea.decode("latin-1").partition(":")
+                encabezados[nombre.strip().lower()] = valor.strip()
+        except (ValueError, asyncio.TimeoutError):
+            await responder(escritor, 400, "Petición mal formada.")
+            return
+
+        partes = urlsplit(objetivo)
+        ruta = partes.path.strip("/")
+
+        if metodo != "GET":
+            await responder(escritor, 405, "Solo se aceptan peticiones GET.")
+        elif ruta == "metricas":
+            await responder(escritor, 200, json.dumps(reporte_metricas(), indent=4), "application/json")
+        elif ruta not in GRAFICAS:
+            await responder(escritor, 404, f"Las rutas son: {', '.join(GRAFICAS)} y metricas.")
+        else:
+            try:
+                parametros = leer_parametros(ruta, partes.query)
+                llave = calcular_llave(parametros)
+            except (ValueError, OSError) as error:
+                await responder(escritor, 400, str(error))
+                return
+
+            # Si el tablero ya tiene esta imagen no hace falta mandarla.
+            if encabezados.get("if-none-match") == f'"{llave}"':
+                metricas["aciertos"] += 1
+                await responder(escritor, 304, encabezados={"ETag": f'"{llave}"'})
+                return
+
+            try:
+                contenido, origen = await obtener_imagen(parametros, llave)
+            except Exception as error:
+                metricas["errores"] += 1
+                await responder(escritor, 500, f"No se pudo generar la gráfica: {type(error).__name__}: {error}")
+                return
+
+            await responder(
+                escritor, 200, contenido, TIPOS[parametros["formato"]],
+                {"ETag": f'"{llave}"', "Cache-Control": "no-cache", "X-Cache": origen}
+            )
+    except ConnectionError:
+        pass
+    finally:
+        if ruta in GRAFICAS:
+            latencias.setdefault(ruta, deque(maxlen=LATENCIAS_GUARDADAS)).append(time.perf_counter() - inicio)
+
+        escritor.close()
+
+
+def calentar():
+    """
+    Esta función inicia kaleido y construye una figura de cada tipo,
+    para que la primera petición no pague la carga de los datos, la
+    geometría, las plantillas y Chromium.
+    """
+
+    renderizador.iniciar()
+
+    config = CONSULTAS[list(CONSULTAS)[-1]]
+
+    for constructor in CONSTRUCTORES.values():
+        constructor(config)
+
+
+async def servir(host="127.0.0.1", puerto=8050, cache_mb=64, calentar_al_inicio=True):
+    """
+    Esta función inicia el servicio y atiende peticiones hasta que
+    se interrumpe.
+    """
+
+    cache["limite"] = int(cache_mb * 1024 ** 2)
+    ciclo = asyncio.get_running_loop()
+
+    if calentar_al_inicio:
+        await ciclo.run_in_executor(_ejecutor, calentar)
+
+    servidor = await asyncio.start_server(atender, host, puerto)
+
+    print(f"Sirviendo las gráficas en http://{host}:{puerto}/")
+
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        await ciclo.run_in_executor(_ejecutor, renderizador.detener)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Sirve las gráficas por HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8050)
+    parser.add_argument("--cache-mb", type=float, default=64, help="Tamaño máximo del cache de imágenes.")
+    parser.add_argument("--sin-calentar", action="store_true", help="No inicia kaleido hasta la primera petición.")
+    argumentos = parser.parse_args()
+
+    try:
+        asyncio.run(servir(argumentos.host, argumentos.puerto, argumentos.cache_mb, not argumentos.sin_calentar))
+    except KeyboardInterrupt:
+        pass
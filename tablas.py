@@ -0,0 +1,274 @@
+"""
+Este módulo dibuja tablas directamente con PIL.
+
+Una tabla de plotly (go.Table) solo tiene rectángulos y textos, pero
+kaleido la tiene que pasar por Chromium. Aquí leemos la figura que
+regresa build_table y dibujamos las celdas y los textos en una
+imagen, sin plotly.js ni Chromium.
+
+Cada glifo se rasteriza una sola vez por tamaño y grosor, y cada
+texto ya armado también se guarda en memoria. Así dibujar cientos de
+tablas (por ejemplo una por distrito) casi no cuesta más que la
+primera.
+"""
+
+import re
+from functools import lru_cache
+from io import BytesIO
+
+from PIL import Image, ImageColor, ImageDraw
+
+from rasterizador import cargar_fuente
+
+
+# Relleno de cada celda en pixeles, igual al de plotly.
+RELLENO_CELDA = 8
+
+# Cuántos textos armados guardamos en memoria.
+TEXTOS_EN_MEMORIA = 4096
+
+# Etiquetas HTML que plotly acepta dentro de los textos.
+_ETIQUETAS = re.compile(r"</?[a-zA-Z]+>")
+
+
+@lru_cache(maxsize=None)
+def obtener_glifo(caracter, tamano, negrita=False):
+    """
+    Esta función rasteriza un caracter y regresa su máscara, su
+    desplazamiento respecto al origen en la línea base y su avance.
+    """
+
+    fuente = cargar_fuente(tamano, negrita)
+    x0, y0, x1, y1 = fuente.getbbox(caracter, anchor="ls")
+
+    mascara = Image.new("L", (max(x1 - x0, 1), max(y1 - y0, 1)), 0)
+    ImageDraw.Draw(mascara).text((-x0, -y0), caracter, font=fuente, fill=255, anchor="ls")
+
+    return mascara, (x0, y0), fuente.getlength(caracter)
+
+
+@lru_cache(maxsize=TEXTOS_EN_MEMORIA)
+def obtener_texto(texto, tamano, negrita=False):
+    """
+    Esta función arma la máscara de un texto con los glifos guardados.
+
+    Regresa la máscara, la altura de la línea base dentro de ella y
+    el ancho del texto.
+    """
+
+    ascenso, descenso = cargar_fuente(tamano, negrita).getmetrics()
+    glifos = [obtener_glifo(caracter, tamano, negrita) for caracter in texto]
+    ancho = sum(avance for _, _, avance in glifos)
+
+    mascara = Image.new("L", (round(ancho) + 2, ascenso + descenso), 0)
+    x = 0.0
+
+    for glifo, (dx, dy), avance in glifos:
+        posicion = (round(x + dx), ascenso + dy)
+        mascara.paste(glifo, posicion, glifo)
+        x += avance
+
+    return mascara, ascenso, ancho
+
+
+def limpiar_texto(texto):
+    """
+    Esta función quita las etiquetas HTML de un texto y regresa el
+    texto limpio y si estaba en negritas.
+    """
+
+    texto = str(texto)
+
+    return _ETIQUETAS.sub("", texto), "<b>" in texto
+
+
+def formatear(valor, formato="", sufijo=""):
+    """
+    Esta función formatea el valor de una celda como lo hace plotly
+    con format y suffix.
+    """
+
+    if formato and not isinstance(valor, str):
+        return f"{valor:{formato}}{sufijo}"
+
+    return f"{valor}{sufijo}"
+
+
+def por_columna(valor, indice):
+    """
+    Esta función regresa el valor de una columna. En plotly las
+    listas más cortas que el número de columnas repiten su último
+    elemento.
+    """
+
+    if isinstance(valor, (list, tuple)):
+        return valor[min(indice, len(valor) - 1)] if valor else None
+
+    return valor
+
+
+def mezclar(color, fondo, opacidad):
+    """
+    Esta función mezcla un color con el fondo, para dibujar líneas
+    de menos de un pixel de grosor como lo hace el navegador.
+    """
+
+    color = ImageColor.getrgb(color)
+    fondo = ImageColor.getrgb(fondo)
+
+    return tuple(round(c * opacidad + f * (1 - opacidad)) for c, f in zip(color, fondo))
+
+
+def dibujar_texto(imagen, texto, caja, tamano, color, alineacion="center"):
+    """
+    Esta función dibuja un texto dentro de una celda, centrado en
+    vertical y alineado en horizontal como se indique.
+    """
+
+    texto, negrita = limpiar_texto(texto)
+
+    if not texto:
+        return
+
+    mascara, ascenso, ancho = obtener_texto(texto, tamano, negrita)
+    x0, y0, x1, y1 = caja
+
+    if alineacion == "left":
+        x = x0 + RELLENO_CELDA
+    elif alineacion == "right":
+        x = x1 - RELLENO_CELDA - ancho
+    else:
+        x = (x0 + x1 - ancho) / 2
+
+    # Centramos la altura de las mayúsculas, como se ve en plotly.
+    mayusculas = -cargar_fuente(tamano, negrita).getbbox("H", anchor="ls")[1]
+    linea_base = (y0 + y1 + mayusculas) / 2
+
+    izquierda = round(x)
+    arriba = round(linea_base) - ascenso
+
+    imagen.paste(
+        ImageColor.getrgb(color),
+        (izquierda, arriba, izquierda + mascara.width, arriba + mascara.height),
+        mascara
+    )
+
+
+def altura_renglon(textos, altura, tamano):
+    """
+    Esta función regresa la altura de un renglón.
+
+    Plotly solo mide los textos con etiquetas HTML; si alguno no
+    cabe, el renglón crece hasta la altura de la línea más el relleno.
+    """
+
+    for texto in textos:
+        if _ETIQUETAS.search(str(texto)):
+            ascenso, descenso = cargar_fuente(tamano, "<b>" in str(texto)).getmetrics()
+            return max(altura, ascenso + descenso + 2 * RELLENO_CELDA)
+
+    return altura
+
+
+def dibujar_renglon(imagen, dibujo, textos, columnas, y, altura, estilo, tamano, color_texto, linea):
+    """
+    Esta función dibuja un renglón de celdas: el relleno, el borde y
+    el texto de cada una.
+    """
+
+    for j, (texto, (x0, x1)) in enumerate(zip(textos, columnas)):
+        relleno = por_columna(estilo.get("fill", dict()).get("color"), j)
+        caja = (round(x0), round(y), round(x1), round(y + altura))
+
+        dibujo.rectangle(caja, fill=relleno)
+
+        if linea["width"] > 0:
+            dibujo.rectangle(caja, outline=mezclar(linea["color"], relleno, min(linea["width"], 1)))
+
+        dibujar_texto(
+            imagen, texto, caja, tamano,
+            por_columna(estilo.get("font", dict()).get("color"), j) or color_texto,
+            por_columna(estilo.get("align", "center"), j)
+        )
+
+
+def dibujar_tabla(fig):
+    """
+    Esta función dibuja con PIL una figura con trazos go.Table, como
+    la regresa build_table, y regresa una imagen de PIL.
+    """
+
+    if hasattr(fig, "to_dict"):
+        fig = fig.to_dict()
+
+    layout = fig["layout"]
+
+    ancho = layout.get("width", 700)
+    alto = layout.get("height", 450)
+    margen = {"l": 80, "r": 80, "t": 100, "b": 80, **layout.get("margin", dict())}
+    ancho_area = ancho - margen["l"] - margen["r"]
+    alto_area = alto - margen["t"] - margen["b"]
+
+    tamano = layout.get("font", dict()).get("size", 12)
+    color_texto = layout.get("font", dict()).get("color", "#444444")
+
+    # Los colores que no trae la figura salen de su plantilla.
+    predeterminado = layout.get("template", dict()).get("data", dict()).get("table", [dict()])[0]
+
+    imagen = Image.new("RGB", (ancho, alto), layout.get("paper_bgcolor", "#FFFFFF"))
+    dibujo = ImageDraw.Draw(imagen)
+
+    for trazo in fig["data"]:
+        dominio = trazo.get("domain", dict())
+        dx0, dx1 = dominio.get("x", [0, 1])
+        izquierda = margen["l"] + dx0 * ancho_area
+        derecha = margen["l"] + dx1 * ancho_area
+        y = margen["t"] + (1 - dominio.get("y", [0, 1])[1]) * alto_area
+
+        encabezado = {**predeterminado.get("header", dict()), **trazo.get("header", dict())}
+        celdas = {**predeterminado.get("cells", dict()), **trazo.get("cells", dict())}
+
+        # Formateamos cada columna con su format y su suffix.
+        valores = [
+            [
+                formatear(valor, por_columna(celdas.get("format", ""), j), por_columna(celdas.get("suffix", ""), j))
+                for valor in columna
+            ]
+            for j, columna in enumerate(celdas.get("values", list()))
+        ]
+
+        numero = max(len(encabezado.get("values", list())), len(valores))
+
+        # Repartimos el ancho del dominio en proporción a columnwidth.
+        pesos = [por_columna(trazo.get("columnwidth", [1]), j) for j in range(numero)]
+        bordes = [izquierda]
+
+        for peso in pesos:
+            bordes.append(bordes[-1] + peso / sum(pesos) * (derecha - izquierda))
+
+        columnas = list(zip(bordes[:-1], bordes[1:]))
+
+        for estilo, renglones in [(encabezado, [encabezado.get("values", list())]), (celdas, zip(*valores))]:
+            linea = {"color": "#FFFFFF", "width": 1, **estilo.get("line", dict())}
+
+            for renglon in renglones:
+                altura = altura_renglon(renglon, estilo.get("height", 28), tamano)
+
+                dibujar_renglon(
+                    imagen, dibujo, renglon, columnas, y, altura, estilo, tamano, color_texto, linea)
+
+                y += altura
+
+    return imagen
+
+
+def renderizar_tabla(fig, formato="png"):
+    """
+    Esta función dibuja la tabla con PIL y regresa la imagen
+    codificada en bytes, igual que renderizador.renderizar.
+    """
+
+    buffer = BytesIO()
+    dibujar_tabla(fig).save(buffer, formato.upper())
+
+    return buffer.getvalue()
@@ -0,0 +1,13 @@
+"""
+Configuración de las pruebas.
+
+Los módulos del proyecto viven en la raíz del repositorio, así que
+la agregamos al path para poder importarlos desde tests/.
+"""
+
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, RAIZ)
@@ -0,0 +1,75 @@
+"""
+Este script vuelve a generar las imágenes de referencia que usan
+tests/test_rasterizador.py y tests/test_tablas.py.
+
+- mapa: el mapa de 2021 dibujado con kaleido. Necesita Chromium y el
+  mapa base en ./cache (ver rasterizador.py).
+- tabla: la tabla de 2021 dibujada con PIL (ver tablas.py).
+
+Junto a cada imagen guarda la huella de la figura, para que la prueba
+sepa si la referencia corresponde a la figura actual, y la fuente con
+la que se dibujó el texto.
+
+Uso:
+
+    python tests/referencias/generar.py [mapa] [tabla]
+"""
+
+import json
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+sys.path.insert(0, RAIZ)
+
+import renderizador  # noqa: E402
+from construccion import huella_figura  # noqa: E402
+from consulta import CONSULTAS, build_map, build_table  # noqa: E402
+from rasterizador import cargar_fuente  # noqa: E402
+from tablas import renderizar_tabla  # noqa: E402
+
+
+CARPETA = os.path.join(RAIZ, "tests", "referencias")
+
+
+def generar_mapa():
+    """
+    Regresa la figura del mapa de 2021 y la imagen que dibuja kaleido.
+    """
+
+    fig = build_map(CONSULTAS["2021"])
+
+    with renderizador.sesion():
+        return fig, renderizador.renderizar({"mapa": fig})["mapa"]
+
+
+def generar_tabla():
+    """
+    Regresa la figura de la tabla de 2021 y la imagen que dibuja PIL.
+    """
+
+    fig = build_table(CONSULTAS["2021"])
+
+    return fig, renderizar_tabla(fig)
+
+
+GENERADORES = {"mapa": generar_mapa, "tabla": generar_tabla}
+
+
+if __name__ == "__main__":
+
+    # Las rutas de las consultas son relativas a la raíz.
+    os.chdir(RAIZ)
+
+    for nombre in sys.argv[1:] or list(GENERADORES):
+        fig, imagen = GENERADORES[nombre]()
+
+        with open(os.path.join(CARPETA, f"{nombre}-2021.png"), "wb") as archivo:
+            archivo.write(imagen)
+
+        with open(os.path.join(CARPETA, f"{nombre}-2021.json"), "w", encoding="utf-8") as archivo:
+            json.dump(
+                {"huella": huella_figura(fig), "fuente": cargar_fuente(12).getname()[0]}, archivo, indent=4)
+
+        print(f"Referencia de {nombre} guardada en {CARPETA}")
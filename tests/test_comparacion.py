@@ -0,0 +1,74 @@
+"""
+Pruebas de la matriz que alinea varias consultas.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import comparacion
+from comparacion import VARIABLES
+
+
+def consulta_falsa(claves, nombres, base):
+    """
+    Arma una consulta procesada con las entidades indicadas. Cada
+    variable vale base más la posición de la entidad en la lista.
+    """
+
+    entidades = pd.DataFrame({"clave": claves, "entidad": nombres})
+
+    for variable in VARIABLES:
+        entidades[variable] = [base + posicion for posicion in range(len(claves))]
+
+    return {"entidades": entidades, "nacional": {variable: base for variable in VARIABLES}}
+
+
+@pytest.fixture
+def consultas(monkeypatch):
+
+    # La segunda consulta trae las entidades en otro orden, le falta
+    # una y tiene una nueva con el nombre cambiado de otra.
+    falsas = {
+        "a.json": consulta_falsa(["01", "02", "03"], ["Uno", "Dos", "Tres"], 10),
+        "b.json": consulta_falsa(["03", "04", "01"], ["Tres bis", "Cuatro", "Uno"], 100),
+    }
+
+    monkeypatch.setattr(comparacion, "CONSULTAS", {"a": {"archivo": "a.json"}, "b": {"archivo": "b.json"}})
+    monkeypatch.setattr(comparacion, "cargar_consulta", lambda archivo: falsas[archivo])
+
+
+def test_alinea_por_clave(consultas):
+
+    matriz = comparacion.construir_matriz(["a", "b"])
+
+    assert matriz["consultas"] == ["a", "b"]
+    assert matriz["valores"].index.tolist() == ["01", "02", "03", "04"]
+    assert matriz["valores"].columns.tolist() == [(variable, clave) for variable in VARIABLES for clave in "ab"]
+
+    participacion = matriz["valores"]["participacion"]
+
+    assert participacion["a"].tolist()[:3] == [10, 11, 12]
+    assert participacion["b"].loc[["01", "03", "04"]].tolist() == [102, 100, 101]
+    assert np.isnan(participacion["a"]["04"]) and np.isnan(participacion["b"]["02"])
+
+    # El nombre sale de la consulta más reciente que tiene la entidad.
+    assert matriz["entidades"].tolist() == ["Uno", "Dos", "Tres bis", "Cuatro"]
+
+
+def test_orden_de_las_consultas(consultas):
+
+    matriz = comparacion.construir_matriz(["b", "a"])
+
+    assert matriz["valores"].columns.tolist()[:2] == [("participacion", "b"), ("participacion", "a")]
+    assert matriz["nacional"].index.tolist() == ["b", "a"]
+    assert matriz["nacional"]["total"].tolist() == [100, 10]
+
+    # Ahora la más reciente es "a", así que la entidad 03 conserva su nombre.
+    assert matriz["entidades"]["03"] == "Tres"
+
+
+def test_una_sola_consulta(consultas):
+
+    with pytest.raises(ValueError, match="al menos dos"):
+        comparacion.construir_matriz(["a"])
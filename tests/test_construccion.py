@@ -0,0 +1,100 @@
+"""
+Pruebas del manifiesto que decide qué gráficas se regeneran.
+"""
+
+import json
+import os
+import shutil
+
+import pytest
+
+import construccion
+import consulta
+import datos
+from configuracion import NIVELES_MAPA
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def generar(monkeypatch, tmp_path):
+    """
+    Regresa una función que genera la consulta de 2021 sin renderizar
+    y regresa las salidas que se volvieron a escribir.
+    """
+
+    monkeypatch.chdir(RAIZ)
+    monkeypatch.setattr(datos, "CARPETA_CACHE", str(tmp_path / "cache"))
+
+    archivo = tmp_path / "2021.json"
+    shutil.copy(os.path.join(RAIZ, "data", "2021.json"), archivo)
+
+    config = dict(
+        consulta.CONSULTAS["2021"], archivo=str(archivo),
+        salida_mapa=str(tmp_path / "mapa.png"), salida_barras=str(tmp_path / "barras.png"))
+
+    escritas = list()
+
+    def combinar(mapa, tabla, salida):
+        escritas.append("mapa")
+        open(salida, "wb").close()
+
+    def barras(config, fig):
+        escritas.append("barras")
+        return b""
+
+    monkeypatch.setattr(consulta, "create_map", lambda config, depurar, fig: None)
+    monkeypatch.setattr(consulta, "create_table", lambda config, depurar, fig: None)
+    monkeypatch.setattr(consulta, "combine_images", combinar)
+    monkeypatch.setattr(consulta, "create_bars", barras)
+
+    ruta_manifiesto = str(tmp_path / "cache" / "manifiesto.json")
+    guardar = construccion.guardar_manifiesto
+    monkeypatch.setattr(
+        construccion, "guardar_manifiesto", lambda manifiesto: guardar(manifiesto, ruta_manifiesto))
+
+    def generar_consulta(forzar=False):
+        escritas.clear()
+        manifiesto = construccion.cargar_manifiesto(ruta_manifiesto)
+        consulta.generar_consulta(config, manifiesto, forzar=forzar)
+        return sorted(escritas)
+
+    yield generar_consulta
+
+    datos.olvidar_consulta(str(archivo))
+
+
+def test_sin_cambios_se_omite(generar):
+
+    assert generar() == ["barras", "mapa"]
+    assert generar() == []
+
+
+def test_cambia_el_archivo_de_datos(generar, tmp_path):
+
+    generar()
+
+    # Mismos datos con otro formato: la figura es igual, pero el hash no.
+    archivo = tmp_path / "2021.json"
+    archivo.write_text(json.dumps(json.loads(archivo.read_text(encoding="utf-8")), indent=1), encoding="utf-8")
+
+    assert generar() == ["barras", "mapa"]
+
+
+def test_cambia_la_geometria(generar, monkeypatch):
+
+    generar()
+
+    monkeypatch.setitem(NIVELES_MAPA["entidad"], "simplificacion", "baja")
+
+    # Solo el mapa depende de la geometría.
+    assert generar() == ["mapa"]
+
+
+def test_forzar(generar):
+
+    generar()
+
+    assert generar(forzar=True) == ["barras", "mapa"]
+    assert generar(forzar=True) == ["barras", "mapa"]
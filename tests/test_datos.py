@@ -0,0 +1,73 @@
+"""
+Pruebas de la carga de consultas y de sus cachés.
+"""
+
+import json
+import os
+
+import pytest
+
+import datos
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def copiar_consulta(carpeta, nombre_nodo=None):
+    """
+    Copia la consulta de 2021 a otra carpeta, opcionalmente con otro
+    nombre en la primera entidad.
+    """
+
+    with open(os.path.join(RAIZ, "data", "2021.json"), "r", encoding="utf-8") as archivo:
+        data = json.load(archivo)
+
+    if nombre_nodo is not None:
+        data["entidadesHijas"][0]["nombreNodo"] = nombre_nodo
+
+    carpeta.mkdir()
+    ruta = carpeta / "2021.json"
+    ruta.write_text(json.dumps(data), encoding="utf-8")
+
+    return str(ruta)
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+
+    # La validación usa la geometría relativa a la raíz.
+    monkeypatch.chdir(RAIZ)
+    monkeypatch.setattr(datos, "CARPETA_CACHE", str(tmp_path / "cache"))
+
+    return tmp_path
+
+
+def test_sin_validar_no_se_reusa(cache):
+
+    ruta = copiar_consulta(cache / "invalida", "ATLANTIS")
+
+    try:
+        datos.cargar_consulta(ruta, validar=False)
+
+        with pytest.raises(ValueError, match="Atlantis"):
+            datos.cargar_consulta(ruta)
+    finally:
+        datos.olvidar_consulta(ruta)
+
+
+def test_mismo_nombre_en_otra_carpeta(cache):
+
+    primera = copiar_consulta(cache / "a")
+    segunda = copiar_consulta(cache / "b", "AGUASCALIENTES")
+
+    assert datos.nombre_cache(primera) != datos.nombre_cache(segunda)
+
+    try:
+        datos.cargar_consulta(primera)
+        datos.cargar_consulta(segunda)
+
+        assert sorted(os.listdir(cache / "cache")) == sorted(
+            [datos.nombre_cache(primera), datos.nombre_cache(segunda)])
+    finally:
+        datos.olvidar_consulta(primera)
+        datos.olvidar_consulta(segunda)
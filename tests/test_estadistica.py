@@ -0,0 +1,55 @@
+"""
+Pruebas del remuestreo bootstrap por grupos.
+"""
+
+import numpy as np
+
+import estadistica
+
+
+def test_grupos_desordenados():
+
+    # Dentro de cada grupo todos los renglones valen lo mismo, así que
+    # la suma no depende del sorteo mientras no se mezclen los grupos.
+    valores = np.array([[100, 1], [10, 2], [100, 1], [10, 2], [7, 5]])
+    grupos = np.array([2, 1, 2, 1, 3])
+
+    claves, sumas = estadistica.sumas_bootstrap(valores, grupos, remuestras=50, semilla=1)
+
+    assert claves.tolist() == [1, 2, 3]
+    assert sumas.shape == (50, 3, 2)
+    assert (sumas == [[20, 4], [200, 2], [7, 5]]).all()
+
+
+def test_sin_grupos():
+
+    claves, sumas = estadistica.sumas_bootstrap(np.array([0, 1]), remuestras=2000, semilla=7)
+
+    assert claves.tolist() == [0]
+    assert sumas.shape == (2000, 1, 1)
+
+    # Cada remuestra suma dos sorteos de {0, 1}.
+    assert set(np.unique(sumas)) == {0, 1, 2}
+    assert abs(sumas.mean() - 1) < 0.05
+
+
+def test_semilla_y_lotes(monkeypatch):
+
+    valores = np.arange(12).reshape(6, 2)
+    grupos = np.array([0, 0, 0, 1, 1, 1])
+
+    _, sumas = estadistica.sumas_bootstrap(valores, grupos, remuestras=30, semilla=3)
+    _, repetidas = estadistica.sumas_bootstrap(valores, grupos, remuestras=30, semilla=3)
+
+    assert np.array_equal(sumas, repetidas)
+
+    # Cada suma sale solo de los renglones de su grupo.
+    assert (sumas[:, 0] >= 3 * valores[0]).all() and (sumas[:, 0] <= 3 * valores[2]).all()
+    assert (sumas[:, 1] >= 3 * valores[3]).all() and (sumas[:, 1] <= 3 * valores[5]).all()
+
+    # Los lotes sacan los mismos números del generador en el mismo orden,
+    # así que su tamaño no cambia el resultado.
+    monkeypatch.setattr(estadistica, "ELEMENTOS_POR_LOTE", 1)
+    _, por_lotes = estadistica.sumas_bootstrap(valores, grupos, remuestras=30, semilla=3)
+
+    assert np.array_equal(por_lotes, sumas)
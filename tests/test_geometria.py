@@ -0,0 +1,53 @@
+"""
+Pruebas de la caché de topologías.
+"""
+
+import json
+import os
+import shutil
+
+import geometria
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_misma_geometria_con_otra_fecha(monkeypatch, tmp_path):
+
+    monkeypatch.setattr(geometria, "CARPETA_CACHE", str(tmp_path / "cache"))
+
+    ruta = tmp_path / "mexico.json"
+    shutil.copy(os.path.join(RAIZ, "mexico.json"), ruta)
+
+    geojson = geometria.cargar_geometria(str(ruta), "baja")
+
+    # El archivo se vuelve a copiar: cambia la fecha, no el contenido.
+    os.utime(ruta, ns=(0, 0))
+    geometria._memoria.clear()
+
+    def construir(*args, **kwargs):
+        raise AssertionError("No debía reconstruirse la topología.")
+
+    monkeypatch.setattr(geometria, "construir_topologia", construir)
+
+    assert geometria.cargar_geometria(str(ruta), "baja") == geojson
+
+    with open(geometria.ruta_topologia(str(ruta), "baja"), "r", encoding="utf-8") as archivo:
+        assert json.load(archivo)["fuente"]["mtime"] == 0
+
+    # La fecha quedó guardada, así que ya no se calcula el hash.
+    geometria._memoria.clear()
+    monkeypatch.setattr(geometria, "calcular_hash", construir)
+
+    assert geometria.cargar_geometria(str(ruta), "baja") == geojson
+
+
+def test_mismo_nombre_en_otra_carpeta(monkeypatch, tmp_path):
+
+    monkeypatch.setattr(geometria, "CARPETA_CACHE", str(tmp_path / "cache"))
+
+    primera = os.path.join(RAIZ, "mexico.json")
+    segunda = tmp_path / "mexico.json"
+    shutil.copy(primera, segunda)
+
+    assert geometria.ruta_topologia(primera, "baja") != geometria.ruta_topologia(str(segunda), "baja")
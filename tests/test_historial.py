@@ -0,0 +1,74 @@
+"""
+Pruebas de guardar y cargar el historial de cortes.
+"""
+
+import json
+import os
+
+import numpy as np
+
+import historial
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ARCHIVOS = [os.path.join(RAIZ, "data", "2021.json"), os.path.join(RAIZ, "data", "2022.json")]
+
+
+def guardar_cada_corte(ruta):
+    """
+    Guarda el historial después de cada corte, como hace prep.seguir.
+    """
+
+    cortes = historial.crear_historial()
+
+    for archivo in ARCHIVOS:
+        with open(archivo, "r", encoding="utf-8") as entrada:
+            historial.agregar_corte(cortes, json.load(entrada))
+
+        historial.guardar_historial(cortes, ruta)
+
+    return cortes
+
+
+def test_guardar_agrega_bloques(tmp_path):
+
+    ruta = tmp_path / "historial.npz"
+    guardar_cada_corte(ruta)
+
+    # El segundo guardado solo escribió el bloque del segundo corte.
+    assert os.listdir(tmp_path / "historial.npz.d") == ["bloque_000001.npz"]
+
+    guardado = historial.cargar_historial(ruta)
+    completo = historial.construir_historial(ARCHIVOS)
+
+    assert list(guardado["cortes"]) == list(completo["cortes"])
+    assert np.array_equal(guardado["momentos"], completo["momentos"])
+    assert np.array_equal(historial.estados(guardado), historial.estados(completo))
+    assert np.array_equal(guardado["ultimo"], completo["ultimo"])
+
+
+def test_bloque_incompleto(tmp_path):
+
+    ruta = tmp_path / "historial.npz"
+    cortes = guardar_cada_corte(ruta)
+
+    # Simulamos que el proceso murió mientras escribía el bloque,
+    # dejando también el temporal a medias.
+    bloque = tmp_path / "historial.npz.d" / "bloque_000001.npz"
+    contenido = bloque.read_bytes()
+    bloque.write_bytes(contenido[:len(contenido) // 2])
+    (tmp_path / "historial.npz.d" / "bloque_000001.npz.123.tmp.npz").write_bytes(contenido[:10])
+
+    guardado = historial.cargar_historial(ruta)
+
+    assert list(guardado["cortes"]) == list(cortes["cortes"][:1])
+    assert len(guardado["deltas"]) == 1
+
+    # Al volver a agregar el corte, el bloque dañado se reemplaza.
+    with open(ARCHIVOS[1], "r", encoding="utf-8") as entrada:
+        historial.agregar_corte(guardado, json.load(entrada))
+
+    historial.guardar_historial(guardado, ruta)
+
+    assert list(historial.cargar_historial(ruta)["cortes"]) == list(cortes["cortes"])
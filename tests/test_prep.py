@@ -0,0 +1,86 @@
+"""
+Pruebas de prep.seguir contra el servidor local que repite cortes.
+"""
+
+import os
+
+import historial
+import prep
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dos cortes reales, el de 2021 antes que el de 2022.
+ARCHIVOS = [os.path.join(RAIZ, "data", "2021.json"), os.path.join(RAIZ, "data", "2022.json")]
+
+
+def test_seguir_repeticion(tmp_path):
+
+    servidor = prep.crear_servidor_repeticion(ARCHIVOS, puerto=0, cada=1.0)
+    prep.iniciar_en_segundo_plano(servidor)
+
+    # Anotamos el código de cada respuesta para revisar los 304.
+    codigos = list()
+    sesion = prep.crear_sesion()
+    sesion.hooks["response"].append(lambda respuesta, *args, **kwargs: codigos.append(respuesta.status_code))
+
+    try:
+        cortes = prep.seguir(
+            f"http://127.0.0.1:{servidor.server_address[1]}/", "2022", intervalo=0.1,
+            carpeta=str(tmp_path), renderizar=False, maximo_cortes=2, sesion=sesion)
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+    assert cortes == [
+        "02 agosto 2021 21:30 20210802-2130_INE-CONSULTA-POPULAR-2021.zip",
+        "11 abril 2022 18:45 20220411_1845_REVOCACION_MANDATO_2022.zip",
+    ]
+
+    # Mientras el corte no cambia el servidor responde 304 y solo se
+    # descarga el JSON cuando aparece uno nuevo.
+    assert codigos[0] == 200
+    assert codigos[-1] == 200
+    assert codigos.count(200) == 2
+    assert 304 in codigos
+
+    guardado = historial.cargar_historial(tmp_path / "historial.npz")
+
+    assert list(guardado["cortes"]) == [corte.split()[-1] for corte in cortes]
+    assert len(guardado["deltas"]) == 2
+    with open(ARCHIVOS[1], "rb") as archivo:
+        assert (tmp_path / "actual.json").read_bytes() == archivo.read()
+
+
+def test_seguir_reinicio(tmp_path):
+
+    # Primero seguimos hasta el corte de 2021.
+    servidor = prep.crear_servidor_repeticion(ARCHIVOS[:1], puerto=0, cada=1.0)
+    prep.iniciar_en_segundo_plano(servidor)
+
+    try:
+        prep.seguir(
+            f"http://127.0.0.1:{servidor.server_address[1]}/", "2021", intervalo=0.1,
+            carpeta=str(tmp_path), renderizar=False, maximo_cortes=1)
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+    # Al reiniciar, el corte de 2021 ya está en el historial: no se
+    # vuelve a guardar ni a contar, y solo el de 2022 es nuevo.
+    servidor = prep.crear_servidor_repeticion(ARCHIVOS, puerto=0, cada=1.0)
+    prep.iniciar_en_segundo_plano(servidor)
+
+    try:
+        cortes = prep.seguir(
+            f"http://127.0.0.1:{servidor.server_address[1]}/", "2022", intervalo=0.1,
+            carpeta=str(tmp_path), renderizar=False, maximo_cortes=1)
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+    assert cortes == ["11 abril 2022 18:45 20220411_1845_REVOCACION_MANDATO_2022.zip"]
+
+    guardado = historial.cargar_historial(tmp_path / "historial.npz")
+
+    assert len(guardado["cortes"]) == 2
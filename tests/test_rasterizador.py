@@ -0,0 +1,82 @@
+"""
+Pruebas del mapa dibujado con PIL contra el que dibuja kaleido.
+"""
+
+import json
+import os
+
+import pytest
+
+import rasterizador
+from configuracion import MAPA_BASE
+from construccion import huella_figura
+from consulta import CONSULTAS, build_map
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# El mapa de 2021 que dibujó kaleido a partir de la figura de
+# build_map, con la huella de esa figura (ver referencias/generar.py).
+REFERENCIA = os.path.join(RAIZ, "tests", "referencias", "mapa-2021.png")
+HUELLA_REFERENCIA = os.path.join(RAIZ, "tests", "referencias", "mapa-2021.json")
+
+# Un pixel del marco que cae sobre Texas, fuera de México.
+VECINO = (900, 150)
+
+
+def test_paridad_kaleido(monkeypatch):
+
+    # La referencia se genera con Chromium, que no siempre está.
+    if not os.path.exists(REFERENCIA):
+        pytest.skip("No hay referencia de kaleido; se genera con python tests/referencias/generar.py.")
+
+    # Las rutas de las consultas son relativas a la raíz.
+    monkeypatch.chdir(RAIZ)
+
+    fig = build_map(CONSULTAS["2021"])
+
+    with open(HUELLA_REFERENCIA, "r", encoding="utf-8") as archivo:
+        huella = json.load(archivo)["huella"]
+
+    assert huella_figura(fig) == huella, (
+        "La referencia es de otra figura; vuelve a generarla con python tests/referencias/generar.py.")
+
+    # Kaleido dibuja con Quicksand y con el mapa base de plotly.
+    if "Quicksand" not in rasterizador.cargar_fuente(12).getname()[0]:
+        pytest.skip("Quicksand no está instalada; el texto no se puede comparar.")
+
+    if not os.path.exists(MAPA_BASE):
+        pytest.skip("Falta el mapa base; se descarga con python rasterizador.py.")
+
+    paridad = rasterizador.comparar_imagenes(rasterizador.dibujar_mapa(fig), REFERENCIA)
+
+    # Solo debe quedar el suavizado de los bordes y del texto, y el
+    # emoji de la firma, que PIL no dibuja.
+    assert paridad["diferencia_media"] < 2
+    assert paridad["pixeles_distintos"] < 0.03
+
+
+def test_tierra(monkeypatch, tmp_path):
+
+    # Un rectángulo de tierra sobre Estados Unidos, sin cuantizar.
+    ruta = tmp_path / "mapa_base.json"
+    ruta.write_text(json.dumps({
+        "type": "Topology",
+        "arcs": [[[-125, 25], [-80, 25], [-80, 40], [-125, 40], [-125, 25]]],
+        "objects": {"land": {"type": "GeometryCollection", "geometries": [{"type": "Polygon", "arcs": [[0]]}]}},
+    }))
+
+    tierra = rasterizador.cargar_tierra(str(ruta))
+
+    monkeypatch.chdir(RAIZ)
+    monkeypatch.setattr(rasterizador, "cargar_tierra", lambda: tierra)
+
+    fig = build_map(CONSULTAS["2021"])
+    imagen = rasterizador.dibujar_mapa(fig)
+
+    assert imagen.getpixel(VECINO) == (28, 10, 0)
+
+    # Con showland=False no se pinta la tierra.
+    fig["layout"]["geo"]["showland"] = False
+
+    assert rasterizador.dibujar_mapa(fig).getpixel(VECINO) == (8, 32, 50)
@@ -0,0 +1,104 @@
+"""
+Pruebas del cache LRU del servicio y de las peticiones unidas.
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+
+import pytest
+
+import servidor
+
+
+@pytest.fixture(autouse=True)
+def cache_vacio(monkeypatch):
+
+    monkeypatch.setattr(servidor, "_cache", OrderedDict())
+    monkeypatch.setattr(servidor, "_pendientes", dict())
+    monkeypatch.setattr(servidor, "cache", {"bytes": 0, "limite": 10})
+    monkeypatch.setattr(servidor, "metricas", dict.fromkeys(servidor.metricas, 0))
+
+
+def test_guardar_descarta_las_menos_usadas():
+
+    servidor.guardar_en_cache("a", b"1234")
+    servidor.guardar_en_cache("b", b"1234")
+
+    # Usar "a" la vuelve la más reciente, así que se descarta "b".
+    assert servidor.buscar_en_cache("a") == b"1234"
+    servidor.guardar_en_cache("c", b"123")
+
+    assert list(servidor._cache) == ["a", "c"]
+    assert servidor.cache["bytes"] == 7
+    assert servidor.metricas["descartadas"] == 1
+
+
+def test_guardar_reemplaza_y_omite_las_grandes():
+
+    servidor.guardar_en_cache("a", b"1234")
+    servidor.guardar_en_cache("a", b"12")
+
+    assert servidor.cache["bytes"] == 2
+
+    # Una imagen más grande que todo el cache no desplaza a las demás.
+    servidor.guardar_en_cache("b", b"12345678901")
+
+    assert list(servidor._cache) == ["a"]
+    assert servidor.cache["bytes"] == 2
+
+
+def test_peticiones_unidas(monkeypatch):
+
+    llamadas = list()
+    liberar = threading.Event()
+
+    def renderizar(parametros):
+        llamadas.append(parametros)
+        liberar.wait(5)
+        return b"imagen"
+
+    monkeypatch.setattr(servidor, "renderizar_imagen", renderizar)
+
+    async def pedir():
+        tareas = [asyncio.ensure_future(servidor.obtener_imagen({"id": 1}, "llave")) for _ in range(3)]
+
+        # Dejamos que las tres lleguen antes de terminar el renderizado.
+        await asyncio.sleep(0.05)
+        liberar.set()
+
+        unidas = await asyncio.gather(*tareas)
+
+        return unidas + [await servidor.obtener_imagen({"id": 1}, "llave")]
+
+    resultados = asyncio.run(pedir())
+
+    assert resultados == [
+        (b"imagen", "fallo"), (b"imagen", "unida"), (b"imagen", "unida"), (b"imagen", "acierto")]
+    assert llamadas == [{"id": 1}]
+    assert servidor._pendientes == dict()
+
+
+def test_error_llega_a_las_peticiones_unidas(monkeypatch):
+
+    liberar = threading.Event()
+
+    def renderizar(parametros):
+        liberar.wait(5)
+        raise RuntimeError("kaleido falló")
+
+    monkeypatch.setattr(servidor, "renderizar_imagen", renderizar)
+
+    async def pedir():
+        tareas = [asyncio.ensure_future(servidor.obtener_imagen({}, "llave")) for _ in range(2)]
+
+        await asyncio.sleep(0.05)
+        liberar.set()
+
+        return await asyncio.gather(*tareas, return_exceptions=True)
+
+    errores = asyncio.run(pedir())
+
+    assert [str(error) for error in errores] == ["kaleido falló", "kaleido falló"]
+    assert servidor._pendientes == dict()
+    assert servidor._cache == OrderedDict()
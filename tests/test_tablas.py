@@ -0,0 +1,45 @@
+"""
+Pruebas de la tabla dibujada con PIL contra su imagen de referencia.
+"""
+
+import json
+import os
+
+import pytest
+
+import rasterizador
+from construccion import huella_figura
+from consulta import CONSULTAS, build_table
+from tablas import dibujar_tabla
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# La tabla de 2021 que dibujó tablas.py, con la huella de la figura y
+# la fuente que se usó (ver referencias/generar.py).
+REFERENCIA = os.path.join(RAIZ, "tests", "referencias", "tabla-2021.png")
+DATOS_REFERENCIA = os.path.join(RAIZ, "tests", "referencias", "tabla-2021.json")
+
+
+def test_tabla_de_referencia(monkeypatch):
+
+    # Las rutas de las consultas son relativas a la raíz.
+    monkeypatch.chdir(RAIZ)
+
+    fig = build_table(CONSULTAS["2021"])
+
+    with open(DATOS_REFERENCIA, "r", encoding="utf-8") as archivo:
+        referencia = json.load(archivo)
+
+    assert huella_figura(fig) == referencia["huella"], (
+        "La referencia es de otra figura; vuelve a generarla con python tests/referencias/generar.py tabla.")
+
+    if rasterizador.cargar_fuente(12).getname()[0] != referencia["fuente"]:
+        pytest.skip(f"La referencia se dibujó con {referencia['fuente']}, que no está instalada.")
+
+    paridad = rasterizador.comparar_imagenes(dibujar_tabla(fig), REFERENCIA)
+
+    # Otra versión de FreeType puede mover un poco el suavizado, pero
+    # un solo carácter distinto ya cambia unos 70 pixeles (1e-4).
+    assert paridad["diferencia_media"] < 0.05
+    assert paridad["pixeles_distintos"] < 2e-5
@@ -0,0 +1,98 @@
+"""
+Pruebas de la revisión del JSON del PREP.
+"""
+
+import copy
+import json
+import os
+
+import pytest
+
+import validacion
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GEOMETRIA = os.path.join(RAIZ, "mexico.json")
+
+
+def cargar(anio):
+    """
+    Regresa el JSON de una consulta del repositorio.
+    """
+
+    with open(os.path.join(RAIZ, "data", f"{anio}.json"), "r", encoding="utf-8") as archivo:
+        return json.load(archivo)
+
+
+@pytest.mark.parametrize("anio", ["2021", "2022"])
+def test_consulta_valida(anio):
+
+    data = cargar(anio)
+
+    assert validacion.revisar_consulta(data) == []
+    validacion.validar_consulta(data, anio, GEOMETRIA)
+
+
+def test_campo_faltante():
+
+    data = cargar("2021")
+    del data["entidadesHijas"][0]["totalVotos"]
+
+    assert "Falta entidadesHijas[0].totalVotos." in validacion.revisar_consulta(data)
+
+
+def test_tipo_incorrecto():
+
+    data = cargar("2021")
+    data["entidadesHijas"][3]["listaNominal"] = "123"
+
+    assert validacion.revisar_consulta(data) == [
+        "entidadesHijas[3].listaNominal debería ser entero y es str."
+    ]
+
+
+def test_id_partido_desconocido():
+
+    data = cargar("2022")
+    data["votacionPartidosConDistribucion"][0]["idPartido"] = 999
+
+    problemas = validacion.revisar_consulta(data)
+
+    assert "nacional tiene una respuesta desconocida: idPartido 999." in problemas
+
+
+def test_nombre_fuera_del_geojson():
+
+    data = cargar("2021")
+    data["entidadesHijas"][0]["nombreNodo"] = "ATLANTIS"
+
+    with pytest.raises(ValueError, match="La entidad 01 se llama Atlantis en el JSON"):
+        validacion.validar_consulta(data, "2021", GEOMETRIA)
+
+
+def test_geometria_en_memoria(tmp_path):
+
+    # Un GeoJSON con una sola entidad: la primera revisión lo lee y la
+    # segunda lo toma de memoria hasta que cambia el archivo.
+    with open(GEOMETRIA, "r", encoding="utf-8") as archivo:
+        geojson = json.load(archivo)
+
+    ruta = tmp_path / "mexico.json"
+    ruta.write_text(json.dumps(geojson), encoding="utf-8")
+
+    data = cargar("2021")
+
+    assert validacion.revisar_geometria(data, str(ruta)) == []
+    assert validacion.revisar_geometria(data, str(ruta)) == []
+
+    recortado = copy.deepcopy(geojson)
+    recortado["features"] = [
+        item for item in recortado["features"] if item["properties"]["CVE_ENT"] != "01"
+    ]
+    ruta.write_text(json.dumps(recortado), encoding="utf-8")
+    os.utime(ruta, ns=(0, 0))
+
+    assert validacion.revisar_geometria(data, str(ruta)) == [
+        f"{ruta} no tiene la entidad 01 (Aguascalientes)."
+    ]
@@ -0,0 +1,318 @@
+"""
+Este módulo revisa el JSON del PREP antes de procesarlo.
+
+Las gráficas suponen varias cosas del JSON: que entidadesHijas trae
+las 32 entidades más el nodo de representación proporcional (idNodo
+0), que cada respuesta se reconoce por su idPartido, que los votos de
+cada nodo suman su totalVotos y que los nombres de las entidades
+coinciden con los del GeoJSON. Si el INE cambia el formato, aquí lo
+detectamos al cargar la consulta, antes de generar cualquier gráfica,
+y reportamos todos los problemas juntos.
+
+El esquema se compila una sola vez al importar el módulo: cada campo
+se convierte en una función que revisa su tipo, así que revisar un
+JSON no vuelve a recorrer la descripción del esquema y toma alrededor
+de un milisegundo. Los nombres de las entidades del GeoJSON se leen
+una sola vez por proceso mientras el archivo no cambie. Solo usa la
+biblioteca estándar, así que cli.py validate no necesita pandas.
+"""
+
+import json
+import os
+from functools import lru_cache
+
+
+# Si agregamos o cambiamos alguna revisión, subimos este número y
+# las consultas ya procesadas se vuelven a revisar (ver datos.py).
+VERSION_VALIDACION = 1
+
+NUMERO = (int, float)
+
+NOMBRES_TIPOS = {int: "entero", float: "número", str: "texto", list: "lista"}
+
+# Respuesta que representa cada idPartido. 2021: SÍ (11) y NO (12).
+# 2022: que se le revoque el mandato (110) y que siga (111).
+RESPUESTAS = {11: "si", 110: "si", 12: "no", 111: "no", 91: "nulo"}
+
+NUMERO_ENTIDADES = 32
+
+# Nodo de representación proporcional, que viene al final de entidadesHijas.
+NODO_RP = 0
+
+ESQUEMA_RESPUESTA = {
+    "idPartido": int,
+    "nombrePartido": str,
+    "siglasPartido": str,
+    "total": int,
+    "porcentaje": NUMERO,
+}
+
+# Los campos de cada nodo que usa columnar.normalizar_nodo.
+ESQUEMA_NODO = {
+    "idNodo": int,
+    "nivelNodo": str,
+    "nombreNodo": str,
+    "idNodoPadre": int,
+    "idMapa": str,
+    "totalActas": int,
+    "totalActasUrbanas": int,
+    "totalActasRurales": int,
+    "actasContabilizadas": {"total": int, "porcentaje": NUMERO},
+    "actasCapturadas": {"total": int},
+    "actasCotejo": int,
+    "actasRecuento": int,
+    "actasCasillaNoInstalada": int,
+    "actasPaqueteNoEntregado": int,
+    "actasPendiente": int,
+    "listaNominal": int,
+    "porcentajeParticipacionCiudadana": NUMERO,
+    "totalVotos": int,
+    "votacionPartidosConDistribucion": [ESQUEMA_RESPUESTA],
+}
+
+ESQUEMA_CORTE = {
+    "fechaCorte": str,
+    "horaCorte": str,
+    "archivoCorte": str,
+    "entidadesHijas": list,
+}
+
+
+def compilar(esquema):
+    """
+    Esta función convierte un esquema en una función
+    revisar(valor, ruta, problemas) que agrega a problemas un texto por
+    cada campo que falte o que tenga otro tipo.
+
+    Un diccionario describe un objeto, una lista de un elemento describe
+    una lista de ese esquema y un tipo (o una tupla de tipos) describe
+    un valor.
+    """
+
+    if isinstance(esquema, dict):
+        campos = [(campo, compilar(subesquema)) for campo, subesquema in esquema.items()]
+
+        def revisar(valor, ruta, problemas):
+            if not isinstance(valor, dict):
+                problemas.append(f"{ruta} debería ser un objeto y es {type(valor).__name__}.")
+                return
+
+            for campo, revisar_campo in campos:
+                if campo in valor:
+                    revisar_campo(valor[campo], f"{ruta}.{campo}", problemas)
+                else:
+                    problemas.append(f"Falta {ruta}.{campo}.")
+
+        return revisar
+
+    if isinstance(esquema, list):
+        revisar_elemento = compilar(esquema[0])
+
+        def revisar(valor, ruta, problemas):
+            if not isinstance(valor, list):
+                problemas.append(f"{ruta} debería ser una lista y es {type(valor).__name__}.")
+                return
+
+            for indice, elemento in enumerate(valor):
+                revisar_elemento(elemento, f"{ruta}[{indice}]", problemas)
+
+        return revisar
+
+    tipos = esquema if isinstance(esquema, tuple) else (esquema,)
+    nombre = " o ".join(NOMBRES_TIPOS.get(tipo, tipo.__name__) for tipo in tipos)
+
+    def revisar(valor, ruta, problemas):
+        # bool es subclase de int, pero un true no es un conteo.
+        if isinstance(valor, bool) or not isinstance(valor, tipos):
+            problemas.append(f"{ruta} debería ser {nombre} y es {type(valor).__name__}.")
+
+    return revisar
+
+
+revisar_nodo = compilar(ESQUEMA_NODO)
+revisar_corte = compilar(ESQUEMA_CORTE)
+revisar_respuestas = compilar([ESQUEMA_RESPUESTA])
+
+
+def revisar_votacion(votacion, total, ruta, problemas):
+    """
+    Esta función revisa que la votación de un nodo tenga exactamente
+    una respuesta de cada tipo y que sus votos sumen total.
+    """
+
+    encontradas = [RESPUESTAS.get(respuesta["idPartido"]) for respuesta in votacion]
+
+    for respuesta, encontrada in zip(votacion, encontradas):
+        if encontrada is None:
+            problemas.append(f"{ruta} tiene una respuesta desconocida: idPartido {respuesta['idPartido']}.")
+
+    for nombre in ["si", "no", "nulo"]:
+        if encontradas.count(nombre) != 1:
+            problemas.append(f"{ruta} tiene {encontradas.count(nombre)} respuestas {nombre}, se esperaba 1.")
+
+    suma = sum(respuesta["total"] for respuesta in votacion)
+
+    if total is not None and suma != total:
+        problemas.append(f"{ruta}: los votos suman {suma:,} pero totalVotos es {total:,}.")
+
+
+def revisar_consulta(data):
+    """
+    Esta función regresa una lista con todos los problemas del JSON de
+    una consulta. Si la lista está vacía, el JSON se puede procesar.
+
+    Primero revisa el esquema de cada nodo. Las revisiones de los
+    votos solo se hacen en los nodos con el esquema correcto, para no
+    reportar el mismo problema dos veces.
+    """
+
+    problemas = list()
+
+    if not isinstance(data, dict):
+        return [f"El JSON debería ser un objeto y es {type(data).__name__}."]
+
+    revisar_corte(data, "corte", problemas)
+
+    nodos = [("nacional", data)]
+    nodos.extend(
+        (f"entidadesHijas[{indice}]", entidad)
+        for indice, entidad in enumerate(data.get("entidadesHijas") or list())
+    )
+
+    correctos = list()
+    nacional_correcto = False
+
+    for ruta, nodo in nodos:
+        encontrados = list()
+        revisar_nodo(nodo, ruta, encontrados)
+
+        if encontrados:
+            problemas.extend(encontrados)
+            continue
+
+        revisar_votacion(nodo["votacionPartidosConDistribucion"], nodo["totalVotos"], ruta, problemas)
+
+        if nodo is data:
+            nacional_correcto = True
+        else:
+            correctos.append(nodo)
+
+    if nacional_correcto and data["nivelNodo"] != "NACIONAL":
+        problemas.append(f"El nodo principal debería ser NACIONAL y es {data['nivelNodo']}.")
+
+    # Las entidades son los nodos estatales 1 a 32; el único otro nodo
+    # permitido es el de representación proporcional. Aquí contamos
+    # también los nodos con problemas de esquema si traen su idNodo.
+    hijas = [
+        nodo for _, nodo in nodos[1:]
+        if isinstance(nodo, dict) and isinstance(nodo.get("idNodo"), int)
+    ]
+    identificadores = [nodo["idNodo"] for nodo in hijas if nodo["idNodo"] != NODO_RP]
+
+    for nodo in hijas:
+        if nodo["idNodo"] != NODO_RP and not 1 <= nodo["idNodo"] <= NUMERO_ENTIDADES:
+            problemas.append(f"Nodo inesperado en entidadesHijas: {nodo['idNodo']} ({nodo.get('nombreNodo')}).")
+        elif nodo["idNodo"] != NODO_RP and nodo.get("nivelNodo") != "ESTATAL":
+            problemas.append(f"{nodo.get('nombreNodo')} debería ser ESTATAL y es {nodo.get('nivelNodo')}.")
+
+    faltantes = sorted(set(range(1, NUMERO_ENTIDADES + 1)) - set(identificadores))
+    repetidas = sorted({identificador for identificador in identificadores if identificadores.count(identificador) > 1})
+
+    if faltantes:
+        problemas.append(f"Faltan las entidades {', '.join(map(str, faltantes))}.")
+
+    if repetidas:
+        problemas.append(f"Las entidades {', '.join(map(str, repetidas))} vienen más de una vez.")
+
+    # Los votos en el extranjero (2022) no son parte de ninguna entidad.
+    extranjero = data.get("votosEnElExtranjero") or list()
+    encontrados = list()
+    revisar_respuestas(extranjero, "votosEnElExtranjero", encontrados)
+    problemas.extend(encontrados)
+
+    if extranjero and not encontrados:
+        revisar_votacion(extranjero, None, "votosEnElExtranjero", problemas)
+
+    if nacional_correcto and len(correctos) == len(nodos) - 1 and not encontrados:
+        suma = sum(nodo["totalVotos"] for nodo in correctos) + sum(respuesta["total"] for respuesta in extranjero)
+
+        if suma != data["totalVotos"]:
+            problemas.append(
+                f"Los votos de las entidades y del extranjero suman {suma:,} "
+                f"pero el totalVotos nacional es {data['totalVotos']:,}."
+            )
+
+    return problemas
+
+
+def limpiar_nombre(nombre):
+    """
+    Esta función limpia el nombre de una entidad como lo hace
+    datos.limpiar_nombres, para compararlo con el GeoJSON sin pandas.
+    """
+
+    nombre = nombre.title().replace("De", "de")
+
+    return "Estado de México" if nombre == "México" else nombre
+
+
+@lru_cache(maxsize=8)
+def leer_nombres(ruta, mtime, propiedad, propiedad_nombre):
+    """
+    Esta función regresa un diccionario de clave -> nombre con las
+    entidades del GeoJSON.
+
+    Se guarda en memoria por ruta y fecha de modificación, así que el
+    GeoJSON solo se vuelve a leer si cambia.
+    """
+
+    with open(ruta, "r", encoding="utf-8") as archivo:
+        geojson = json.load(archivo)
+
+    return {
+        item["properties"].get(propiedad): item["properties"].get(propiedad_nombre)
+        for item in geojson["features"]
+    }
+
+
+def revisar_geometria(data, ruta, propiedad="CVE_ENT", propiedad_nombre="NOM_ENT"):
+    """
+    Esta función revisa que cada entidad del JSON tenga su polígono en
+    el GeoJSON (por su clave) y que los nombres ya limpios coincidan.
+    """
+
+    ruta_absoluta = os.path.abspath(ruta)
+    nombres = leer_nombres(ruta_absoluta, os.stat(ruta_absoluta).st_mtime_ns, propiedad, propiedad_nombre)
+
+    problemas = list()
+
+    for entidad in data.get("entidadesHijas") or list():
+        if not isinstance(entidad, dict) or not 1 <= entidad.get("idNodo", NODO_RP) <= NUMERO_ENTIDADES:
+            continue
+
+        clave = f"{entidad['idNodo']:02d}"
+        nombre = limpiar_nombre(str(entidad.get("nombreNodo")))
+
+        if clave not in nombres:
+            problemas.append(f"{ruta} no tiene la entidad {clave} ({nombre}).")
+        elif nombres[clave] != nombre:
+            problemas.append(f"La entidad {clave} se llama {nombre} en el JSON y {nombres[clave]} en {ruta}.")
+
+    return problemas
+
+
+def validar_consulta(data, nombre, ruta_geometria=None):
+    """
+    Esta función lanza un ValueError con todos los problemas del JSON
+    de una consulta (y de su geometría, si se indica), o no hace nada
+    si no hay ninguno.
+    """
+
+    problemas = revisar_consulta(data)
+
+    if ruta_geometria and not problemas:
+        problemas.extend(revisar_geometria(data, ruta_geometria))
+
+    if problemas:
+        detalle = "\n".join(f"  {problema}" for problema in problemas)
+        raise ValueError(f"{nombre} tiene {len(problemas)} problemas:\n{detalle}")